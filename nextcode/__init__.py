@@ -9,6 +9,8 @@ import os
 import logging
 import importlib.metadata
 
+__version__ = importlib.metadata.version("nextcode-sdk")
+
 from .config import Config
 # we want these available from the top-level package
 from .client import Client, get_service
@@ -19,11 +21,14 @@ log = logging.getLogger()
 cfg = Config()
 
 
-__version__ = importlib.metadata.version("nextcode-sdk")
+def __getattr__(name):
+    # the jupyter extension pulls in pandas and IPython so it is only imported on first
+    # access, e.g. when jupyterhub runs `%load_ext nextcode`
+    if name in ("jupyter", "load_ipython_extension"):
+        from .services.query import jupyter
 
-# loading this here allows easy extension setup in jupyterhub
-from .services.query.jupyter import load_ipython_extension
-from .services.query import jupyter
+        return jupyter if name == "jupyter" else jupyter.load_ipython_extension
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 def bla():
@@ -0,0 +1,292 @@
+"""
+aio
+~~~~~~~~~~
+Thread pool adapter which lets the SDK services be used from asyncio code.
+
+This is not an asynchronous HTTP client. The services are wrapped so that every
+call returns an awaitable which runs the blocking `requests` call on a bounded
+pool of worker threads, keeping the event loop free while requests are in
+flight. Concurrency is therefore limited by the number of worker threads rather
+than by open sockets. The wrapped services keep using the same
+:class:`~nextcode.session.ServiceSession` underneath so endpoint discovery,
+token handling and error checking behave exactly as in the synchronous API.
+
+.. code-block:: python
+
+   import asyncio
+   from nextcode import Client
+
+   async def main():
+       async with Client(api_key="xxx").async_service("query") as svc:
+           queries = await asyncio.gather(
+               *(svc.execute(f"gor #dbsnp# | top {i}") for i in range(100))
+           )
+           async for batch in queries[0].iter_batches():
+               print(len(batch))
+
+   asyncio.run(main())
+"""
+
+import asyncio
+import functools
+import inspect
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+from .session import ServiceSession, create_adapter
+
+log = logging.getLogger(__name__)
+
+DEFAULT_CONCURRENCY = 32
+
+_EXHAUSTED = object()
+
+
+def _resize_pool(session: ServiceSession, size: int) -> None:
+    """
+    Make sure the connection pools of a session can hold `size` connections so
+    that concurrent requests reuse connections instead of discarding them.
+
+    The pool shared by the services of a client is grown in place so they keep
+    sharing it, other sessions get a new pool sized up front.
+    """
+    if session.transport is not None:
+        session.transport.ensure_pool_size(size)
+        return
+    adapter = create_adapter(pool_maxsize=size)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+
+
+class ThreadPoolSession:
+    """
+    Runs the blocking requests of a :class:`~nextcode.session.ServiceSession` on
+    a thread pool and exposes them as coroutines.
+
+    Requests are run on a pool of `max_concurrency` worker threads, any further
+    calls wait on the event loop until a worker is free.
+
+    :param session: The service session to send the requests with
+    :param max_concurrency: Maximum number of requests in flight at a time
+    """
+
+    def __init__(
+        self, session: ServiceSession, max_concurrency: int = DEFAULT_CONCURRENCY
+    ):
+        self.session = session
+        self.max_concurrency = max_concurrency
+        self.executor = ThreadPoolExecutor(
+            max_workers=max_concurrency, thread_name_prefix="nextcode-aio"
+        )
+        self._init_lock: Optional[asyncio.Lock] = None
+        _resize_pool(session, max_concurrency)
+
+    def __repr__(self):
+        return f"<ThreadPoolSession {self.session.url_base}>"
+
+    async def initialize(self) -> None:
+        """
+        Fetch the access token and service endpoints if needed.
+
+        Concurrent callers share a single initialization instead of each
+        worker thread requesting its own token.
+        """
+        if self.session.initialized:
+            return
+        if self._init_lock is None:
+            self._init_lock = asyncio.Lock()
+        async with self._init_lock:
+            if not self.session.initialized:
+                await self._run(self.session._initialize)
+
+    async def run(self, func: Callable, *args, **kwargs) -> Any:
+        """
+        Run a blocking callable on the worker pool once the session is initialized.
+        """
+        await self.initialize()
+        return await self._run(func, *args, **kwargs)
+
+    async def _run(self, func: Callable, *args, **kwargs) -> Any:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self.executor, functools.partial(func, *args, **kwargs)
+        )
+
+    async def get(self, *args, **kw):
+        return await self.run(self.session.get, *args, **kw)
+
+    async def put(self, *args, **kw):
+        return await self.run(self.session.put, *args, **kw)
+
+    async def post(self, *args, **kw):
+        return await self.run(self.session.post, *args, **kw)
+
+    async def delete(self, *args, **kw):
+        return await self.run(self.session.delete, *args, **kw)
+
+    async def url_from_endpoint(self, endpoint: str) -> str:
+        await self.initialize()
+        return self.session.url_from_endpoint(endpoint)
+
+    async def endpoints(self) -> Dict:
+        await self.initialize()
+        return self.session.endpoints
+
+    async def root_info(self) -> Dict:
+        await self.initialize()
+        return self.session.root_info
+
+    def close(self) -> None:
+        """
+        Shut down the worker pool
+        """
+        self.executor.shutdown(wait=False)
+
+
+class AsyncProxy:
+    """
+    Wraps an SDK object so that its methods return awaitables.
+
+    Objects returned from the methods, such as queries, phenotypes or jobs, are
+    wrapped as well and generators become async iterators.
+
+    Attributes which are set on the wrapped object are read directly. Properties, and
+    attributes the wrapped object has to fetch from the server, may send requests, so
+    they are returned as awaitables which are evaluated on the worker pool, e.g.
+    `await query.running`.
+    """
+
+    def __init__(self, obj: Any, session: ThreadPoolSession):
+        self._obj = obj
+        self._aio = session
+
+    def __repr__(self):
+        return f"<Async {self._obj!r}>"
+
+    def __getattr__(self, name):
+        try:
+            static = inspect.getattr_static(self._obj, name)
+        except AttributeError:
+            if name.startswith("_"):
+                raise
+            # the wrapped object might refresh itself to find the attribute
+            return AsyncAttribute(self, name)
+        if inspect.isdatadescriptor(static) and not inspect.ismemberdescriptor(static):
+            # properties run code, which might send requests
+            return AsyncAttribute(self, name)
+        attr = getattr(self._obj, name)
+        if not callable(attr) or inspect.isclass(attr):
+            return attr
+
+        if inspect.isgeneratorfunction(attr):
+            # creating the generator does not run any code so it is safe to do inline
+            @functools.wraps(attr)
+            def iterate(*args, **kwargs):
+                return AsyncIterator(attr(*args, **kwargs), self._aio)
+
+            return iterate
+
+        @functools.wraps(attr)
+        async def inner(*args, **kwargs):
+            ret = await self._aio.run(attr, *args, **kwargs)
+            return self._wrap(ret)
+
+        return inner
+
+    @property
+    def wrapped(self) -> Any:
+        """
+        The synchronous object
+        """
+        return self._obj
+
+    def _wrap(self, value: Any) -> Any:
+        if inspect.isgenerator(value):
+            return AsyncIterator(value, self._aio)
+        if isinstance(value, list):
+            return [self._wrap(v) for v in value]
+        if _is_sdk_object(value):
+            return AsyncProxy(value, self._aio)
+        return value
+
+
+class AsyncAttribute:
+    """
+    Awaitable value of an attribute of a wrapped object, read on the worker pool
+    """
+
+    def __init__(self, proxy: AsyncProxy, name: str):
+        self._proxy = proxy
+        self._name = name
+
+    def __repr__(self):
+        return f"<AsyncAttribute {self._name} of {self._proxy!r}>"
+
+    def __await__(self):
+        return self._get().__await__()
+
+    async def _get(self) -> Any:
+        proxy = self._proxy
+        value = await proxy._aio.run(getattr, proxy._obj, self._name)
+        return proxy._wrap(value)
+
+
+class AsyncIterator:
+    """
+    Async iterator over a blocking generator, e.g. from `Query.iter_batches`
+    """
+
+    def __init__(self, generator, session: ThreadPoolSession):
+        self._generator = generator
+        self._aio = session
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        ret = await self._aio.run(next, self._generator, _EXHAUSTED)
+        if ret is _EXHAUSTED:
+            raise StopAsyncIteration
+        return ret
+
+    async def aclose(self) -> None:
+        await self._aio.run(self._generator.close)
+
+
+class ThreadPoolService(AsyncProxy):
+    """
+    Asyncio variant of a service, backed by a thread pool.
+
+    Every method of the wrapped service is available as a coroutine function
+    which runs the blocking call on a worker thread.
+
+    :param service: The service to wrap
+    :param max_concurrency: Maximum number of requests in flight at a time
+    """
+
+    def __init__(self, service, max_concurrency: int = DEFAULT_CONCURRENCY):
+        super(ThreadPoolService, self).__init__(
+            service, ThreadPoolSession(service.session, max_concurrency)
+        )
+
+    @property
+    def session(self) -> ThreadPoolSession:
+        return self._aio
+
+    def close(self) -> None:
+        self._aio.close()
+
+    async def __aenter__(self):
+        await self._aio.initialize()
+        return self
+
+    async def __aexit__(self, *args):
+        self.close()
+
+
+def _is_sdk_object(value: Any) -> bool:
+    module = getattr(type(value), "__module__", "") or ""
+    return module.startswith("nextcode.services.") and not isinstance(
+        value, BaseException
+    )
@@ -6,7 +6,8 @@ This is the client used by the Service class to communicate with the API.
 """
 
 import os
-import pkgutil
+import importlib.metadata
+import threading
 from importlib import import_module
 from pathlib import Path
 import logging
@@ -18,12 +19,29 @@ import json
 
 from .exceptions import ServiceNotFound, InvalidProfile, InvalidToken
 from .config import Config, save_config
-from .utils import root_url_from_api_key, get_access_token, decode_token, host_from_url
+from .session import Transport
+from .utils import root_url_from_api_key, decode_token, host_from_url
 
 SERVICES_PATH = Path(__file__).parent.joinpath("services")
 SERVICES = ["query", "queryserver"]
 DEFAULT_CLIENT_ID = "api-key-client"
 
+# built-in services and the modules implementing them
+SERVICE_MODULES = {
+    "phenoteke": "nextcode.services.phenoteke",
+    "phenotype": "nextcode.services.phenotype",
+    "pipelines": "nextcode.services.pipelines",
+    "project": "nextcode.services.project",
+    "query": "nextcode.services.query",
+    "queryserver": "nextcode.services.queryserver",
+    "workflow": "nextcode.services.workflow",
+}
+# entry point group for services provided by other packages
+SERVICE_ENTRY_POINT_GROUP = "nextcode.services"
+
+_plugin_services: Optional[Dict[str, importlib.metadata.EntryPoint]] = None
+_plugin_lock = threading.Lock()
+
 log = logging.getLogger()
 
 cfg = Config()
@@ -87,6 +105,44 @@ def get_service(
     return client.service(service_name, **kw)
 
 
+def _get_plugin_services() -> Dict[str, importlib.metadata.EntryPoint]:
+    """
+    Services registered by installed packages under the `nextcode.services` entry point
+    group. Package metadata is only scanned once per process.
+    """
+    global _plugin_services
+    with _plugin_lock:
+        if _plugin_services is None:
+            entry_points = importlib.metadata.entry_points()
+            if hasattr(entry_points, "select"):
+                group = entry_points.select(group=SERVICE_ENTRY_POINT_GROUP)
+            else:  # python < 3.10
+                group = entry_points.get(SERVICE_ENTRY_POINT_GROUP, [])
+            _plugin_services = {ep.name: ep for ep in group}
+        return _plugin_services
+
+
+def _get_service_class(service_name: str):
+    """
+    Find the class implementing a service, built-in services take precedence over plugins.
+
+    A plugin entry point can refer to a service class or to a module containing a
+    `Service` class.
+
+    :raises: ServiceNotFound
+    """
+    module_name = SERVICE_MODULES.get(service_name)
+    if module_name:
+        log.debug("Importing service %s", service_name)
+        return import_module(module_name).Service
+    entry_point = _get_plugin_services().get(service_name)
+    if entry_point is None:
+        raise ServiceNotFound(f"Service '{service_name}' not found")
+    log.debug("Loading service %s from %s", service_name, entry_point.value)
+    obj = entry_point.load()
+    return getattr(obj, "Service", obj)
+
+
 class Profile:
 
     profile_name = None
@@ -170,6 +226,8 @@ class Client:
             self.profile = Profile(content={"api_key": api_key, "root_url": root_url})
 
         self.profile_name = self.profile.profile_name
+        api_key = None if self.profile.skip_auth else self.profile.api_key
+        self.transport = Transport(api_key)
 
     def service(self, service_name: str, **kw):
         """
@@ -179,13 +237,22 @@ class Client:
 
         Available services can be listed by calling class method `available_services`.
         """
-        for _, name, _ in pkgutil.iter_modules([str(SERVICES_PATH)]):
-            if name == service_name:
-                log.debug("Importing service %s", name)
-                module = import_module("..services.{}".format(name), __name__)
-                svc = module.Service(client=self, **kw)  # type: ignore
-                return svc
-        raise ServiceNotFound()
+        svc = _get_service_class(service_name)(client=self, **kw)
+        return svc
+
+    def async_service(self, service_name: str, max_concurrency: int = 32, **kw):
+        """
+        Retrieve an asyncio variant of a service.
+
+        Every method of the service returns an awaitable which runs the blocking
+        request on a pool of worker threads, see :mod:`nextcode.aio`.
+
+        :param service_name: The name of the service
+        :param max_concurrency: Maximum number of requests in flight at a time
+        """
+        from .aio import ThreadPoolService
+
+        return ThreadPoolService(self.service(service_name, **kw), max_concurrency)
 
     def get_access_token(self, decode: bool = False) -> Union[Dict, str]:
         """Retrieve the JWT access token that is generated from the current api key.
@@ -204,8 +271,9 @@ class Client:
         {"jti": "...", ...}
 
         """
-        token = os.environ.get("NEXTCODE_ACCESS_TOKEN") or get_access_token(
-            self.profile.api_key
+        # a new token is fetched and shared with the services of this client
+        token = os.environ.get("NEXTCODE_ACCESS_TOKEN") or self.transport.get_token(
+            stale=self.transport.token
         )
         if decode:
             return decode_token(token)
@@ -228,10 +296,7 @@ class Client:
     @classmethod
     def available_services(cls) -> List[str]:
         """List services that can be intantiated via an client object client.service(`service`)"""
-        ret = []
-        for _, name, _ in pkgutil.iter_modules([str(SERVICES_PATH)]):
-            ret.append(name)
-        return ret
+        return sorted(set(SERVICE_MODULES) | set(_get_plugin_services()))
 
     @classmethod
     def available_profiles(cls) -> List[str]:
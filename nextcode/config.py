@@ -5,14 +5,21 @@ Configuration, caching and profile management for nextcode sdk.
 
 """
 
+import copy
 import os
 import logging
+import threading
 import yaml
 import json
 import time
+from contextlib import contextmanager
 from pathlib import Path
-from typing import Dict, Tuple, Sequence, Optional
-import shutil
+from typing import Callable, Dict, Iterator, Tuple, Sequence, Optional
+
+try:
+    import fcntl
+except ImportError:  # windows
+    fcntl = None
 
 from .utils import root_url_from_api_key
 from .exceptions import InvalidProfile
@@ -23,58 +30,184 @@ log = logging.getLogger(__name__)
 
 DEFAULT_PROFILE_NAME = "default"
 CACHE_SECONDS = 600
+STALE_SECONDS = 3600
+
+# in-process layer in front of the disk cache, cache file -> (expires at, contents)
+_memory_cache: Dict[str, Tuple[float, Dict]] = {}
+_memory_lock = threading.Lock()
+
+
+@contextmanager
+def _file_lock(path: Path, blocking: bool = True) -> Iterator[bool]:
+    """
+    Hold an exclusive lock on a lock file, shared between threads and processes.
+
+    Yields False if `blocking` is False and the lock is held by someone else.
+    """
+    if fcntl is None:
+        yield True
+        return
+    with open(path, "a") as f:
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+        except BlockingIOError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def _cache_file(name: str) -> Path:
+    return root_config_folder.joinpath("cache", name + ".cache")
+
+
+def _lock_file(cache_file: Path, kind: str = "") -> Path:
+    """
+    Lock file shared by all entries in the folder of a cache file.
+
+    Lock files are never removed, so every thread and process locks the same file.
+    """
+    os.makedirs(cache_file.parent, exist_ok=True)
+    return cache_file.parent.joinpath(f".{kind}lock")
+
+
+def _read_cache_file(cache_file: Path) -> Optional[Tuple[float, Dict]]:
+    try:
+        with cache_file.open("r") as f:
+            contents = json.load(f)
+        meta = contents.pop("_cache", None)
+        if meta:
+            expires_at = meta["expires_at"]
+        else:
+            # written by an older version of the sdk
+            expires_at = os.path.getmtime(cache_file) + CACHE_SECONDS
+    except FileNotFoundError:
+        return None
+    except Exception:
+        log.exception("Could not load from cache %s", cache_file)
+        return None
+    entry = (expires_at, contents)
+    with _memory_lock:
+        _memory_cache[str(cache_file)] = entry
+    return entry
+
 
+def _revalidate(cache_file: Path, revalidate: Callable[[], None]) -> None:
+    """
+    Call `revalidate` in a background thread unless another thread or process is
+    already revalidating the cache entry.
+    """
 
-def load_cache(name: str) -> Optional[Dict]:
+    def run():
+        # a separate lock from the one `save_cache` takes, which revalidate ends with
+        lock_file = _lock_file(cache_file, "refresh.")
+        with _file_lock(lock_file, blocking=False) as acquired:
+            if not acquired:
+                return
+            entry = _read_cache_file(cache_file)
+            if entry and entry[0] >= time.time():
+                return
+            try:
+                revalidate()
+            except Exception:
+                log.exception("Could not revalidate cache %s", cache_file)
+
+    threading.Thread(target=run, daemon=True).start()
+
+
+def load_cache(
+    name: str, revalidate: Optional[Callable[[], None]] = None
+) -> Optional[Dict]:
     """
     Load a dictionary from disk cache by name.
 
     The file is found in ~/.nextcode/cache/[name].cache and is assumed to be a
-    dictionary in json format.
+    dictionary in json format. Entries are kept in memory as well so the file is
+    only read again once the entry has expired.
+
+    If the entry has expired less than `STALE_SECONDS` ago and `revalidate` is set
+    the stale contents are returned and `revalidate` is called in the background to
+    refresh the entry. Only one thread or process revalidates an entry at a time.
 
     If NEXTCODE_DISABLE_CACHE environment variable is non-zero this method does nothing
     """
     if os.environ.get("NEXTCODE_DISABLE_CACHE"):
         return None
-    cache_file = root_config_folder.joinpath("cache", name + ".cache")
-    try:
-        file_age = time.time() - os.path.getmtime(cache_file)
-        if file_age > CACHE_SECONDS:
+    cache_file = _cache_file(name)
+    now = time.time()
+    with _memory_lock:
+        entry = _memory_cache.get(str(cache_file))
+    if entry is None or entry[0] < now:
+        # another process might have refreshed the entry
+        entry = _read_cache_file(cache_file)
+    if entry is None:
+        return None
+    expires_at, contents = entry
+    if expires_at < now:
+        if revalidate is not None and expires_at + STALE_SECONDS >= now:
+            log.info("Cache %s is stale, revalidating in the background", cache_file)
+            _revalidate(cache_file, revalidate)
+        elif expires_at + STALE_SECONDS < now:
             log.info("Cache is too old, removing it.")
-            os.remove(cache_file)
-            raise FileNotFoundError
+            _remove_cache_file(cache_file)
+            return None
+        else:
+            return None
+    log.info("Loaded contents from cache %s", cache_file)
+    return copy.deepcopy(contents)
 
-        contents = json.load(cache_file.open("r"))
-        log.info("Loaded contents from cache %s", cache_file)
-        return contents
-    except FileNotFoundError:
-        pass
-    except Exception:
-        log.exception("Could not load from cache %s", cache_file)
-    return None
 
+def save_cache(name: str, contents: Dict, ttl: Optional[float] = None) -> None:
+    """
+    Atomically save a dictionary to the disk cache by name.
 
-def save_cache(name: str, contents: Dict) -> None:
+    :param ttl: Number of seconds the entry is valid for (default `CACHE_SECONDS`)
+    """
     if os.environ.get("NEXTCODE_DISABLE_CACHE"):
         return
+    cache_file = _cache_file(name)
+    expires_at = time.time() + (CACHE_SECONDS if ttl is None else ttl)
     try:
-        cache_folder = root_config_folder.joinpath("cache")
-        os.makedirs(cache_folder, exist_ok=True)
-        cache_file = root_config_folder.joinpath(cache_folder, name + ".cache")
-        json.dump(contents, cache_file.open("w"), default=str)
+        os.makedirs(cache_file.parent, exist_ok=True)
+        tmp_file = cache_file.with_name(
+            f"{cache_file.name}.{os.getpid()}.{threading.get_ident()}.tmp"
+        )
+        data = dict(contents, _cache={"expires_at": expires_at})
+        with _file_lock(_lock_file(cache_file)):
+            with tmp_file.open("w") as f:
+                json.dump(data, f, default=str)
+            os.replace(tmp_file, cache_file)
+        with _memory_lock:
+            _memory_cache[str(cache_file)] = (expires_at, copy.deepcopy(contents))
         log.info("Dumped contents into cache %s", cache_file)
     except Exception:
         log.exception("Could not save cache %s", cache_file)
 
 
-def clear_cache() -> None:
-    cache_folder = root_config_folder.joinpath("cache")
+def _remove_cache_file(cache_file: Path) -> None:
+    with _memory_lock:
+        _memory_cache.pop(str(cache_file), None)
     try:
-        shutil.rmtree(cache_folder)
+        os.remove(cache_file)
     except FileNotFoundError:
         pass
 
 
+def clear_cache() -> None:
+    """
+    Remove all entries from the disk cache.
+
+    The lock files are left in place since other threads or processes may hold them.
+    """
+    cache_folder = root_config_folder.joinpath("cache")
+    with _memory_lock:
+        _memory_cache.clear()
+    for cache_file in cache_folder.glob("*.cache"):
+        _remove_cache_file(cache_file)
+
+
 class Config:
     """
     Borg pattern Config class see:
@@ -4,7 +4,7 @@ exceptions
 Custom exceptions raised by the nextcode-sdk.
 
 """
-from typing import Dict
+from typing import Dict, Optional
 
 
 class ServerError(Exception):
@@ -14,10 +14,12 @@ class ServerError(Exception):
 
     response: Dict = {}
     url: str = ""
+    status_code: Optional[int] = None
 
-    def __init__(self, message, response=None, url=None, **kw):
+    def __init__(self, message, response=None, url=None, status_code=None, **kw):
         self.response = response
         self.url = url
+        self.status_code = status_code
         self.message = message
 
     def __str__(self):
@@ -0,0 +1,449 @@
+"""
+instrumentation
+~~~~~~~~~~
+Structured events for the requests sent by the service sessions.
+
+Every request sent through a :class:`~nextcode.session.ServiceSession` results in a
+:class:`RequestEvent` which is passed to all registered listeners. A listener is any
+callable taking the event, e.g. a :class:`HistogramCollector` which aggregates the
+latency of each SDK call in memory and can hand the aggregates to an :class:`Exporter`.
+
+.. code-block:: python
+
+   from nextcode import instrumentation
+
+   collector = instrumentation.HistogramCollector()
+   instrumentation.add_listener(collector)
+   ...
+   for row in collector.summary():
+       print(row["method"], row["endpoint"], row["count"], row["total_time"])
+   print(instrumentation.PrometheusExporter().render(collector.histograms()))
+"""
+
+import abc
+import logging
+import re
+import sys
+import threading
+from bisect import bisect_left
+from typing import Callable, Dict, Iterable, List, Optional, TextIO, Tuple
+from urllib.parse import urlsplit
+
+log = logging.getLogger(__name__)
+
+# upper bounds in seconds of the latency histogram buckets
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_listeners: List[Callable[["RequestEvent"], None]] = []
+_listeners_lock = threading.Lock()
+
+_ID_SEGMENT = re.compile(r"^(\d+|[0-9a-fA-F-]{16,})$")
+_TEMPLATE_FIELD = re.compile(r"\\{[^/]*?\\}")
+
+
+class RequestEvent:
+    """
+    A single request sent by a service session.
+
+    :param method: The http method, e.g. `GET`
+    :param url: The full url of the request
+    :param endpoint: Name of the service endpoint that was called, see `endpoint_name`
+    :param service: Base url of the service
+    :param status: The http status code or None if no response was received
+    :param bytes_sent: Size of the request body
+    :param bytes_received: Size of the response body, None if it was streamed without
+        a content length
+    :param time_to_first_byte: Seconds until the response headers were received
+    :param duration: Total number of seconds for the request including the response body.
+        For requests sent with `stream=True` the event is emitted once the headers have
+        been received, so the duration does not include reading the body and is close
+        to `time_to_first_byte`
+    :param retries: Number of times the request was retried by the transport
+    :param token_refreshed: Whether the access token was refreshed for this request
+    :param error: Name of the exception if the request failed without a response
+    """
+
+    __slots__ = (
+        "method",
+        "url",
+        "endpoint",
+        "service",
+        "status",
+        "bytes_sent",
+        "bytes_received",
+        "time_to_first_byte",
+        "duration",
+        "retries",
+        "token_refreshed",
+        "error",
+    )
+
+    def __init__(
+        self,
+        method: str,
+        url: str,
+        endpoint: str,
+        service: str,
+        status: Optional[int] = None,
+        bytes_sent: int = 0,
+        bytes_received: Optional[int] = None,
+        time_to_first_byte: Optional[float] = None,
+        duration: float = 0.0,
+        retries: int = 0,
+        token_refreshed: bool = False,
+        error: Optional[str] = None,
+    ):
+        self.method = method
+        self.url = url
+        self.endpoint = endpoint
+        self.service = service
+        self.status = status
+        self.bytes_sent = bytes_sent
+        self.bytes_received = bytes_received
+        self.time_to_first_byte = time_to_first_byte
+        self.duration = duration
+        self.retries = retries
+        self.token_refreshed = token_refreshed
+        self.error = error
+
+    def __repr__(self):
+        return "<RequestEvent {} {} {} in {:.3f} sec>".format(
+            self.method, self.endpoint, self.status or self.error, self.duration
+        )
+
+    def as_dict(self) -> Dict:
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+def add_listener(listener: Callable[[RequestEvent], None]) -> None:
+    """
+    Call `listener` with a :class:`RequestEvent` after every request
+    """
+    with _listeners_lock:
+        if listener not in _listeners:
+            _listeners.append(listener)
+
+
+def remove_listener(listener: Callable[[RequestEvent], None]) -> None:
+    with _listeners_lock:
+        if listener in _listeners:
+            _listeners.remove(listener)
+
+
+def has_listeners() -> bool:
+    return bool(_listeners)
+
+
+def emit(event: RequestEvent) -> None:
+    """
+    Pass an event to all listeners. Errors in listeners are logged and never
+    affect the request.
+    """
+    for listener in list(_listeners):
+        try:
+            listener(event)
+        except Exception:
+            log.exception("Instrumentation listener %r failed", listener)
+
+
+def endpoint_name(url: str, endpoints: Optional[Dict[str, str]]) -> str:
+    """
+    Describe a url by the name of the service endpoint it belongs to.
+
+    The endpoint with the longest url that the request url starts with is used and the
+    rest of the path is appended with ids replaced by `{id}`, e.g. `queries/{id}`.
+    Endpoint urls can contain template fields such as `{project_name}`. Urls outside
+    of all endpoints are described by their path.
+    """
+    path = urlsplit(url).path.rstrip("/")
+    best_name, best_length = None, -1
+    for name, endpoint_url in (endpoints or {}).items():
+        if not isinstance(endpoint_url, str):
+            continue
+        match = _endpoint_pattern(endpoint_url).match(path)
+        if match and match.end() > best_length:
+            best_name, best_length = name, match.end()
+    rest = path[best_length:] if best_name else path
+    segments = [
+        "{id}" if _ID_SEGMENT.match(segment) else segment
+        for segment in rest.split("/")
+        if segment
+    ]
+    if best_name:
+        segments.insert(0, best_name)
+    return "/".join(segments) or "/"
+
+
+_patterns: Dict[str, "re.Pattern"] = {}
+
+
+def _endpoint_pattern(endpoint_url: str) -> "re.Pattern":
+    pattern = _patterns.get(endpoint_url)
+    if pattern is None:
+        path = re.escape(urlsplit(endpoint_url).path.rstrip("/"))
+        pattern = re.compile(_TEMPLATE_FIELD.sub("[^/]+", path) + "(?=/|$)")
+        _patterns[endpoint_url] = pattern
+    return pattern
+
+
+def request_event(
+    method: str,
+    url: str,
+    endpoints: Optional[Dict[str, str]],
+    service: str,
+    response=None,
+    duration: float = 0.0,
+    stream: bool = False,
+    token_refreshed: bool = False,
+    error: Optional[BaseException] = None,
+) -> RequestEvent:
+    """
+    Create an event for a request sent with `requests`.
+
+    The response body is only measured if it has already been read, streamed
+    responses are measured by their `Content-Length` header.
+    """
+    event = RequestEvent(
+        method.upper(),
+        url,
+        endpoint_name(url, endpoints),
+        service,
+        duration=duration,
+        token_refreshed=token_refreshed,
+        error=type(error).__name__ if error else None,
+    )
+    if response is None:
+        return event
+    event.status = response.status_code
+    event.bytes_sent = _body_size(response.request.body, response.request.headers)
+    if stream:
+        content_length = response.headers.get("Content-Length")
+        event.bytes_received = int(content_length) if content_length else None
+    else:
+        event.bytes_received = len(response.content or b"")
+    if response.elapsed is not None:
+        event.time_to_first_byte = response.elapsed.total_seconds()
+    retries = getattr(getattr(response, "raw", None), "retries", None)
+    event.retries = len(getattr(retries, "history", None) or ())
+    return event
+
+
+def _body_size(body, headers) -> int:
+    if body is None:
+        return 0
+    if isinstance(body, bytes):
+        return len(body)
+    if isinstance(body, str):
+        return len(body.encode())
+    try:
+        return int(headers.get("Content-Length") or 0)
+    except ValueError:
+        return 0
+
+
+class Histogram:
+    """
+    Aggregated requests to a single endpoint with a single method.
+
+    :param method: The http method
+    :param endpoint: The endpoint name
+    :param buckets: Upper bounds in seconds of the duration buckets
+    """
+
+    def __init__(self, method: str, endpoint: str, buckets: Tuple[float, ...]):
+        self.method = method
+        self.endpoint = endpoint
+        self.buckets = buckets
+        # the last count is for durations above the highest bound
+        self.bucket_counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+        self.total_time_to_first_byte = 0.0
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.retries = 0
+        self.token_refreshes = 0
+        self.errors = 0
+        self.statuses: Dict[str, int] = {}
+
+    def __repr__(self):
+        return f"<Histogram {self.method} {self.endpoint} ({self.count})>"
+
+    def observe(self, event: RequestEvent) -> None:
+        self.bucket_counts[bisect_left(self.buckets, event.duration)] += 1
+        self.count += 1
+        self.total_time += event.duration
+        self.max_time = max(self.max_time, event.duration)
+        self.total_time_to_first_byte += event.time_to_first_byte or 0.0
+        self.bytes_sent += event.bytes_sent or 0
+        self.bytes_received += event.bytes_received or 0
+        self.retries += event.retries
+        self.token_refreshes += int(event.token_refreshed)
+        if event.error or (event.status and event.status >= 400):
+            self.errors += 1
+        status = str(event.status or event.error)
+        self.statuses[status] = self.statuses.get(status, 0) + 1
+
+    def quantile(self, q: float) -> float:
+        """
+        Estimate a quantile of the durations, interpolating within the bucket
+        """
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, bucket_count in enumerate(self.bucket_counts):
+            if bucket_count and seen + bucket_count >= rank:
+                lower = self.buckets[i - 1] if i > 0 else 0.0
+                upper = self.buckets[i] if i < len(self.buckets) else self.max_time
+                fraction = (rank - seen) / bucket_count
+                return min(lower + (upper - lower) * fraction, self.max_time)
+            seen += bucket_count
+        return self.max_time
+
+    def as_dict(self) -> Dict:
+        return {
+            "method": self.method,
+            "endpoint": self.endpoint,
+            "count": self.count,
+            "errors": self.errors,
+            "total_time": self.total_time,
+            "mean_time": self.total_time / self.count if self.count else 0.0,
+            "p50": self.quantile(0.5),
+            "p95": self.quantile(0.95),
+            "max_time": self.max_time,
+            "mean_time_to_first_byte": (
+                self.total_time_to_first_byte / self.count if self.count else 0.0
+            ),
+            "bytes_sent": self.bytes_sent,
+            "bytes_received": self.bytes_received,
+            "retries": self.retries,
+            "token_refreshes": self.token_refreshes,
+            "statuses": dict(self.statuses),
+        }
+
+
+class HistogramCollector:
+    """
+    Listener which aggregates request durations per method and endpoint in memory.
+
+    :param buckets: Upper bounds in seconds of the duration buckets
+    """
+
+    def __init__(self, buckets: Iterable[float] = DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self._histograms: Dict[Tuple[str, str], Histogram] = {}
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return f"<HistogramCollector ({len(self._histograms)} endpoints)>"
+
+    def __call__(self, event: RequestEvent) -> None:
+        key = (event.method, event.endpoint)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = Histogram(event.method, event.endpoint, self.buckets)
+                self._histograms[key] = histogram
+            histogram.observe(event)
+
+    def histograms(self) -> List[Histogram]:
+        """
+        Snapshot of the histograms, the ones with the most total time first
+        """
+        with self._lock:
+            histograms = [_copy_histogram(h) for h in self._histograms.values()]
+        return sorted(histograms, key=lambda h: h.total_time, reverse=True)
+
+    def summary(self) -> List[Dict]:
+        """
+        Statistics for each method and endpoint, the ones with the most total time first
+        """
+        return [h.as_dict() for h in self.histograms()]
+
+    def export(self, exporter: "Exporter") -> None:
+        exporter.export(self.histograms())
+
+    def reset(self) -> None:
+        with self._lock:
+            self._histograms.clear()
+
+
+def _copy_histogram(histogram: Histogram) -> Histogram:
+    ret = Histogram(histogram.method, histogram.endpoint, histogram.buckets)
+    ret.__dict__.update(histogram.__dict__)
+    ret.bucket_counts = list(histogram.bucket_counts)
+    ret.statuses = dict(histogram.statuses)
+    return ret
+
+
+class Exporter(abc.ABC):
+    """
+    Interface for sending aggregated histograms to a metrics backend, such as an
+    OpenTelemetry metric exporter or a Prometheus push gateway.
+    """
+
+    @abc.abstractmethod
+    def export(self, histograms: List[Histogram]) -> None:
+        """
+        Send the histograms to the backend
+        """
+
+    def shutdown(self) -> None:
+        """
+        Flush and release any resources held by the exporter, does nothing by default
+        """
+
+
+class PrometheusExporter(Exporter):
+    """
+    Write the histograms in the Prometheus text exposition format.
+
+    :param stream: Where to write the metrics, stdout by default
+    :param prefix: Prefix of the metric names
+    """
+
+    def __init__(self, stream: Optional[TextIO] = None, prefix: str = "nextcode"):
+        self.stream = stream
+        self.prefix = prefix
+
+    def export(self, histograms: List[Histogram]) -> None:
+        stream = self.stream or sys.stdout
+        stream.write(self.render(histograms))
+        stream.flush()
+
+    def render(self, histograms: List[Histogram]) -> str:
+        name = f"{self.prefix}_request_duration_seconds"
+        lines = [
+            f"# HELP {name} Duration of requests sent by the nextcode sdk",
+            f"# TYPE {name} histogram",
+        ]
+        for h in histograms:
+            labels = f'method="{_escape(h.method)}",endpoint="{_escape(h.endpoint)}"'
+            cumulative = 0
+            for bound, bucket_count in zip(h.buckets, h.bucket_counts):
+                cumulative += bucket_count
+                lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {h.count}')
+            lines.append(f"{name}_sum{{{labels}}} {h.total_time}")
+            lines.append(f"{name}_count{{{labels}}} {h.count}")
+        counters = (
+            ("request_bytes_sent_total", "bytes_sent", "Request body bytes sent"),
+            ("request_bytes_received_total", "bytes_received", "Response bytes received"),
+            ("request_retries_total", "retries", "Requests retried by the transport"),
+            ("token_refreshes_total", "token_refreshes", "Access token refreshes"),
+            ("request_errors_total", "errors", "Failed requests"),
+        )
+        for suffix, attr, description in counters:
+            counter = f"{self.prefix}_{suffix}"
+            lines.append(f"# HELP {counter} {description}")
+            lines.append(f"# TYPE {counter} counter")
+            for h in histograms:
+                labels = f'method="{_escape(h.method)}",endpoint="{_escape(h.endpoint)}"'
+                lines.append(f"{counter}{{{labels}}} {getattr(h, attr)}")
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
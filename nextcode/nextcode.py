@@ -5,6 +5,8 @@ Nextcode
 This is the basic entrypoint to interact with services.
 """
 
+from functools import cached_property
+
 from nextcode import Client
 
 
@@ -12,6 +14,9 @@ class Nextcode:
     """
     The main class used to interface with our APIs
 
+    Services are created on first access and share the connection pool and access
+    token of the client.
+
     :param api_key: api key to use for this client
     :param profile: name of a saved profile to use with this client
     :param root_url: override the URL of the server root. e.g. https://server.wuxinextcode.com
@@ -26,12 +31,28 @@ class Nextcode:
     """
     def __init__(self, api_key=None, profile=None, project=None, root_url=None):
         self.client = Client(api_key=api_key, profile=profile, root_url=root_url)
-        self.phenoteke = self.client.service('phenoteke')
-        self.phenotype = self.client.service('phenotype', project=project)
-        self.pipelines = self.client.service('pipelines')
-        self.query = self.client.service('query')
-        self.queryserver = self.client.service(
-            'queryserver',
-            project=project
-        )
-        self.workflow = self.client.service('workflow')
+        self.project = project
+
+    @cached_property
+    def phenoteke(self):
+        return self.client.service('phenoteke')
+
+    @cached_property
+    def phenotype(self):
+        return self.client.service('phenotype', project=self.project)
+
+    @cached_property
+    def pipelines(self):
+        return self.client.service('pipelines')
+
+    @cached_property
+    def query(self):
+        return self.client.service('query')
+
+    @cached_property
+    def queryserver(self):
+        return self.client.service('queryserver', project=self.project)
+
+    @cached_property
+    def workflow(self):
+        return self.client.service('workflow')
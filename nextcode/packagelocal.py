@@ -7,7 +7,6 @@ Package a local folder and upload to S3 for workflow service and pipelines servi
 
 import os
 from time import sleep
-import boto3
 import socket
 from zipfile import ZipFile
 import tempfile
@@ -108,6 +107,9 @@ def _package_and_upload(
 
     if len(files) == 0:
         raise RuntimeError("No files found in '%s'" % project_path)
+
+    import boto3
+
     s3_resource = boto3.resource("s3")
     b = s3_resource.Bucket(scratch_bucket)  # pylint: disable=no-member
     s3_path = "builds/" + zip_filename
@@ -36,7 +36,9 @@ class BaseService:
         api_key = client.profile.api_key
         if client.profile.skip_auth:
             api_key = None
-        self.session = ServiceSession(self.base_url, api_key)
+        self.session = ServiceSession(
+            self.base_url, api_key, transport=getattr(client, "transport", None)
+        )
 
     def __repr__(self):
         return f"<Service {self.service_name} {self.version} | {self.base_url}>"
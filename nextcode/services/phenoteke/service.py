@@ -7,25 +7,61 @@ Service object for interfacing with the Phenoteke API
 
 import os
 import logging
+import threading
+import time
 from posixpath import join as urljoin
-from typing import Optional, List, Union, Dict
+from typing import Optional, List, Union, Dict, Tuple
+
+from requests.exceptions import RequestException
 
 from ...client import Client
+from ...exceptions import ServerError
 from ...services import BaseService
+from ...utils import map_ordered
 
 SERVICE_PATH = "phenoteke/api/v1"
 
+MAPPING_BATCH_SIZE = 500  # Number of cids sent in each mapping request
+MAPPING_WORKERS = 8  # Number of mapping requests in flight at a time
+MAPPING_RETRIES = 3  # Number of times a failed mapping request is retried
+
 log = logging.getLogger(__file__)
 
+
+def _is_transient(ex: Exception) -> bool:
+    """
+    Is a failed request worth retrying, i.e. a network error or a 5xx response
+    """
+    if isinstance(ex, ServerError):
+        return (ex.status_code or 0) >= 500
+    response = getattr(ex, "response", None)
+    if response is not None:
+        return response.status_code >= 500
+    return True
+
 class Service(BaseService):
     """
     Phenoteke Service
+
+    The number of cids in each mapping request, the number of concurrent mapping
+    requests and the number of retries for each request can be passed in as
+    `mapping_batch_size`, `mapping_workers` and `mapping_retries`.
     """
 
     links: Dict = {}
+    mapping_batch_size: int = MAPPING_BATCH_SIZE
+    mapping_workers: int = MAPPING_WORKERS
+    mapping_retries: int = MAPPING_RETRIES
 
     def __init__(self, client: Client, *args, **kwargs) -> None:
         super(Service, self).__init__(client, SERVICE_PATH, *args, **kwargs)
+        self.mapping_batch_size = kwargs.get("mapping_batch_size") or self.mapping_batch_size
+        self.mapping_workers = kwargs.get("mapping_workers") or self.mapping_workers
+        if kwargs.get("mapping_retries") is not None:
+            self.mapping_retries = kwargs["mapping_retries"]
+        # mappings which have already been fetched, by (site, study, subcategory, cid)
+        self.mapping_cache: Dict[Tuple, List[Dict]] = {}
+        self._mapping_lock = threading.Lock()
 
     def map_cids_to_ipns(
             self,
@@ -37,6 +73,15 @@ class Service(BaseService):
         """
         Get mapping from collaborator ids to ipns
 
+        The cids are sent in batches of `mapping_batch_size` with up to `mapping_workers`
+        requests in flight. Batches which fail with a network error or a server error
+        (5xx) are retried up to `mapping_retries` times, other errors are raised right away.
+        Mappings are remembered by the service so cids which have been mapped before
+        are not requested again.
+
+        Duplicate cids are only mapped once and their mappings appear once in the result,
+        in the order the cids are first listed.
+
         :param site_id: Site code
         :param study_id: Study code
         :param cids: List of collaborator ids
@@ -48,27 +93,77 @@ class Service(BaseService):
             self.session.url_from_endpoint("root"),
             "cids_to_ipns_mapping",
         )
-        result = []
-        parts = int((len(cids)+4)/5)
-
         payload = {
             "site_id": site_id,
             "study_id": study_id,
         }
         if subcategory_id:
             payload["subcategory_id"] = subcategory_id
+        scope = (site_id, study_id, subcategory_id)
+
+        # only request the cids which have not been mapped before, each of them once
+        found: Dict[str, List[Dict]] = {}
+        requested = []
+        with self._mapping_lock:
+            for cid in dict.fromkeys(cids):
+                items = self.mapping_cache.get((*scope, cid))
+                if items:
+                    found[cid] = items
+                else:
+                    requested.append(cid)
+        log.info(
+            "Mapping %s cids to ipns, %s already mapped",
+            len(requested),
+            len(cids) - len(requested),
+        )
 
-        def list_split(l, parts):
-            length = len(l)
-            return [ l [i*length // parts: (i+1)*length // parts] for i in range(parts) ]
-
-        for cid_parts in list_split(cids,parts):
-            payload["cids"] = cid_parts
-
-            resp = self.session.post(uri, json=payload)
-            resp.raise_for_status()
-            data = resp.json()
-            result.extend(data["data"])
+        def map_batch(batch):
+            attempt = 0
+            while True:
+                try:
+                    resp = self.session.post(uri, json=dict(payload, cids=batch))
+                    resp.raise_for_status()
+                    return resp.json()["data"]
+                except (RequestException, ServerError) as ex:
+                    attempt += 1
+                    if attempt > self.mapping_retries or not _is_transient(ex):
+                        raise
+                    log.warning(
+                        "Mapping %s cids failed (%s), retrying in %s sec",
+                        len(batch),
+                        ex,
+                        attempt,
+                    )
+                    time.sleep(attempt)
+
+        size = self.mapping_batch_size
+        batches = [requested[i:i + size] for i in range(0, len(requested), size)]
+        unmatched = []
+        for batch, data in zip(
+            batches, map_ordered(map_batch, batches, self.mapping_workers)
+        ):
+            batch_cids = set(batch)
+            mapped: Dict[str, List] = {cid: [] for cid in batch}
+            for item in data:
+                if item.get("cid") in batch_cids:
+                    mapped[item["cid"]].append(item)
+                else:
+                    unmatched.append(item)
+            found.update(mapped)
+            with self._mapping_lock:
+                for cid, items in mapped.items():
+                    # cids without a mapping are requested again next time
+                    if items:
+                        self.mapping_cache[(*scope, cid)] = items
 
-        return result
+        result = []
+        for cid in dict.fromkeys(cids):
+            result.extend(found.get(cid, []))
+        return result + unmatched
 
+    def clear_mapping_cache(self) -> None:
+        """
+        Forget all cid to ipn mappings which have been fetched by this service
+        """
+        with self._mapping_lock:
+            self.mapping_cache.clear()
@@ -13,23 +13,58 @@ import dateutil
 import time
 import logging
 from typing import Callable, Union, Optional, Dict, List
-try:
-    import pandas as pd
-except ModuleNotFoundError:
-    print('pandas is not installed - some functions might not work')
-try:
-    import plotly.graph_objects as go
-    from plotly.offline import init_notebook_mode, iplot
-except ModuleNotFoundError:
-    print('plotly is not installed - some functions might not work')
 
 from .exceptions import PhenotypeError
 from .phenotype_matrix import PhenotypeMatrix
+from .store import PhenotypeStore
 from ...exceptions import ServerError
 from ...session import ServiceSession
 
 log = logging.getLogger(__name__)
 
+UPLOAD_CHUNK_ROWS = 10000
+
+
+class _UploadBody:
+    """
+    Request body for a phenotype upload which is serialized `chunk_size` rows at a time,
+    reading a DataFrame column by column instead of converting all of it to a list of rows.
+
+    The body can be iterated more than once so the request can be sent again,
+    e.g. after the access token has been refreshed.
+    """
+
+    def __init__(self, data, chunk_size: int, callback: Optional[Callable] = None):
+        if not isinstance(data, list) and not hasattr(data, "iloc"):
+            raise TypeError("data must be a list or pandas DataFrame")
+        self.data = data
+        self.chunk_size = chunk_size
+        self.callback = callback
+        self.total = len(data)
+
+    def __iter__(self):
+        yield b'{"data":['
+        for start in range(0, self.total, self.chunk_size):
+            stop = min(start + self.chunk_size, self.total)
+            chunk = json.dumps(self._rows(start, stop), separators=(",", ":"))[1:-1]
+            yield (b"," if start else b"") + chunk.encode()
+            if self.callback:
+                self.callback(sent=stop, total=self.total)
+        yield b"]}"
+
+    def _rows(self, start: int, stop: int) -> List:
+        if isinstance(self.data, list):
+            return self.data[start:stop]
+        columns = []
+        for i in range(self.data.shape[1]):
+            values = self.data.iloc[start:stop, i]
+            if values.dtype.kind == "f":
+                # missing values are sent as null
+                values = values.astype(object).where(values.notna(), None)
+            columns.append(values.tolist())
+        return [list(row) for row in zip(*columns)]
+
+
 class Phenotype:
     """
     A local object representing a phenotype response from the phenotype
@@ -54,10 +89,13 @@ class Phenotype:
 
     """
 
-    def __init__(self, session: ServiceSession, data: Dict):
+    def __init__(
+        self, session: ServiceSession, data: Dict, store: Optional[PhenotypeStore] = None
+    ):
         self.session = session
         self.data = data
         self.links = data["links"]
+        self.store = store
         self.df = None
 
     def __getattr__(self, name):
@@ -92,7 +130,7 @@ class Phenotype:
         """
         _ = self.session.delete(self.links["self"])
 
-    def upload(self, data):
+    def upload(self, data, chunk_size: Optional[int] = None, callback: Optional[Callable] = None):
         """
         Upload phenotype data
 
@@ -101,8 +139,20 @@ class Phenotype:
         The `result_type` of the phenotype dictates
         if each sublist should contain one or two items.
 
+        For large phenotypes pass in a `chunk_size`, e.g. `UPLOAD_CHUNK_ROWS`. The data is then
+        serialized `chunk_size` rows at a time while it is streamed to the server, so neither a
+        list of all the rows nor the full request body is kept in memory.
+
+        :param chunk_size: Number of rows to serialize at a time
+        :param callback: called with the number of rows `sent` so far and the `total` number
+            of rows while the data is streamed
         :raises: `ServerError` if there was a problem uploading
         """
+        if chunk_size:
+            body = _UploadBody(data, chunk_size, callback)
+            resp = self.session.post(self.links["upload"], data=body)
+            return resp.json()
+
         if not isinstance(data, list):
             try:
                 data = data.values.tolist()
@@ -199,15 +249,20 @@ class Phenotype:
         """
         return self.data
 
-    def get_data(self, label: Optional[str] = None):
+    def get_data(self, label: Optional[str] = None, compact: bool = False):
         """
         Retrieve a phenotype data from the server.
 
         :param label: Optional name of value column
-        """
-        matrix = PhenotypeMatrix(self.session, project_name = self.data["project_key"])
-        matrix.add_phenotype(name = self.data["name"], label = label)
-        self.df = matrix.get_data()
+        :param compact: Use a compact column type based on the result type
+        """
+        matrix = PhenotypeMatrix(
+            self.session, project_name=self.data["project_key"], store=self.store
+        )
+        matrix.add_phenotype(
+            name = self.data["name"], label = label, result_type = self.data.get("result_type")
+        )
+        self.df = matrix.get_data(compact=compact)
         return self.df
 
     def display(self, title=None):
@@ -222,6 +277,11 @@ class Phenotype:
         if self.df is None:
             self.get_data()
 
+        try:
+            from plotly.offline import init_notebook_mode, iplot
+        except ModuleNotFoundError:
+            raise PhenotypeError("Plotly library is not installed")
+
         switcher = {
             "SET": self._plot_set,
             "QT": self._plot_qt,
@@ -245,6 +305,8 @@ class Phenotype:
         """
         Plot QT phenotype
         """
+        import plotly.graph_objects as go
+
         grp_col = self.df.columns[1]
         fig = go.Figure([go.Histogram(x=self.df[grp_col])],
                    **kwargs)
@@ -255,6 +317,8 @@ class Phenotype:
         """
         Plot CATEGORICAL phenotype
         """
+        import plotly.graph_objects as go
+
         grp_col = self.df.columns[1]
         grp_df = self.df.groupby(grp_col).count()
         grp_df = grp_df.reset_index()
@@ -269,6 +333,8 @@ class Phenotype:
         """
         Plot SET phenotype
         """
+        import plotly.graph_objects as go
+
         fig = go.Figure([go.Pie(labels=["Count"], values=[len(self.df.index)])], **kwargs)
         fig.update_traces(textinfo='value')
         return fig
@@ -12,15 +12,20 @@ import datetime
 import dateutil
 import time
 import logging
+from posixpath import join as urljoin
 from typing import Callable, Union, Optional, Dict, List
 from io import StringIO
 
 from .exceptions import PhenotypeError
+from .store import PhenotypeStore, phenotype_version
 from ...exceptions import ServerError
 from ...session import ServiceSession
+from ...utils import map_ordered
 
 log = logging.getLogger(__name__)
 
+MATRIX_WORKERS = 8  # Number of matrix requests in flight at a time
+
 
 class PhenotypeMatrix:
     """
@@ -29,19 +34,45 @@ class PhenotypeMatrix:
     You start by using add_phenotype() or add_phenotypes()
     to add a list of phenotypes and then call get_data()
     to retrieve the phenotype matrix from the server.
+
+    With a `store` the phenotypes are kept locally and only the ones which have
+    changed since they were stored are fetched from the server, see
+    `Service.enable_store`.
+
+    With `get_data(compact=True)` the columns get compact types based on the result
+    type of each phenotype:
+
+    * SET - uint8, 1 for pns in the set and 0 for other pns
+    * QT - float32
+    * CATEGORY - pandas Categorical
+
+    and the pn column is stored as arrow strings if pyarrow is installed.
+    Columns whose values do not fit the result type are left as they are.
     """
 
-    def __init__(self, session: ServiceSession, base: str = None, project_name: str = None):
+    def __init__(
+        self,
+        session: ServiceSession,
+        base: str = None,
+        project_name: str = None,
+        store: Optional[PhenotypeStore] = None,
+    ):
         self.session = session
         self.base = base
         self.phenotypes: Dict[str, Dict[str, Optional[str]]] = {}
+        # result types are not part of the request so they are kept separately
+        self.result_types: Dict[str, str] = {}
         self.project_name = project_name
+        self.store = store
+        # time spent on each request of the last `get_data`
+        self.timings: List[Dict] = []
 
     def add_phenotype(
         self,
         name: str,
         missing_value: Optional[str] = None,
         label: Optional[str] = None,
+        result_type: Optional[str] = None,
     ) -> None:
         """
         Add a new phenotype to the matrix request.
@@ -49,24 +80,36 @@ class PhenotypeMatrix:
         :param name: Phenotype name
         :param missing_value: The string to substitute for a missing value in the data
         :param label: Optional label to apply to the phenotype
+        :param result_type: Result type of the phenotype if it is known, it is
+            otherwise looked up when it is needed
         """
         self.phenotypes[name] = {
             "name": name,
             "missing_value": missing_value,
             "label": label,
         }
+        if result_type:
+            self.result_types[name] = result_type
 
     def add_phenotypes(
-        self, names: List[str], missing_value: Optional[str] = None
+        self,
+        names: List[str],
+        missing_value: Optional[str] = None,
+        result_types: Optional[Dict[str, str]] = None,
     ) -> None:
         """
         Add a list of phenotypes to the matrix request.
 
         :param names: List of phenotype names
         :param missing_value: The string to substitute for a missing value in the data
+        :param result_types: Result types of the phenotypes by name, if they are known
         """
         for name in names:
-            self.add_phenotype(name, missing_value=missing_value)
+            self.add_phenotype(
+                name,
+                missing_value=missing_value,
+                result_type=(result_types or {}).get(name),
+            )
 
     def remove_phenotype(self, name: str) -> None:
         """
@@ -80,14 +123,28 @@ class PhenotypeMatrix:
             del self.phenotypes[name]
         except KeyError:
             pass
+        self.result_types.pop(name, None)
 
-    def get_data(self, dataframe: bool = True) -> object:
+    def get_data(
+        self,
+        dataframe: bool = True,
+        group_size: Optional[int] = None,
+        max_workers: int = MATRIX_WORKERS,
+        compact: bool = False,
+    ) -> object:
         """
         Retrieve a phenotype matrix from the server.
 
         Can be called after phenotypes have been added to the request.
 
+        With a `group_size` the phenotypes are split into groups of that many columns
+        which are fetched concurrently and joined on pn locally, sorted by pn. The time
+        spent on each group is logged and kept in `timings`.
+
         :param dataframe: If set, return results as a pandas dataframe (default True)
+        :param group_size: Maximum number of phenotypes to fetch in a single request
+        :param max_workers: Maximum number of requests in flight at a time
+        :param compact: Use compact column types based on the phenotype result types
         :raises: `PhenotypeError` if the request is not ready or pandas is not installed.
         :raises: `ServerError` if phenotypes are not found on the server
         """
@@ -95,7 +152,36 @@ class PhenotypeMatrix:
             raise PhenotypeError(
                 "Matrix request has not been initialized. Use add_phenotype(s) to begin."
             )
+        self.timings = []
+        if not dataframe:
+            return self._fetch(list(self.phenotypes.values()), dataframe)
+        df = self._get_dataframe(group_size, max_workers)
+        if compact:
+            df = self._compact(df)
+        return df
+
+    def _get_dataframe(self, group_size: Optional[int], max_workers: int):
+        if self.store is not None and not self.base:
+            return self._get_data_from_store(group_size, max_workers)
         phenotypes_list = list(self.phenotypes.values())
+        if not group_size or len(phenotypes_list) <= group_size:
+            return self._fetch(phenotypes_list)
+
+        groups = [
+            phenotypes_list[i:i + group_size]
+            for i in range(0, len(phenotypes_list), group_size)
+        ]
+        log.info(
+            "Fetching %s phenotypes in %s groups", len(phenotypes_list), len(groups)
+        )
+        frames = list(map_ordered(self._fetch, groups, max_workers))
+        # groups finish in any order, keep the timings in the order of the groups
+        order = {group[0]["name"]: i for i, group in enumerate(groups)}
+        self.timings.sort(key=lambda timing: order.get(timing["phenotypes"][0], 0))
+        return self._join(frames)
+
+    def _fetch(self, phenotypes_list: List[Dict], dataframe: bool = True) -> object:
+        start_time = time.time()
         content = {
             "base": self.base,
             "phenotypes": phenotypes_list,
@@ -113,6 +199,172 @@ class PhenotypeMatrix:
             raise PhenotypeError("Pandas library is not installed")
 
         if not tsv_data:
+            df = pd.DataFrame()
+        else:
+            df = pd.read_csv(StringIO(tsv_data), delimiter="\t")  # type: ignore
+        diff = time.time() - start_time
+        log.info(
+            "Fetched %s phenotypes (%s rows) in %.3f sec", len(phenotypes_list), len(df), diff
+        )
+        self.timings.append(
+            {
+                "phenotypes": [p["name"] for p in phenotypes_list],
+                "rows": len(df),
+                "bytes": len(tsv_data),
+                "seconds": diff,
+            }
+        )
+        return df
+
+    def _get_catalog_entries(self) -> Dict[str, Dict]:
+        """
+        Serverside responses for the phenotypes in the matrix by name
+        """
+        from .service import _get_paginated_results
+
+        url = urljoin(
+            self.session.url_from_endpoint("projects"), self.project_name, "phenotypes"
+        )
+        names = list(self.phenotypes)
+
+        def do_get(batch_size, offset):
+            content = {"names": ",".join(names), "limit": batch_size, "offset": offset}
+            return self.session.get(url, data=content).json()["phenotypes"]
+
+        entries = {item["name"]: item for item in _get_paginated_results(do_get, len(names))}
+        for name, item in entries.items():
+            if item.get("result_type"):
+                self.result_types.setdefault(name, item["result_type"])
+        return entries
+
+    def _get_data_from_store(self, group_size: Optional[int], max_workers: int):
+        """
+        Assemble the matrix from stored phenotypes, fetching the stale ones first.
+
+        Stale phenotypes are fetched in groups of `group_size`, or all in one request,
+        and each column of the response is stored on its own.
+        """
+        versions = {
+            name: phenotype_version(item)
+            for name, item in self._get_catalog_entries().items()
+        }
+        columns = {}
+        stale = []
+        for name, phenotype in self.phenotypes.items():
+            df = None
+            if name in versions:
+                df = self.store.get(
+                    self.project_name, name, versions[name], phenotype["missing_value"]
+                )
+            if df is None:
+                stale.append(name)
+            else:
+                columns[name] = df
+        log.info(
+            "Fetching %s of %s phenotypes, the rest are stored locally",
+            len(stale),
+            len(self.phenotypes),
+        )
+
+        def fetch(names: List[str]) -> Dict:
+            # missing values are left empty so that each stored column only contains
+            # the pns of its own phenotype, they are filled in when the matrix is joined
+            df = self._fetch([{"name": name, "missing_value": None, "label": None} for name in names])
+            ret = {}
+            for name in names:
+                if df.empty or name not in df.columns:
+                    ret[name] = df.iloc[0:0]
+                    continue
+                column = df[[df.columns[0], name]].dropna(subset=[name]).reset_index(drop=True)
+                column = column.infer_objects()
+                missing_value = self.phenotypes[name]["missing_value"]
+                if name in versions and not column.empty:
+                    self.store.put(self.project_name, name, versions[name], column, missing_value)
+                ret[name] = column
+            return ret
+
+        size = group_size or len(stale) or 1
+        groups = [stale[i:i + size] for i in range(0, len(stale), size)]
+        for group_columns in map_ordered(fetch, groups, max_workers):
+            columns.update(group_columns)
+
+        frames = []
+        for name, phenotype in self.phenotypes.items():
+            df = columns[name]
+            if not df.empty:
+                frames.append(df.rename(columns={df.columns[1]: phenotype["label"] or name}))
+        return self._join(frames)
+
+    def _join(self, frames: List):
+        """
+        Outer join matrices on their first column, the pn, and fill in missing values.
+        """
+        import pandas as pd
+
+        frames = [df for df in frames if not df.empty]
+        if not frames:
             return pd.DataFrame()
-        df = pd.read_csv(StringIO(tsv_data), delimiter="\t")  # type: ignore
+        key = frames[0].columns[0]
+        frames = [df.set_index(df.columns[0]).rename_axis(key) for df in frames]
+        if any(not df.index.is_unique for df in frames):
+            log.info("Phenotypes have duplicate pns, fetching the matrix in a single request")
+            return self._fetch(list(self.phenotypes.values()))
+        matrix = pd.concat(frames, axis=1, join="outer", sort=True)
+        for name, phenotype in self.phenotypes.items():
+            column = phenotype["label"] or name
+            fill_value = _parse_value(phenotype["missing_value"])
+            if column in matrix.columns and fill_value is not None:
+                matrix[column] = matrix[column].fillna(fill_value)
+        return matrix.reset_index()
+
+    def _compact(self, df):
+        """
+        Convert the phenotype columns to compact types based on their result types.
+        """
+        if df.empty:
+            return df
+        try:
+            import pyarrow  # noqa: F401
+        except ModuleNotFoundError:
+            pass
+        else:
+            pn_column = df.columns[0]
+            df[pn_column] = df[pn_column].astype("string[pyarrow]")
+        if any(name not in self.result_types for name in self.phenotypes):
+            self._get_catalog_entries()
+        for name, phenotype in self.phenotypes.items():
+            column = phenotype["label"] or name
+            if column not in df.columns:
+                continue
+            try:
+                df[column] = _compact_column(df[column], self.result_types.get(name))
+            except (TypeError, ValueError) as ex:
+                log.info("Column %s is left as %s: %s", column, df[column].dtype, ex)
         return df
+
+
+def _compact_column(values, result_type: Optional[str]):
+    import pandas as pd
+
+    if result_type == "SET":
+        present = values.dropna()
+        if pd.api.types.is_numeric_dtype(values) and present.isin([0, 1]).all():
+            return values.fillna(0).astype("uint8")
+    elif result_type == "QT":
+        if pd.api.types.is_numeric_dtype(values) and not pd.api.types.is_bool_dtype(values):
+            return values.astype("float32")
+    elif result_type == "CATEGORY":
+        return values.astype("category")
+    return values
+
+
+def _parse_value(value: Optional[str]):
+    # parse the missing value the same way it is parsed from the server response
+    if value is None or value == "":
+        return None
+    import pandas as pd
+
+    parsed = pd.read_csv(StringIO(f"value\n{value}\n"), delimiter="\t")["value"]
+    if parsed.empty or pd.isna(parsed.iloc[0]):
+        return None
+    return parsed.iloc[0]
@@ -18,11 +18,15 @@ from typing import Callable, Union, Optional, Dict, List
 
 from .exceptions import PhenotypeError
 from .phenotype_matrix import PhenotypeMatrix
+from .store import PhenotypeStore
 from ...exceptions import ServerError
 from ...session import ServiceSession
+from ...utils import map_ordered
 
 log = logging.getLogger(__name__)
 
+PLAYLIST_WORKERS = 8  # Number of phenotypes added or deleted concurrently
+
 
 class Playlist:
     """
@@ -42,10 +46,13 @@ class Playlist:
 
     """
 
-    def __init__(self, session: ServiceSession, data: Dict):
+    def __init__(
+        self, session: ServiceSession, data: Dict, store: Optional[PhenotypeStore] = None
+    ):
         self.session = session
         self.data = data
         self.links = data["links"]
+        self.store = store
 
     def __getattr__(self, name):
         try:
@@ -93,16 +100,20 @@ class Playlist:
         self.refresh()
         self.get_info()
 
-    def add_phenotypes(self, name: Union[str,List[str]]):
+    def add_phenotypes(self, name: Union[str,List[str]], max_workers: int = PLAYLIST_WORKERS):
         """
         Add phenotypes to a playlist
 
+        The phenotypes are added with up to `max_workers` concurrent requests and the
+        playlist is refreshed once when all of them have been added.
+
         :param name: A list of unique (lowercase) phenotype name in the project
+        :param max_workers: Maximum number of requests in flight at a time
         """
-        name = [name] if isinstance(name, str) else name
-        for pheno in name:
-            self.add_phenotype(pheno)
-        self.get_info()
+        url = urljoin(self.links["self"], "phenotypes")
+        self._update_phenotypes(
+            lambda pheno: self.session.post(url, json={"name": pheno}), name, max_workers
+        )
 
     def delete_phenotype(self, name: str):
         """
@@ -115,6 +126,33 @@ class Playlist:
         self.refresh()
         self.get_info()
 
+    def delete_phenotypes(self, name: Union[str, List[str]], max_workers: int = PLAYLIST_WORKERS):
+        """
+        Delete phenotypes from a playlist
+
+        The phenotypes are deleted with up to `max_workers` concurrent requests and the
+        playlist is refreshed once when all of them have been deleted.
+
+        :param name: A list of unique (lowercase) phenotype name in the project
+        :param max_workers: Maximum number of requests in flight at a time
+        :raises: `ServerError` if a phenotype could not be deleted
+        """
+        self._update_phenotypes(
+            lambda pheno: self.session.delete(urljoin(self.links["self"], "phenotypes", pheno)),
+            name,
+            max_workers,
+        )
+
+    def _update_phenotypes(self, func: Callable, name: Union[str, List[str]], max_workers: int):
+        # the service adds and deletes a single phenotype per request
+        names = [name] if isinstance(name, str) else list(dict.fromkeys(name))
+        try:
+            for _ in map_ordered(func, names, max_workers):
+                pass
+        finally:
+            # keep the local object in sync even if some of the requests failed
+            self.refresh()
+
     def get_info(self):
         """
         Get playlist info
@@ -127,11 +165,25 @@ class Playlist:
         """
         return [phenotype['name'] for phenotype in self.get_info()['phenotypes']]
 
-    def get_data(self, missing_value=None):
+    def get_data(self, missing_value=None, compact: bool = False):
         """
         Retrieve phenotype data from the server.
-        """
-        matrix = PhenotypeMatrix(self.session, project_name = self.data["project_key"])
-        matrix.add_phenotypes(names=self.list_phenotypes(), missing_value=missing_value)
-        self.df = matrix.get_data()
+
+        :param missing_value: The string to substitute for a missing value in the data
+        :param compact: Use compact column types based on the phenotype result types
+        """
+        matrix = PhenotypeMatrix(
+            self.session, project_name=self.data["project_key"], store=self.store
+        )
+        result_types = {
+            phenotype["name"]: phenotype["result_type"]
+            for phenotype in self.get_info()["phenotypes"]
+            if phenotype.get("result_type")
+        }
+        matrix.add_phenotypes(
+            names=self.list_phenotypes(),
+            missing_value=missing_value,
+            result_types=result_types,
+        )
+        self.df = matrix.get_data(compact=compact)
         return self.df
@@ -14,10 +14,12 @@ from typing import Optional, List, Union, Dict
 from ...client import Client
 from ...services import BaseService
 from ...exceptions import ServerError
+from ...utils import map_ordered
 from .exceptions import PhenotypeError
 from .phenotype import Phenotype
 from .playlist import Playlist
 from .phenotype_matrix import PhenotypeMatrix
+from .store import PhenotypeStore
 from .analysis_catalog import AnalysisCatalog
 from .analysis_catalog_run import AnalysisCatalogRun
 
@@ -27,6 +29,9 @@ log = logging.getLogger(__file__)
 
 SUPPORTED_RESULT_TYPES = ["SET", "QT", "CATEGORY"]
 
+PAGE_SIZE = 100  # Used for pagination
+PAGE_WORKERS = 8  # Number of pages fetched concurrently
+
 
 def ensure_project(func):
     def inner(self, *args, **kwargs):
@@ -38,20 +43,28 @@ def ensure_project(func):
     return inner
 
 
-def _get_paginated_results(method, limit):
-    default_batch_size = 100  # Used for pagination
-    offset = 0
-    combined_data = []
-    # Loop to fetch the entire results, combining the paginated results
-    while True:
-        batch_size = min(default_batch_size,
-                         limit - offset)  # Make sure we dont get request too many phenos in last api call
-        data = method(batch_size, offset)
-        results = len(data)
-        combined_data += data
-        offset += results
+def _get_paginated_results(method, limit, batch_size=PAGE_SIZE, max_workers=PAGE_WORKERS):
+    """
+    Combine the results of `method(batch_size, offset)` for consecutive pages until
+    `limit` results have been fetched or a page comes back with fewer results than requested.
 
-        if results < batch_size or offset >= limit:  # Stop if response smaller than requested or results (larger or) equal to limit
+    The list endpoints do not report a total, so once the first page is full the following
+    pages are requested speculatively on `max_workers` threads. Up to `2 * max_workers`
+    requests past the last page may be sent, their results are discarded.
+    """
+    def fetch(offset):
+        # Make sure we dont request too many results in the last call
+        size = min(batch_size, limit - offset)
+        return size, method(size, offset)
+
+    offsets = range(0, max(limit, 1), batch_size)
+    size, data = fetch(0)
+    combined_data = list(data)
+    if len(data) < size or len(offsets) == 1:
+        return combined_data
+    for size, data in map_ordered(fetch, offsets[1:], max_workers):
+        combined_data += data
+        if len(data) < size:  # the last page has been reached
             break
     return combined_data
 
@@ -68,15 +81,27 @@ class Service(BaseService):
     method will work and the project will be created implicitly.
 
     To view available projects use the `svc.all_projects` dict
+
+    Lists are fetched `page_size` results at a time with up to `page_workers` requests in
+    flight, both can be passed in when the service is instantiated.
+
+    Phenotype data can be kept locally between matrix requests, see `enable_store`.
     """
 
     project_name: str = ""
     project: Dict = {}
     links: Dict = {}
     all_projects: Dict = {}
+    page_size: int = PAGE_SIZE
+    page_workers: int = PAGE_WORKERS
 
     def __init__(self, client: Client, *args, **kwargs) -> None:
         super(Service, self).__init__(client, SERVICE_PATH, *args, **kwargs)
+        self.page_size = kwargs.get("page_size") or self.page_size
+        self.page_workers = kwargs.get("page_workers") or self.page_workers
+        self.store: Optional[PhenotypeStore] = None
+        if kwargs.get("store") or os.environ.get("NEXTCODE_PHENOTYPE_STORE"):
+            self.enable_store()
         self.project_name = (
             kwargs.get("project")
             or os.environ.get("GOR_API_PROJECT")
@@ -84,6 +109,32 @@ class Service(BaseService):
         )
         self.initialized = False
 
+    def enable_store(self, folder: Optional[str] = None) -> PhenotypeStore:
+        """
+        Keep phenotype data on local disk.
+
+        Phenotype matrices created by this service, including the ones used by
+        `Phenotype.get_data` and `Playlist.get_data`, only fetch the phenotypes which are
+        not stored yet or have been updated on the server since they were stored, in
+        groups of the `group_size` passed to `get_data`. The matrix is then assembled
+        locally. Matrices with a `base` are always fetched from the server.
+
+        The store can also be enabled with `store=True` when creating the service or by
+        setting the NEXTCODE_PHENOTYPE_STORE environment variable.
+
+        :param folder: Folder to store the phenotypes in (default ~/.nextcode/phenotypes)
+        :returns: The phenotype store, see `store.stats` for hit and miss counters
+        :raises: `PhenotypeError` if pandas or pyarrow are not installed
+        """
+        self.store = PhenotypeStore(folder=folder)
+        return self.store
+
+    def disable_store(self) -> None:
+        """
+        Stop using the local phenotype store. Stored phenotypes are left on disk.
+        """
+        self.store = None
+
     def set_project(self, project_name):
         self.project_name = project_name
         self._init_project()
@@ -155,7 +206,7 @@ class Service(BaseService):
         # if the project did not already exist, initialize the service
         if not self.project:
             self._init_project(self.project_name)
-        return Phenotype(self.session, data["phenotype"])
+        return Phenotype(self.session, data["phenotype"], store=self.store)
 
     @ensure_project
     def get_tags(self) -> List:
@@ -217,7 +268,7 @@ class Service(BaseService):
         )
         phenotypes = []
         for item in combined_data:
-            phenotypes.append(Phenotype(self.session, item))
+            phenotypes.append(Phenotype(self.session, item, store=self.store))
         return phenotypes
 
     @ensure_project
@@ -270,9 +321,16 @@ class Service(BaseService):
             names,
             pn_count
         )
-        matrix = PhenotypeMatrix(self.session, project_name = self.project_name)
+        matrix = PhenotypeMatrix(self.session, project_name=self.project_name, store=self.store)
         if combined_data:
-            matrix.add_phenotypes([item['name'] for item in combined_data])
+            matrix.add_phenotypes(
+                [item['name'] for item in combined_data],
+                result_types={
+                    item['name']: item['result_type']
+                    for item in combined_data
+                    if item.get('result_type')
+                },
+            )
         return matrix
 
     @ensure_project
@@ -419,7 +477,9 @@ class Service(BaseService):
                 data = resp.json()["phenotypes"]
             return data
 
-        combined_data = _get_paginated_results(do_get, limit)
+        combined_data = _get_paginated_results(
+            do_get, limit, self.page_size, self.page_workers
+        )
         return combined_data
 
     @ensure_project
@@ -446,7 +506,7 @@ class Service(BaseService):
                 raise
 
         data = resp.json()["phenotype"]
-        return Phenotype(self.session, data)
+        return Phenotype(self.session, data, store=self.store)
 
     @ensure_project
     def get_phenotype_matrix(self, base: Optional[str] = None) -> PhenotypeMatrix:
@@ -458,7 +518,9 @@ class Service(BaseService):
         :raises: `PhenotypeError` if the project does not exist
         :raises: `ServerError`
         """
-        return PhenotypeMatrix(self.session, base=base, project_name=self.project_name)
+        return PhenotypeMatrix(
+            self.session, base=base, project_name=self.project_name, store=self.store
+        )
 
     @ensure_project
     def get_categories(self) -> List:
@@ -531,7 +593,7 @@ class Service(BaseService):
             self._init_project(self.project_name)
 
         # Initialize playlist class instance
-        playlist = Playlist(self.session, data["playlist"])
+        playlist = Playlist(self.session, data["playlist"], store=self.store)
 
         # Add phenotypes to playlist if provided
         if phenotypes:
@@ -561,7 +623,7 @@ class Service(BaseService):
         data = resp.json()["playlists"]
         playlists = []
         for item in data:
-            playlists.append(Playlist(self.session, item))
+            playlists.append(Playlist(self.session, item, store=self.store))
         return playlists
 
     @ensure_project
@@ -606,7 +668,7 @@ class Service(BaseService):
             data = resp.json()['playlists'][0]
         else:
             data = resp.json()["playlist"]
-        return Playlist(self.session, data)
+        return Playlist(self.session, data, store=self.store)
 
     @ensure_project
     def get_covariates(self, limit=100):
@@ -623,7 +685,9 @@ class Service(BaseService):
             data = resp.json()['covariates']
             return data
 
-        combined_data = _get_paginated_results(do_get, limit)
+        combined_data = _get_paginated_results(
+            do_get, limit, self.page_size, self.page_workers
+        )
 
         return combined_data
 
@@ -0,0 +1,154 @@
+"""
+Phenotype store
+------------------
+
+Opt-in local store of phenotype data.
+
+Each phenotype is stored as a single column parquet file in
+~/.nextcode/phenotypes, keyed by project and phenotype name, along with the
+version of the phenotype it was fetched at. A phenotype matrix using the store only
+downloads the phenotypes which are missing or have changed on the server since they
+were stored and assembles the matrix locally.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import shutil
+import threading
+from pathlib import Path
+from typing import Dict, Optional
+
+from ... import config
+from .exceptions import PhenotypeError
+
+log = logging.getLogger(__name__)
+
+
+def phenotype_version(data: Dict) -> str:
+    """
+    Describe the version of a phenotype's data from its serverside response
+    """
+    versions = data.get("versions") or []
+    latest = max((v.get("version") or 0 for v in versions), default=None)
+    return json.dumps([data.get("updated_at"), latest])
+
+
+class PhenotypeStore:
+    """
+    On-disk store of phenotype columns.
+
+    :param folder: Folder to store the phenotypes in (default ~/.nextcode/phenotypes)
+    :raises: `PhenotypeError` if pandas or pyarrow are not installed
+    """
+
+    def __init__(self, folder: Optional[str] = None):
+        try:
+            import pandas  # noqa: F401
+            import pyarrow  # noqa: F401
+        except ModuleNotFoundError:
+            raise PhenotypeError(
+                "The phenotype store requires the pandas and pyarrow libraries"
+            )
+        self.folder = Path(folder or config.root_config_folder.joinpath("phenotypes"))
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return f"<PhenotypeStore {self.folder} ({self.hits} hits, {self.misses} misses)>"
+
+    @property
+    def stats(self) -> Dict:
+        """
+        Hit and miss counters of phenotype lookups
+        """
+        return {"hits": self.hits, "misses": self.misses}
+
+    def _file(self, project_name: str, name: str, missing_value: Optional[str]) -> Path:
+        key = hashlib.sha256(json.dumps([name, missing_value]).encode()).hexdigest()
+        project = hashlib.sha256(project_name.encode()).hexdigest()[:16]
+        return self.folder.joinpath(project, f"{key}.parquet")
+
+    def get(
+        self,
+        project_name: str,
+        name: str,
+        version: str,
+        missing_value: Optional[str] = None,
+    ):
+        """
+        Read a stored phenotype.
+
+        :returns: DataFrame with the pn and phenotype columns or None if the phenotype
+            is not stored at `version`
+        """
+        import pyarrow.parquet as pq
+
+        filename = self._file(project_name, name, missing_value)
+        try:
+            table = pq.read_table(filename)
+        except (FileNotFoundError, OSError):
+            table = None
+        metadata = (table.schema.metadata or {}) if table is not None else {}
+        found = metadata.get(b"nextcode.version", b"").decode() == version
+        with self._lock:
+            if found:
+                self.hits += 1
+            else:
+                self.misses += 1
+        if not found:
+            return None
+        return table.to_pandas()
+
+    def put(
+        self,
+        project_name: str,
+        name: str,
+        version: str,
+        df,
+        missing_value: Optional[str] = None,
+    ) -> None:
+        """
+        Store a phenotype fetched at `version`.
+
+        :param df: DataFrame with the pn and phenotype columns
+        """
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        filename = self._file(project_name, name, missing_value)
+        os.makedirs(filename.parent, exist_ok=True)
+        try:
+            table = pa.Table.from_pandas(df, preserve_index=False)
+        except (pa.ArrowInvalid, pa.ArrowTypeError) as ex:
+            log.info("Phenotype %s cannot be stored locally: %s", name, ex)
+            return
+        metadata = dict(table.schema.metadata or {})
+        metadata[b"nextcode.version"] = version.encode()
+        table = table.replace_schema_metadata(metadata)
+        tmp_file = filename.with_name(
+            f"{filename.name}.{os.getpid()}.{threading.get_ident()}.tmp"
+        )
+        try:
+            pq.write_table(table, tmp_file)
+            os.replace(tmp_file, filename)
+        finally:
+            if tmp_file.exists():
+                os.remove(tmp_file)
+
+    def remove(self, project_name: str, name: str, missing_value: Optional[str] = None) -> None:
+        """
+        Remove a stored phenotype
+        """
+        try:
+            os.remove(self._file(project_name, name, missing_value))
+        except FileNotFoundError:
+            pass
+
+    def clear(self) -> None:
+        """
+        Remove all stored phenotypes
+        """
+        shutil.rmtree(self.folder, ignore_errors=True)
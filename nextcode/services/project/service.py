@@ -14,9 +14,6 @@ from ...exceptions import NotFound, ServerError
 from .exceptions import ProjectError
 from ...utils import jupyter_available
 
-import boto3
-from botocore.client import Config as BotoConfig
-
 import logging
 
 SERVICE_PATH = "api/project"
@@ -267,6 +264,9 @@ class Service(BaseService):
 
     def get_project_bucket(self):
         self._check_project()
+        import boto3
+        from botocore.client import Config as BotoConfig
+
         credentials = self.get_credentials()
         s3 = boto3.resource(
             "s3",
@@ -0,0 +1,255 @@
+"""
+Result cache
+------------------
+
+Opt-in on-disk cache for query results.
+
+Results are stored in ~/.nextcode/results, outside of the folder which
+`config.clear_cache` empties, keyed by a fingerprint of the
+server, the project, the normalized query text, the fingerprints of the virtual relations and
+the build version of the query service. Entries expire after a configurable time
+and the least recently used entries are evicted when the cache grows beyond its
+size limit.
+
+Each entry consists of a small json metadata file holding the serverside query
+response and one gzipped blob per result format (tsv or compact json) which
+are written as the results are downloaded.
+"""
+
+import gzip
+import hashlib
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, List, Optional, IO, Iterator
+
+from ... import config
+
+log = logging.getLogger(__name__)
+
+DEFAULT_MAX_BYTES = 1024 * 1024 * 1024
+DEFAULT_TTL_SECONDS = 24 * 60 * 60
+
+
+def normalize_query(query: str) -> str:
+    """
+    Normalize a gor query string for cache lookups.
+
+    Surrounding whitespace, blank lines and trailing semicolons are ignored
+    while whitespace inside each line is kept as is.
+    """
+    lines = [line.strip() for line in query.strip().rstrip(";").splitlines()]
+    return "\n".join(line for line in lines if line)
+
+
+class ResultCache:
+    """
+    Size-bounded, time limited on-disk cache of query results.
+
+    :param folder: Folder to store the cache in (default ~/.nextcode/results)
+    :param max_bytes: Maximum total size of the cached results
+    :param ttl: Number of seconds a cache entry is valid for
+    """
+
+    def __init__(
+        self,
+        folder: Optional[Path] = None,
+        max_bytes: int = DEFAULT_MAX_BYTES,
+        ttl: int = DEFAULT_TTL_SECONDS,
+    ):
+        self.folder = Path(
+            folder or config.root_config_folder.joinpath("results")
+        )
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return f"<ResultCache {self.folder} ({self.hits} hits, {self.misses} misses)>"
+
+    @staticmethod
+    def make_key(
+        server: str,
+        project: Optional[str],
+        query: str,
+        relations: List[Dict],
+        version: Optional[str],
+    ) -> str:
+        """
+        Create a cache key for a query.
+
+        :param server: Root url of the query service the query runs on
+        :param project: Name of the project the query runs in
+        :param query: gor query string
+        :param relations: virtual relation payloads as sent to the server
+        :param version: Build version of the query service
+        """
+        fingerprints = sorted((r["name"], r["fingerprint"]) for r in relations)
+        contents = json.dumps(
+            [server, project, normalize_query(query), fingerprints, version]
+        )
+        return hashlib.sha256(contents.encode()).hexdigest()
+
+    def _meta_file(self, key: str) -> Path:
+        return self.folder.joinpath(f"{key}.json")
+
+    def _blob_file(self, key: str, kind: str) -> Path:
+        return self.folder.joinpath(f"{key}.{kind}.gz")
+
+    @property
+    def stats(self) -> Dict:
+        """
+        Hit and miss counters of query lookups along with the current cache size
+        """
+        return {"hits": self.hits, "misses": self.misses, "bytes": self.size()}
+
+    def get(self, key: str) -> Optional[Dict]:
+        """
+        Look up the serverside query response stored for a cache key.
+
+        :returns: The query response or None if there is no valid entry
+        """
+        meta_file = self._meta_file(key)
+        try:
+            with meta_file.open() as f:
+                meta = json.load(f)
+        except (FileNotFoundError, ValueError):
+            meta = None
+        if meta and time.time() - meta["created"] > self.ttl:
+            log.info("Cached results for %s have expired", key)
+            self.remove(key)
+            meta = None
+        with self._lock:
+            if meta is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        self._touch(key)
+        return meta["query"]
+
+    def put(self, key: str, query: Dict) -> None:
+        """
+        Store the serverside query response for a cache key.
+        """
+        os.makedirs(self.folder, exist_ok=True)
+        meta_file = self._meta_file(key)
+        tmp_file = meta_file.with_name(f"{meta_file.name}.{os.getpid()}.tmp")
+        with tmp_file.open("w") as f:
+            json.dump({"created": time.time(), "query": query}, f, default=str)
+        os.replace(tmp_file, meta_file)
+
+    def open(self, key: str, kind: str) -> Optional[IO[bytes]]:
+        """
+        Open a cached result blob for reading.
+
+        :param kind: Format of the results, e.g. `tsv` or `json`
+        :returns: Binary file object with the uncompressed contents or None if not cached
+        """
+        if not self._meta_file(key).exists():
+            return None
+        try:
+            f = gzip.open(self._blob_file(key, kind), "rb")
+        except FileNotFoundError:
+            return None
+        self._touch(key)
+        log.info("Reading %s results from cache %s", kind, key)
+        return f
+
+    @contextmanager
+    def writer(self, key: str, kind: str) -> Iterator[IO[bytes]]:
+        """
+        Write a result blob into the cache.
+
+        The blob only becomes visible once the block exits without an exception.
+        """
+        os.makedirs(self.folder, exist_ok=True)
+        blob_file = self._blob_file(key, kind)
+        tmp_file = blob_file.with_name(
+            f"{blob_file.name}.{os.getpid()}.{threading.get_ident()}.tmp"
+        )
+        try:
+            with gzip.open(tmp_file, "wb", compresslevel=1) as f:
+                yield f
+            os.replace(tmp_file, blob_file)
+        finally:
+            if tmp_file.exists():
+                os.remove(tmp_file)
+        log.info("Stored %s results in cache %s", kind, key)
+        self.evict()
+
+    def put_file(self, key: str, kind: str, filename: str) -> None:
+        """
+        Copy a local file into the cache as a result blob.
+        """
+        with open(filename, "rb") as src, self.writer(key, kind) as dst:
+            shutil.copyfileobj(src, dst, 1024 * 1024)
+
+    def remove(self, key: str) -> None:
+        """
+        Remove an entry and all its result blobs from the cache.
+        """
+        for path in self.folder.glob(f"{key}.*"):
+            if path.suffix == ".tmp":
+                continue
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def size(self) -> int:
+        """
+        Total size of the cached files in bytes
+        """
+        try:
+            return sum(p.stat().st_size for p in self.folder.iterdir())
+        except FileNotFoundError:
+            return 0
+
+    def evict(self) -> None:
+        """
+        Remove the least recently used entries until the cache fits in `max_bytes`.
+        """
+        entries: Dict[str, List] = {}
+        try:
+            paths = list(self.folder.iterdir())
+        except FileNotFoundError:
+            return
+        for path in paths:
+            if path.suffix == ".tmp":
+                continue
+            key = path.name.split(".", 1)[0]
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            entry = entries.setdefault(key, [0.0, 0])
+            if path.name == f"{key}.json":
+                entry[0] = stat.st_mtime
+            entry[1] += stat.st_size
+        total = sum(size for _, size in entries.values())
+        for key, (_, size) in sorted(entries.items(), key=lambda e: e[1][0]):
+            if total <= self.max_bytes:
+                break
+            log.info("Evicting %s from result cache", key)
+            self.remove(key)
+            total -= size
+
+    def clear(self) -> None:
+        """
+        Remove all cached results
+        """
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+    def _touch(self, key: str) -> None:
+        # the modification time of the metadata file records the last access
+        try:
+            os.utime(self._meta_file(key))
+        except FileNotFoundError:
+            pass
@@ -11,22 +11,44 @@ Note that the object is dynamic and some of the attributes available are not
 documented here because they are added from the server response.
 """
 
+import itertools
+import json
 import logging
+import shutil
+import threading
 import time
-from typing import Dict, Tuple, Sequence, List, Optional, Union, Callable
+from typing import (
+    Dict,
+    Tuple,
+    Sequence,
+    List,
+    Optional,
+    Union,
+    Callable,
+    Iterator,
+)
 from dateutil.parser import parse
+from requests import Response
+from requests.exceptions import RequestException
 import os
 
-from io import StringIO
-
+from ...exceptions import ServerError
+from .cache import ResultCache
 from .exceptions import QueryError
-from ...utils import jupyter_available
+from .utils import read_tsv, read_arrow, write_parquet
+from ...utils import jupyter_available, map_ordered
+from ...wait import WaitStrategy, default_strategy
 
 SERVICE_PATH = "/api/query"
 
 RUNNING_STATUSES = ("PENDING", "RUNNING", "CANCELLING")
 FAILED_STATUSES = ("CANCELLING", "CANCELLED", "FAILED")
 RESULTS_PAGE_SIZE = 1000000
+RESULTS_BATCH_SIZE = 10000
+CACHE_READ_SIZE = 1024 * 1024
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+DOWNLOAD_RETRIES = 3
+DOWNLOAD_PROGRESS_BYTES = 8 * 1024 * 1024
 
 log = logging.getLogger(__name__)
 
@@ -52,6 +74,17 @@ def _log_download_progress(
         log.info(msg)
 
 
+def _iter_file(f, limit: Optional[int] = None) -> Iterator[bytes]:
+    """
+    Iterate through a cached tsv file, optionally only the header and first `limit` rows.
+    """
+    with f:
+        if limit:
+            yield from itertools.islice(f, limit + 1)
+        else:
+            yield from iter(lambda: f.read(CACHE_READ_SIZE), b"")
+
+
 class Query:
     """
     A local proxy representing a serverside Gor Query.
@@ -70,15 +103,20 @@ class Query:
     """
 
     raw: Dict = {}
+    result_header: Optional[List[str]] = None
+    cache_key: Optional[str] = None
+    cache_payload: Optional[Dict] = None
     query_id = None
     url = None
     duration = None
     query = None
     status = None
+    partial = False
 
-    def __init__(self, service, resp: Optional[Dict] = None):
+    def __init__(self, service, resp: Optional[Dict] = None, partial: bool = False):
         self.service = service
         self.session = service.session
+        self.partial = partial
         if resp:
             self.init_from_resp(resp)
 
@@ -88,7 +126,8 @@ class Query:
         If the response is a 'simple query', e.g. from the queries list
         the object will only contain partial information.
         If the caller requests a field that is not included in the local proxy object
-        the query will be refreshed from the server.
+        the query will be refreshed from the server, unless the object was created
+        with `partial=True`.
         """
         # make sure the url is set
 
@@ -110,6 +149,8 @@ class Query:
     def __getattr__(self, name):
         # if we cannot find the attribute we refresh the query from the server
         # just in case we have a partial object
+        if self.partial:
+            raise AttributeError(name)
         self.refresh()
         if name in self.__dict__:
             return self.__dict__[name]
@@ -121,8 +162,7 @@ class Query:
         """
         Is the query currently running
         """
-        if self.status in RUNNING_STATUSES:
-            self.refresh()
+        self._refresh_running()
         return self.status in RUNNING_STATUSES
 
     @property
@@ -130,8 +170,7 @@ class Query:
         """
         Is the query in a failed state
         """
-        if self.status in RUNNING_STATUSES:
-            self.refresh()
+        self._refresh_running()
         return self.status in FAILED_STATUSES
 
     @property
@@ -139,8 +178,7 @@ class Query:
         """
         Is the query in the DONE state
         """
-        if self.status in RUNNING_STATUSES:
-            self.refresh()
+        self._refresh_running()
         return self.status == "DONE"
 
     @property
@@ -154,31 +192,46 @@ class Query:
         ret = [p["name"] for p in perspective_links]
         return ret
 
-    def wait(self, max_seconds: Optional[int] = None, poll_period: float = 0.5):
+    def wait(
+        self,
+        max_seconds: Optional[int] = None,
+        poll_period: float = 0.5,
+        strategy: Optional[WaitStrategy] = None,
+    ):
         """
         Wait for the query to complete
 
         :param max_seconds: raise an exception if the query runs longer than this
         :param poll_period: Number of seconds to wait between polling (max 10 seconds)
+        :param strategy: How to wait between status checks, see :mod:`nextcode.wait`.
+                         By default the status is polled with a linear back-off.
 
         :raises: QueryError
         """
         if not self.running:
             return self
         log.info("Waiting for query %s to complete...", self.query_id)
+        strategy = strategy or default_strategy(poll_period)
+        strategy.start()
         start_time = time.time()
         duration = 0.0
-        period = poll_period
         is_running = self.running
         while is_running:
-            time.sleep(period)
+            timeout = max_seconds - duration if max_seconds else None
+            resp = strategy.pause(self.session, self.raw["links"], self.status, timeout)
             duration = time.time() - start_time
-            is_running = self.running
+            if resp:
+                self.init_from_resp(resp)
+                is_running = self.status in RUNNING_STATUSES
+            else:
+                # partial objects do not refresh their status implicitly
+                if self.partial:
+                    self._refresh_running(force=True)
+                is_running = self.running
             if is_running and max_seconds and duration > max_seconds:
                 raise QueryError(
                     f"Query {self.query_id} has exceeded wait time {max_seconds}s and we will not wait any longer. It is currently {self.status}."
                 )
-            period = min(period + 0.5, 10.0)
         if self.status == "DONE":
             log.info(
                 "Query %s completed in %.2f sec and generated %s rows",
@@ -195,6 +248,12 @@ class Query:
             )
         return self
 
+    def _refresh_running(self, force: bool = False) -> None:
+        # a running query is refreshed to get its current status, partial
+        # objects are only refreshed when explicitly asked to
+        if self.status in RUNNING_STATUSES and (force or not self.partial):
+            self.refresh()
+
     def refresh(self):
         """
         Refresh the local query object from the RESTful service
@@ -205,15 +264,58 @@ class Query:
         self.init_from_resp(resp.json())
         return self
 
-    def download_results(self, filename, callback=None):
+    def _resubmit_cached(self) -> None:
+        """
+        Run a query which was found in the result cache again on the server.
+
+        The links of a cached query may point to results which the server no longer has,
+        so results which are not in the cache are fetched from a fresh run.
+        """
+        if not self.cache_payload:
+            return
+        payload, self.cache_payload = self.cache_payload, None
+        log.info("Results of query %s are not cached, running it again", self.query_id)
+        self.init_from_resp(self.service._submit(payload))
+        self.wait()
+
+    def download_results(
+        self,
+        filename,
+        callback=None,
+        resumable: bool = False,
+        max_workers: int = 1,
+    ):
         """
         Download the entire results for the query to a local file in a single call
         via streaming.
+
+        In resumable mode the results are downloaded in ranges of rows through the paged
+        result endpoint and the progress is recorded in a `[filename].progress` sidecar file.
+        A dropped connection is resumed from the last complete line, both automatically and
+        when the download is restarted after a failure. With `max_workers` larger than one the
+        ranges are downloaded concurrently and assembled into the file once all are complete.
+
         :param filename: Local filename to save results to
+        :param callback: called with the number of lines received in each chunk
+        :param resumable: download in resumable ranges of rows
+        :param max_workers: number of ranges to download concurrently (implies resumable)
         :raises: QueryError if data is missing.
         """
         filename = os.path.expanduser(filename)
         start_time = time.time()
+        cache = self._result_cache()
+        f = cache.open(self.cache_key, "tsv") if cache else None
+        if f is not None:
+            with f, open(filename, "wb") as out:
+                shutil.copyfileobj(f, out, CACHE_READ_SIZE)
+            return filename
+        self._resubmit_cached()
+        if resumable or max_workers > 1:
+            self._download_ranges(filename, callback, max_workers)
+            if cache is not None:
+                cache.put(self.cache_key, self.raw)
+                cache.put_file(self.cache_key, "tsv", filename)
+            return filename
         try:
             url = self.links["streamresults"]
         except KeyError:
@@ -260,100 +362,417 @@ class Query:
             raise QueryError(
                 f"Downloaded {total_received_lines} lines but {total_expected_lines} lines expected"
             )
+        if cache is not None:
+            cache.put(self.cache_key, self.raw)
+            cache.put_file(self.cache_key, "tsv", filename)
         return filename
 
-    def get_results(
-        self,
-        limit: Optional[int] = None,
-        offset: Optional[int] = None,
-        sort: Optional[str] = None,
-        filt: Optional[str] = None,
-        perspective: Optional[str] = None,
-        is_json: bool = True,
-        callback: Optional[Callable] = None,
-    ) -> Union[Dict, str]:
+    def _download_ranges(
+        self, filename: str, callback: Optional[Callable], max_workers: int
+    ) -> None:
         """
-        Returns results from a completed query, optionally with limit and offset
+        Download the results in resumable ranges of rows, see `download_results`.
+        """
+        self._check_results_available()
+        url = self.links["result"]
+        start_time = time.time()
+        num_rows = self.line_count or 0
+        progress_file = f"{filename}.progress"
+        state: Dict = {
+            "query_id": self.query_id,
+            "line_count": num_rows,
+            "page_size": RESULTS_PAGE_SIZE,
+            "ranges": {},
+        }
+        try:
+            with open(progress_file) as f:
+                saved = json.load(f)
+            if all(saved.get(k) == state[k] for k in ("query_id", "line_count", "page_size")):
+                log.info("Resuming download of query %s into %s", self.query_id, filename)
+                state = saved
+        except (FileNotFoundError, ValueError):
+            pass
+        lock = threading.Lock()
+
+        def save_progress():
+            with lock:
+                contents = json.dumps(state)
+            tmp_file = f"{progress_file}.{threading.get_ident()}.tmp"
+            with open(tmp_file, "w") as f:
+                f.write(contents)
+            os.replace(tmp_file, progress_file)
+
+        def download_range(offset: int) -> str:
+            part_file = f"{filename}.part{offset}"
+            num_rows_expected = min(RESULTS_PAGE_SIZE, num_rows - offset)
+            with lock:
+                progress = state["ranges"].setdefault(
+                    str(offset), {"rows": 0, "bytes": 0, "header": offset > 0}
+                )
+                part_size = os.path.getsize(part_file) if os.path.exists(part_file) else 0
+                if part_size < progress["bytes"]:
+                    progress.update({"rows": 0, "bytes": 0, "header": offset > 0})
+            attempt = 0
+            while progress["rows"] < num_rows_expected or not progress["header"]:
+                num_bytes_before = progress["bytes"]
+                try:
+                    self._download_range(
+                        url,
+                        part_file,
+                        offset,
+                        num_rows_expected,
+                        progress,
+                        lock,
+                        callback,
+                        save_progress,
+                    )
+                    if progress["bytes"] == num_bytes_before:
+                        raise QueryError(
+                            f"Downloaded {progress['rows']} rows from offset {offset} but {num_rows_expected} rows expected"
+                        )
+                except (RequestException, ServerError) as ex:
+                    attempt += 1
+                    if attempt > DOWNLOAD_RETRIES:
+                        raise
+                    log.warning(
+                        "Download of rows from %s failed (%s), resuming at row %s",
+                        offset,
+                        ex,
+                        offset + progress["rows"],
+                    )
+                finally:
+                    save_progress()
+            return part_file
 
-        :param limit: number of rows to return (default all)
-        :param offset: number of rows to skip
-        :param sort: gor sort string in format '[column] [ASC|DESC]'
-        :param filt: filter to apply to the results serverside
-        :param perspective: perspective name to apply to results (for template queries)
-        :param is_json: return rows as a dictionary containing 'header' and 'data'
-        :returns: dictonary containing 'header' and 'data' lists or tsv
-        :raises: QueryError
+        if num_rows > RESULTS_PAGE_SIZE:
+            log.info(
+                "Downloading %s rows in ranges of %s rows with %s workers...",
+                num_rows,
+                RESULTS_PAGE_SIZE,
+                max_workers,
+            )
+        # the first range is always fetched so that the header is written for empty results
+        offsets = range(0, max(num_rows, 1), RESULTS_PAGE_SIZE)
+        part_files = list(map_ordered(download_range, offsets, max_workers))
+
+        # the byte offset of a range in the file is only known once the ranges before it
+        # have been downloaded, so the ranges are kept in part files and appended in order
+        # to the first one, which becomes the final file
+        total_bytes = sum(os.path.getsize(p) for p in part_files)
+        os.replace(part_files[0], filename)
+        with open(filename, "ab") as out:
+            for part_file in part_files[1:]:
+                with open(part_file, "rb") as f:
+                    shutil.copyfileobj(f, out, DOWNLOAD_CHUNK_SIZE)
+                os.remove(part_file)
+        if os.path.exists(progress_file):
+            os.remove(progress_file)
+        log.info(
+            "Downloaded %s rows (%.2f MB) in %.2f sec",
+            num_rows,
+            total_bytes / 1024 / 1024,
+            time.time() - start_time,
+        )
 
+    def _download_range(
+        self,
+        url: str,
+        part_file: str,
+        offset: int,
+        num_rows_expected: int,
+        progress: Dict,
+        lock: threading.Lock,
+        callback: Optional[Callable],
+        save_progress: Callable,
+    ) -> None:
+        """
+        Download the remaining rows of a range, appending complete lines to the part file.
+
+        The progress is saved every `DOWNLOAD_PROGRESS_BYTES` once the lines written so far
+        have reached the disk, so a download that is killed outright is resumed close to
+        where it stopped.
+        """
+        data = {
+            "limit": num_rows_expected - progress["rows"],
+            "offset": offset + progress["rows"],
+            "skipheader": progress["header"],
+        }
+        mode = "r+b" if os.path.exists(part_file) else "wb"
+        with open(part_file, mode) as f:
+            f.truncate(progress["bytes"])
+            f.seek(progress["bytes"])
+            with self.session.get(
+                url,
+                json=data,
+                headers={"Accept": "text/tab-separated-values"},
+                stream=True,
+            ) as r:
+                pending = b""
+                saved_bytes = progress["bytes"]
+                for chunk in r.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+                    lines, sep, pending = (pending + chunk).rpartition(b"\n")
+                    if sep:
+                        self._write_lines(f, lines + sep, progress, lock, callback)
+                    if progress["bytes"] - saved_bytes >= DOWNLOAD_PROGRESS_BYTES:
+                        os.fsync(f.fileno())
+                        save_progress()
+                        saved_bytes = progress["bytes"]
+                # a partial line at the end is only kept if it is the last line of the range,
+                # otherwise the response was cut short and the range is resumed from it
+                if progress["header"]:
+                    last_line = progress["rows"] + 1 == num_rows_expected
+                else:
+                    last_line = num_rows_expected == 0
+                if pending and last_line:
+                    self._write_lines(f, pending + b"\n", progress, lock, callback)
+
+    @staticmethod
+    def _write_lines(f, lines: bytes, progress: Dict, lock, callback) -> None:
+        f.write(lines)
+        f.flush()
+        num_lines = lines.count(b"\n")
+        with lock:
+            if not progress["header"]:
+                progress["header"] = True
+                num_lines -= 1
+            progress["rows"] += num_lines
+            progress["bytes"] += len(lines)
+        if callback:
+            callback(num_lines)
+
+    def _check_results_available(self) -> None:
+        """
+        :raises: QueryError if the query has not completed or its results are not available
         """
-        start_time = time.time()
-        url = self.links["result"]
         if self.status != "DONE":
             raise QueryError(f"Query {self.query_id} is {self.status}")
         if not self.available:
             raise QueryError(
                 f"Query results for query {self.query_id} are not available"
             )
-        accept = "application/json+compact" if is_json else "text/tab-separated-values"
 
-        responses = []
+    def _iter_result_pages(
+        self,
+        accept: str,
+        limit: Optional[int] = None,
+        sort: Optional[str] = None,
+        filt: Optional[str] = None,
+        perspective: Optional[str] = None,
+        max_workers: int = 1,
+        callback: Optional[Callable] = None,
+    ) -> Iterator[Response]:
+        """
+        Fetch the results of a completed query page by page and yield the responses in offset order.
+
+        The offset of every page is known upfront from `line_count` so when `max_workers` is larger
+        than one the pages are requested concurrently. At most `max_workers * 2` pages are in flight
+        or waiting to be consumed at any time so memory stays bounded for very large results.
+
+        :raises: QueryError
+        """
+        self._resubmit_cached()
+        url = self.links["result"]
+        self._check_results_available()
         num_rows_total = self.line_count or 0
         num_rows_to_fetch = num_rows_total
         if limit:
             num_rows_to_fetch = min(num_rows_total, limit)
-        num_rows_received = 0
-        skip_header = False
         if num_rows_to_fetch > RESULTS_PAGE_SIZE:
             log.info(
-                "Requesting %s rows in %s rows per page...",
+                "Requesting %s rows in %s rows per page with %s workers...",
                 num_rows_to_fetch,
                 min(RESULTS_PAGE_SIZE, num_rows_to_fetch),
+                max_workers,
             )
-        while num_rows_received < num_rows_to_fetch:
-            num_rows_remaining = num_rows_to_fetch - num_rows_received
-            num_rows_to_fetch_this_time = min(num_rows_remaining, RESULTS_PAGE_SIZE)
+
+        def fetch_page(offset: int) -> Tuple[Response, int]:
+            num_rows_this_time = min(num_rows_to_fetch - offset, RESULTS_PAGE_SIZE)
             data = {
-                "limit": num_rows_to_fetch_this_time,
-                "offset": num_rows_received,
+                "limit": num_rows_this_time,
+                "offset": offset,
                 "sort": sort,
-                "skipheader": skip_header,
+                "skipheader": offset > 0,
                 "filt": filt,
                 "perspective": perspective,
             }
-            skip_header = True
             st = time.time()
             resp = self.session.get(url, json=data, headers={"Accept": accept})
-            diff = time.time() - st
-            num_rows_received += num_rows_to_fetch_this_time
-            responses.append(resp)
             log.debug(
-                "Fetched %s rows this time in %.1fsec. Received %s/%s rows",
-                num_rows_to_fetch_this_time,
-                diff,
-                num_rows_received,
-                num_rows_to_fetch,
+                "Fetched %s rows at offset %s in %.1fsec",
+                num_rows_this_time,
+                offset,
+                time.time() - st,
             )
+            return resp, num_rows_this_time
+
+        offsets = range(0, num_rows_to_fetch, RESULTS_PAGE_SIZE)
+        num_rows_received = 0
+        for resp, num_rows_this_time in map_ordered(fetch_page, offsets, max_workers):
+            num_rows_received += num_rows_this_time
+            log.debug("Received %s/%s rows", num_rows_received, num_rows_to_fetch)
             if callback:
                 callback(received=num_rows_received, total=num_rows_total)
-        ret: Union[Dict, str]
-        if is_json:
-            ret = {}
-            for r in responses:
-                contents = r.json()
-                if "data" not in ret:
-                    ret["header"] = contents["header"]
-                    ret["data"] = []
-                ret["data"].extend(contents["data"])
-        else:
-            ret = ""
-            for r in responses:
-                ret += r.text
+            yield resp
+
+    def get_results(
+        self,
+        limit: Optional[int] = None,
+        offset: Optional[int] = None,
+        sort: Optional[str] = None,
+        filt: Optional[str] = None,
+        perspective: Optional[str] = None,
+        is_json: bool = True,
+        callback: Optional[Callable] = None,
+        max_workers: int = 1,
+    ) -> Union[Dict, str]:
+        """
+        Returns results from a completed query, optionally with limit and offset
+
+        :param limit: number of rows to return (default all)
+        :param offset: number of rows to skip
+        :param sort: gor sort string in format '[column] [ASC|DESC]'
+        :param filt: filter to apply to the results serverside
+        :param perspective: perspective name to apply to results (for template queries)
+        :param is_json: return rows as a dictionary containing 'header' and 'data'
+        :param callback: called with `received` and `total` row counts as each page arrives
+        :param max_workers: number of result pages to fetch concurrently (default 1)
+        :returns: dictonary containing 'header' and 'data' lists or tsv
+        :raises: QueryError
+
+        """
+        start_time = time.time()
+        if not is_json:
+            chunks = self._iter_tsv(
+                limit=limit,
+                sort=sort,
+                filt=filt,
+                perspective=perspective,
+                max_workers=max_workers,
+                callback=callback,
+            )
+            return b"".join(chunks).decode("utf-8")
+
+        cache = self._result_cache(sort, filt, perspective)
+        f = cache.open(self.cache_key, "json") if cache else None
+        if f is not None:
+            with f:
+                ret = json.load(f)
+            if limit:
+                ret["data"] = ret["data"][:limit]
+            return ret
+
+        pages = self._iter_result_pages(
+            "application/json+compact",
+            limit=limit,
+            sort=sort,
+            filt=filt,
+            perspective=perspective,
+            max_workers=max_workers,
+            callback=callback,
+        )
+        ret = {}
+        for r in pages:
+            contents = r.json()
+            if "data" not in ret:
+                ret["header"] = contents["header"]
+                ret["data"] = []
+            ret["data"].extend(contents["data"])
         log.info(
-            "Retrieved %s rows from server in %.2f sec",
-            num_rows_received,
+            "Retrieved results for query %s from server in %.2f sec",
+            self.query_id,
             (time.time() - start_time),
         )
+        if cache and self._is_complete(limit):
+            with cache.writer(self.cache_key, "json") as f:
+                f.write(json.dumps(ret).encode())
+                cache.put(self.cache_key, self.raw)
         return ret
 
+    def iter_batches(
+        self,
+        batch_size: int = RESULTS_BATCH_SIZE,
+        limit: Optional[int] = None,
+        sort: Optional[str] = None,
+        filt: Optional[str] = None,
+        perspective: Optional[str] = None,
+        max_workers: int = 1,
+        callback: Optional[Callable] = None,
+    ) -> Iterator[List[List]]:
+        """
+        Iterate through the results of a completed query in batches of rows.
+
+        Each result page is parsed as it arrives and released as soon as its rows
+        have been handed out, so arbitrarily large results can be processed in
+        roughly constant memory. Rows are lists of typed values in column order,
+        the column names are available in `result_header` once the first batch
+        has been yielded.
+
+        :param batch_size: maximum number of rows in each batch
+        :param limit: number of rows to return (default all)
+        :param sort: gor sort string in format '[column] [ASC|DESC]'
+        :param filt: filter to apply to the results serverside
+        :param perspective: perspective name to apply to results (for template queries)
+        :param max_workers: number of result pages to fetch concurrently (default 1)
+        :param callback: called with `received` and `total` row counts as each page arrives
+        :raises: QueryError
+        """
+        cache = self._result_cache(sort, filt, perspective)
+        f = cache.open(self.cache_key, "json") if cache else None
+        if f is not None:
+            with f:
+                contents = json.load(f)
+            self.result_header = contents["header"]
+            data = contents["data"][:limit] if limit else contents["data"]
+            for i in range(0, len(data), batch_size):
+                yield data[i : i + batch_size]
+            return
+
+        pages = self._iter_result_pages(
+            "application/json+compact",
+            limit=limit,
+            sort=sort,
+            filt=filt,
+            perspective=perspective,
+            max_workers=max_workers,
+            callback=callback,
+        )
+        batch: List[List] = []
+        for resp in pages:
+            contents = resp.json()
+            del resp
+            if self.result_header is None:
+                self.result_header = contents["header"]
+            data = contents.pop("data")
+            start = 0
+            if batch:
+                # top up the batch left over from the previous page
+                start = batch_size - len(batch)
+                batch.extend(data[:start])
+                if len(batch) < batch_size:
+                    continue
+                yield batch
+                batch = []
+            for i in range(start, len(data), batch_size):
+                chunk = data[i : i + batch_size]
+                if len(chunk) < batch_size:
+                    batch = chunk
+                    break
+                yield chunk
+            del data
+        if batch:
+            yield batch
+
+    def iter_rows(self, **kw) -> Iterator[List]:
+        """
+        Iterate through the results of a completed query one row at a time.
+
+        Accepts the same keyword arguments as `iter_batches`.
+
+        :raises: QueryError
+        """
+        for batch in self.iter_batches(**kw):
+            yield from batch
+
     def cancel(self):
         """
         Cancel a running query
@@ -364,20 +783,131 @@ class Query:
             raise QueryError("Query is not running")
         self.session.delete(self.url)
 
-    def dataframe(self, limit: Optional[int] = None):
+    def dataframe(
+        self,
+        limit: Optional[int] = None,
+        dtype: Optional[Dict] = None,
+        max_workers: int = 1,
+    ):
         """
         Return a Pandas dataframe object containing the results of this query
 
+        The raw bytes of each result page are fed straight into the csv parser
+        without building the whole result as one string first.
+
         :param limit: Maximum number of rows to return (default all)
+        :param dtype: Optional dictionary of column name to dtype, e.g. `{"Chrom": "category"}`
+        :param max_workers: number of result pages to fetch concurrently (default 1)
         :raises QueryError: If the pandas library is not installed
         :return: Pandas dataframe object
         """
         if not jupyter_available():
             raise QueryError("Pandas library is not installed")
-        tsv_data = self.get_results(is_json=False, limit=limit)
-        import pandas as pd
+        return read_tsv(self._iter_tsv(limit=limit, max_workers=max_workers), dtype=dtype)
+
+    def _result_cache(
+        self,
+        sort: Optional[str] = None,
+        filt: Optional[str] = None,
+        perspective: Optional[str] = None,
+    ) -> Optional[ResultCache]:
+        """
+        The result cache of the service if results of this query can be cached.
+
+        Only the plain results are cached, not sorted, filtered or perspective views.
+        """
+        if not self.cache_key or sort or filt or perspective:
+            return None
+        return getattr(self.service, "cache", None)
+
+    def _is_complete(self, limit: Optional[int]) -> bool:
+        return not limit or limit >= (self.line_count or 0)
+
+    def _iter_tsv(
+        self,
+        limit: Optional[int] = None,
+        sort: Optional[str] = None,
+        filt: Optional[str] = None,
+        perspective: Optional[str] = None,
+        max_workers: int = 1,
+        callback: Optional[Callable] = None,
+    ) -> Iterator[bytes]:
+        """
+        Iterate through the raw tsv results, served from the result cache when possible.
 
-        if not tsv_data:
-            return pd.DataFrame()
-        df = pd.read_csv(StringIO(tsv_data), delimiter="\t")  # type: ignore
-        return df
+        Complete results fetched from the server are written to the cache as they stream by.
+        """
+        cache = self._result_cache(sort, filt, perspective)
+        if cache is not None:
+            f = cache.open(self.cache_key, "tsv")
+            if f is not None:
+                return _iter_file(f, limit)
+        pages = self._iter_result_pages(
+            "text/tab-separated-values",
+            limit=limit,
+            sort=sort,
+            filt=filt,
+            perspective=perspective,
+            max_workers=max_workers,
+            callback=callback,
+        )
+        chunks = (r.content for r in pages)
+        if cache is not None and self._is_complete(limit):
+            return self._store_in_cache(cache, "tsv", chunks)
+        return chunks
+
+    def _store_in_cache(
+        self, cache: ResultCache, kind: str, chunks: Iterator[bytes]
+    ) -> Iterator[bytes]:
+        with cache.writer(self.cache_key, kind) as f:
+            for chunk in chunks:
+                f.write(chunk)
+                yield chunk
+            cache.put(self.cache_key, self.raw)
+
+    def to_arrow(
+        self,
+        limit: Optional[int] = None,
+        max_workers: int = 1,
+        column_types: Optional[Dict] = None,
+    ):
+        """
+        Return a pyarrow table containing the results of this query
+
+        Record batches are built incrementally from the tsv result pages. The types of
+        columns which are not in `column_types` are inferred from all of the rows.
+
+        :param limit: Maximum number of rows to return (default all)
+        :param max_workers: number of result pages to fetch concurrently (default 1)
+        :param column_types: Optional dictionary of column name to pyarrow data type
+        :raises QueryError: If the pyarrow library is not installed
+        :return: pyarrow Table object
+        """
+        return read_arrow(
+            self._iter_tsv(limit=limit, max_workers=max_workers), column_types
+        )
+
+    def to_parquet(
+        self,
+        filename: str,
+        limit: Optional[int] = None,
+        max_workers: int = 1,
+        column_types: Optional[Dict] = None,
+    ) -> str:
+        """
+        Write the results of this query to a local parquet file
+
+        The results are spooled to a temporary file while the types of columns which
+        are not in `column_types` are inferred from all of the rows, and then written
+        one record batch at a time so the result is never held in memory as a whole.
+
+        :param filename: Local filename to save results to
+        :param limit: Maximum number of rows to return (default all)
+        :param max_workers: number of result pages to fetch concurrently (default 1)
+        :param column_types: Optional dictionary of column name to pyarrow data type
+        :raises QueryError: If the pyarrow library is not installed
+        :return: The full path of the parquet file
+        """
+        return write_parquet(
+            self._iter_tsv(limit=limit, max_workers=max_workers), filename, column_types
+        )
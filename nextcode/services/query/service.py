@@ -9,9 +9,11 @@ methods to get started. To view past queries you can use the `get_queries` and `
 
 """
 
+import collections
 import logging
 import os
-from typing import Dict, Tuple, Sequence, List, Optional, Union, Any
+import time
+from typing import Dict, Tuple, Sequence, List, Optional, Union, Any, Iterator, Set
 from requests import codes
 from pathlib import Path
 import yaml
@@ -22,6 +24,7 @@ from ...exceptions import ServerError
 from ...client import Client
 from .exceptions import QueryError, MissingRelations, TemplateError
 from .query import Query
+from .cache import ResultCache, DEFAULT_MAX_BYTES, DEFAULT_TTL_SECONDS
 from .utils import extract_virtual_relations
 import nextcode
 
@@ -30,6 +33,7 @@ SERVICE_PATH = "api/query"
 RUNNING_STATUSES = ("PENDING", "RUNNING", "CANCELLING")
 RESULTS_PAGE_SIZE = 200000
 QUERY_WAIT_SECONDS = 2
+REFRESH_LIST_LIMIT = 100
 
 log = logging.getLogger(__name__)
 
@@ -47,6 +51,46 @@ class Service(BaseService):
             or os.environ.get("GOR_API_PROJECT")
             or client.profile.project
         )
+        self.cache: Optional[ResultCache] = None
+        if kwargs.get("cache") or os.environ.get("NEXTCODE_QUERY_CACHE"):
+            self.enable_cache()
+
+    def enable_cache(
+        self,
+        max_bytes: int = DEFAULT_MAX_BYTES,
+        ttl: int = DEFAULT_TTL_SECONDS,
+        folder: Optional[str] = None,
+    ) -> ResultCache:
+        """
+        Cache query results on local disk.
+
+        Subsequent executions of the same query in the same project, with the same
+        virtual relations against the same server and query service version, are served
+        from the cache without contacting the server. Results are stored as they are
+        downloaded through `get_results`, `dataframe` or `download_results`. A cached
+        query is run again on the server if results are needed which are not cached.
+
+        Typed json results are cached separately from the tsv results, they are stored
+        by `get_results` and served from the cache by `get_results`, `iter_batches` and
+        `iter_rows`. `iter_batches` and `iter_rows` stream the results page by page so
+        they do not store them in the cache themselves.
+
+        The cache can also be enabled with `cache=True` when creating the service or by
+        setting the NEXTCODE_QUERY_CACHE environment variable.
+
+        :param max_bytes: Maximum size of the cache, least recently used results are evicted first
+        :param ttl: Number of seconds cached results are valid for
+        :param folder: Folder to store the cache in (default ~/.nextcode/results)
+        :returns: The result cache, see `cache.stats` for hit and miss counters
+        """
+        self.cache = ResultCache(folder=folder, max_bytes=max_bytes, ttl=ttl)
+        return self.cache
+
+    def disable_cache(self) -> None:
+        """
+        Stop using the local result cache. Cached results are left on disk.
+        """
+        self.cache = None
 
     def _check_project(self):
         """
@@ -229,6 +273,25 @@ class Service(BaseService):
                 raise
         return resp.text
 
+    def _submit(self, payload: Dict) -> Dict:
+        """
+        Post a query to the server.
+
+        :returns: The serverside query response
+        :raises: :exc:`~exceptions.ServerError`, :exc:`~exceptions.MissingRelations`
+        """
+        url = self.session.endpoints["queries"]
+        try:
+            resp = self.session.post(url, json=payload)
+        except ServerError as ex:
+            if ex.response and ex.response["code"] == codes.conflict:
+                raise MissingRelations(
+                    [r["name"] for r in ex.response["error"]["virtual_relations"]]
+                )
+            else:
+                raise
+        return resp.json()
+
     def execute(
         self,
         query: str,
@@ -255,11 +318,13 @@ class Service(BaseService):
 
         Whether nowait is set or not, the serverside method will wait for a maximum of 2 seconds for the query
         to transition to a completed status. Therefore, most small queries will return in DONE status.
+
+        If the result cache is enabled (see `enable_cache`) and the query has been run before, the
+        query is returned from the cache without contacting the server.
         """
         self._check_project()
 
         payload_relations = extract_virtual_relations(kw, relations)
-
         payload: Dict[str, Optional[Union[int, str, List[Any], Dict]]] = {
             "project": self.project,
             "query": query,
@@ -270,17 +335,26 @@ class Service(BaseService):
             "type": job_type or "default",
         }
 
-        url = self.session.endpoints["queries"]
-        try:
-            resp = self.session.post(url, json=payload)
-        except ServerError as ex:
-            if ex.response and ex.response["code"] == codes.conflict:
-                raise MissingRelations(
-                    [r["name"] for r in ex.response["error"]["virtual_relations"]]
-                )
-            else:
-                raise
-        gor_query = Query(self, resp.json())
+        cache_key = None
+        if self.cache is not None and not persist:
+            cache_key = self.cache.make_key(
+                self.session.url_base,
+                self.project,
+                query,
+                payload_relations,
+                self.version,
+            )
+            cached = self.cache.get(cache_key)
+            if cached:
+                gor_query = Query(self, cached)
+                gor_query.cache_key = cache_key
+                # the query is run again if results are needed which are not cached
+                gor_query.cache_payload = payload
+                log.info("Query %s was found in the result cache", gor_query.query_id)
+                return gor_query
+
+        gor_query = Query(self, self._submit(payload))
+        gor_query.cache_key = cache_key
         log.info(
             "Query %s has been created and has status %s",
             gor_query.query_id,
@@ -290,6 +364,115 @@ class Service(BaseService):
             gor_query.wait()
         return gor_query
 
+    def execute_many(
+        self,
+        queries: Sequence[Union[str, Dict]],
+        max_in_flight: int = 10,
+        relations: Optional[List[Dict]] = None,
+        job_type: Optional[str] = None,
+        max_seconds: Optional[int] = None,
+        poll_period: float = 0.5,
+        **kw,
+    ) -> Iterator[Query]:
+        """
+        Execute many gor statements on the server and yield the queries as they complete.
+
+        At most `max_in_flight` queries are running on the server at a time and the status
+        of all of them is polled together. Queries are yielded in the order they complete,
+        which may differ from the order they were passed in, whether they succeeded or not.
+        Submission starts when the iterator is first advanced.
+
+        :param queries: gor query strings or dictionaries with a `query` key and optionally
+                        `relations`, `persist` and `job_type` keys as in `execute`
+        :param max_in_flight: Maximum number of queries running on the server at a time
+        :param relations: virtual relations shared by all the queries
+        :param job_type: Optional job type for routing purposes
+        :param max_seconds: raise an exception if a query runs longer than this
+        :param poll_period: Number of seconds to wait between polling (max 10 seconds)
+        :raises: :exc:`~exceptions.ServerError`, :exc:`~exceptions.MissingRelations`, :exc:`~exceptions.QueryError`
+
+        Optional keyword arguments are converted into shared virtual relations as in `execute`.
+        Virtual relations are only uploaded with the first query using them, subsequent
+        queries refer to them by fingerprint.
+
+        Example usage:
+
+        >>> for query in svc.execute_many(["gor #dbsnp# | top 1", "gor #genes# | top 1"]):
+        ...     print(query.query_id, query.status)
+        """
+        self._check_project()
+        shared_relations = extract_virtual_relations(kw, relations)
+        pending = collections.deque()
+        for query in queries:
+            spec = {"query": query} if isinstance(query, str) else dict(query)
+            spec["relations"] = shared_relations + extract_virtual_relations(
+                {}, spec.get("relations")
+            )
+            pending.append(spec)
+
+        uploaded: Set[str] = set()
+        in_flight: List[Tuple[Query, float]] = []
+        period = poll_period
+        while pending or in_flight:
+            if pending and len(in_flight) < max_in_flight:
+                period = poll_period
+            while pending and len(in_flight) < max_in_flight:
+                gor_query = self._execute_shared(pending.popleft(), uploaded, job_type)
+                in_flight.append((gor_query, time.time()))
+
+            still_running = []
+            for gor_query, start_time in in_flight:
+                if gor_query.status not in RUNNING_STATUSES:
+                    yield gor_query
+                elif max_seconds and time.time() - start_time > max_seconds:
+                    raise QueryError(
+                        f"Query {gor_query.query_id} has exceeded wait time {max_seconds}s and we will not wait any longer. It is currently {gor_query.status}.",
+                        query_id=gor_query.query_id,
+                    )
+                else:
+                    still_running.append((gor_query, start_time))
+            completed = len(still_running) < len(in_flight)
+            in_flight = still_running
+            if not in_flight or (completed and pending):
+                continue
+            time.sleep(period)
+            period = min(period + 0.5, 10.0)
+            # one call to the query list refreshes the status of all the running queries,
+            # the ones which have finished are then fetched in full
+            self.refresh_queries([gor_query for gor_query, _ in in_flight])
+            for gor_query, _ in in_flight:
+                if gor_query.status not in RUNNING_STATUSES:
+                    gor_query.refresh()
+
+    def _execute_shared(
+        self, spec: Dict, uploaded: Set[str], job_type: Optional[str]
+    ) -> Query:
+        """
+        Submit a query from `execute_many`, leaving out the data of virtual relations
+        which have already been uploaded.
+        """
+        payload_relations = [
+            {k: v for k, v in r.items() if k != "data"}
+            if r["fingerprint"] in uploaded
+            else r
+            for r in spec["relations"]
+        ]
+        kw = {
+            "nowait": True,
+            "persist": spec.get("persist"),
+            "job_type": spec.get("job_type", job_type),
+        }
+        try:
+            gor_query = self.execute(spec["query"], relations=payload_relations, **kw)
+        except MissingRelations:
+            if payload_relations == spec["relations"]:
+                raise
+            # the server no longer has a relation we uploaded before so send the data again
+            log.info("Uploading virtual relations for query again")
+            gor_query = self.execute(spec["query"], relations=spec["relations"], **kw)
+        uploaded.update(r["fingerprint"] for r in spec["relations"])
+        return gor_query
+
     def execute_template(
         self,
         template_name: str,
@@ -373,6 +556,7 @@ class Service(BaseService):
         user_name: Optional[str] = None,
         limit: int = 100,
         all: Optional[bool] = False,
+        partial: bool = False,
     ) -> Sequence[Query]:
         """
         Get all queries that have been run by the current user in the current project, optionally filtered by status.
@@ -380,12 +564,14 @@ class Service(BaseService):
         Results are returned in reverse chronological order so latest queries are first.
 
         Note that queries are returned in `partial` state which means they might not be up to date. `query.refresh()`
-        can be called to force a refresh.
+        can be called to force a refresh, or `refresh_queries` to refresh many queries in a single call.
 
         :param status: Filter queries by status. e.g. `DONE` `RUNNING` `FAILED`.
         :param user_name: Show queries for another user (only available to admin).
         :param limit: Limit the number of queries returned.
         :param all: Fetch all queries in all projects (only available to admin).
+        :param partial: Never refresh the returned queries implicitly when accessing their status or
+                        attributes that are missing from the list response.
         """
         if all:
             user_name = None
@@ -400,12 +586,44 @@ class Service(BaseService):
             "status": status,
         }
         rsp = self.session.get(self.session.endpoints["queries"], json=data)
-        queries = []
+        return [
+            Query(self, payload, partial=partial) for payload in rsp.json()["queries"]
+        ]
+
+    def refresh_queries(self, queries: Sequence[Query]) -> Sequence[Query]:
+        """
+        Refresh many queries from the server with a single call to the query list.
+
+        The queries are updated in place from the list response. Queries which are not
+        found among the most recent queries of their project and user are refreshed
+        individually.
+
+        :param queries: Queries to refresh, e.g. from `get_queries`
+        :returns: The refreshed queries
+        """
+        queries_by_id = {q.query_id: q for q in queries if q.query_id}
+        if not queries_by_id:
+            return queries
+        projects = {q.raw.get("project_name") for q in queries_by_id.values()}
+        user_names = {q.raw.get("user_name") for q in queries_by_id.values()}
+        data: Dict[str, Union[str, Any]] = {
+            "project": projects.pop() if len(projects) == 1 else None,
+            "user_name": user_names.pop() if len(user_names) == 1 else None,
+            "limit": max(REFRESH_LIST_LIMIT, 2 * len(queries_by_id)),
+            "status": None,
+        }
+        rsp = self.session.get(self.session.endpoints["queries"], json=data)
         for payload in rsp.json()["queries"]:
-            q = Query(self, payload)
-            if q.running:
-                pass
-            queries.append(q)
+            query = queries_by_id.pop(payload["query_id"], None)
+            if query:
+                query.init_from_resp(payload)
+        if queries_by_id:
+            log.info(
+                "%s queries were not found in the query list, refreshing them individually",
+                len(queries_by_id),
+            )
+        for query in queries_by_id.values():
+            query.refresh()
         return queries
 
     def wakeup(
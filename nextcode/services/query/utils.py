@@ -6,7 +6,10 @@ Utility methods used by the query service.
 """
 
 import hashlib
-from typing import Dict, Tuple, Sequence, List, Optional, Union, Any
+import io
+import os
+import tempfile
+from typing import Dict, Tuple, Sequence, List, Optional, Union, Any, Iterable
 
 from nextcode.services.query.exceptions import QueryError
 
@@ -70,3 +73,215 @@ def extract_virtual_relations(kw, relations: Optional[List[Dict]] = None):
             }
         )
     return payload_relations
+
+
+class IterStream(io.RawIOBase):
+    """
+    Read-only binary file object over an iterator of byte chunks.
+
+    Allows parsers such as `pandas.read_csv` to consume result pages or a response
+    stream directly without joining everything into one string first. Chunks are
+    sliced through memoryviews so they are not copied before being read.
+    """
+
+    def __init__(self, chunks: Iterable[bytes]):
+        self._chunks = iter(chunks)
+        self._buffer = memoryview(b"")
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, b) -> int:
+        while not self._buffer:
+            try:
+                self._buffer = memoryview(next(self._chunks))
+            except StopIteration:
+                return 0
+        num = min(len(b), len(self._buffer))
+        b[:num] = self._buffer[:num]
+        self._buffer = self._buffer[num:]
+        return num
+
+
+def _open_tsv_stream(chunks: Iterable[bytes]) -> io.BufferedReader:
+    return io.BufferedReader(IterStream(chunks), buffer_size=1024 * 1024)
+
+
+def read_tsv(chunks: Iterable[bytes], dtype: Optional[Dict] = None):
+    """
+    Parse a tab separated stream of byte chunks into a pandas dataframe.
+
+    :param chunks: Iterable of raw utf-8 encoded tsv data, starting with the header
+    :param dtype: Optional dictionary of column name to dtype passed on to pandas
+    :returns: Pandas dataframe, empty if there was no data
+    """
+    import pandas as pd
+
+    try:
+        return pd.read_csv(_open_tsv_stream(chunks), delimiter="\t", dtype=dtype)  # type: ignore
+    except pd.errors.EmptyDataError:
+        return pd.DataFrame()
+
+
+def open_arrow_reader(chunks: Iterable[bytes], column_types: Optional[Dict] = None):
+    """
+    Open a streaming reader that converts tab separated byte chunks into Arrow record batches.
+
+    Record batches are built incrementally as the chunks are consumed so the whole
+    result never has to be held in memory as text.
+
+    Arrow only infers column types from the first block of a stream and fails when a
+    later block does not match them, so columns which are not in `column_types` are
+    read as strings.
+
+    :param chunks: Iterable of raw utf-8 encoded tsv data, starting with the header
+    :param column_types: Optional dictionary of column name to pyarrow data type
+    :returns: `pyarrow.RecordBatchReader` or None if there was no data
+    :raises: QueryError if the pyarrow library is not installed
+    """
+    try:
+        import pyarrow as pa
+        from pyarrow import csv
+    except ModuleNotFoundError:
+        raise QueryError("Pyarrow library is not installed") from None
+
+    stream = _open_tsv_stream(chunks)
+    header = stream.readline().decode("utf-8").rstrip("\r\n")
+    if not header:
+        return None
+    names = header.split("\t")
+    types = {name: pa.string() for name in names}
+    types.update(column_types or {})
+    try:
+        return csv.open_csv(
+            stream,
+            read_options=csv.ReadOptions(column_names=names),
+            parse_options=csv.ParseOptions(delimiter="\t"),
+            convert_options=csv.ConvertOptions(
+                column_types=types, strings_can_be_null=True
+            ),
+        )
+    except pa.ArrowInvalid as ex:
+        if "Empty CSV file" not in str(ex):
+            raise
+    schema = pa.schema([(name, types[name]) for name in names])
+    return pa.RecordBatchReader.from_batches(schema, [])
+
+
+class _TypeInference:
+    """
+    Find the narrowest numeric type that all values of string columns can be converted
+    to, over any number of record batches.
+    """
+
+    def __init__(self, names: Iterable[str]):
+        import pyarrow as pa
+
+        self.candidates = {name: [pa.int64(), pa.float64()] for name in names}
+        self.seen = set()
+
+    def update(self, batch) -> None:
+        import pyarrow as pa
+        import pyarrow.compute as pc
+
+        for name, candidates in self.candidates.items():
+            column = batch.column(name)
+            if not candidates or column.null_count == len(column):
+                continue
+            self.seen.add(name)
+            possible = []
+            for data_type in candidates:
+                try:
+                    pc.cast(column, data_type)
+                except (pa.ArrowInvalid, pa.ArrowNotImplementedError):
+                    continue
+                possible.append(data_type)
+            self.candidates[name] = possible
+
+    def types(self) -> Dict:
+        """
+        Inferred types of the columns which are not all strings or empty
+        """
+        return {
+            name: candidates[0]
+            for name, candidates in self.candidates.items()
+            if candidates and name in self.seen
+        }
+
+
+def read_arrow(chunks: Iterable[bytes], column_types: Optional[Dict] = None):
+    """
+    Parse a tab separated stream of byte chunks into an Arrow table.
+
+    The types of columns which are not in `column_types` are inferred from all
+    of the rows.
+
+    :param chunks: Iterable of raw utf-8 encoded tsv data, starting with the header
+    :param column_types: Optional dictionary of column name to pyarrow data type
+    :returns: `pyarrow.Table`, empty if there was no data
+    :raises: QueryError if the pyarrow library is not installed
+    """
+    reader = open_arrow_reader(chunks, column_types)
+    import pyarrow as pa
+    import pyarrow.compute as pc
+
+    if reader is None:
+        return pa.table({})
+    table = reader.read_all()
+    inference = _TypeInference(
+        name for name in table.column_names if name not in (column_types or {})
+    )
+    inference.update(table)
+    for name, data_type in inference.types().items():
+        index = table.column_names.index(name)
+        table = table.set_column(index, name, pc.cast(table[name], data_type))
+    return table
+
+
+def write_parquet(
+    chunks: Iterable[bytes], filename: str, column_types: Optional[Dict] = None
+) -> str:
+    """
+    Convert a tab separated stream of byte chunks into a parquet file.
+
+    The tsv data is spooled to a temporary file next to `filename` while the types of
+    columns which are not in `column_types` are inferred from all of the rows. It is
+    then converted and written one record batch at a time.
+
+    :param chunks: Iterable of raw utf-8 encoded tsv data, starting with the header
+    :param filename: Local filename to write the parquet file to
+    :param column_types: Optional dictionary of column name to pyarrow data type
+    :returns: The full path of the parquet file
+    :raises: QueryError if the pyarrow library is not installed
+    """
+    filename = os.path.expanduser(filename)
+    column_types = column_types or {}
+
+    def spool_chunks(f):
+        for chunk in chunks:
+            f.write(chunk)
+            yield chunk
+
+    folder = os.path.dirname(os.path.abspath(filename))
+    with tempfile.TemporaryFile(dir=folder) as spool:
+        reader = open_arrow_reader(spool_chunks(spool), column_types)
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        if reader is None:
+            pq.write_table(pa.table({}), filename)
+            return filename
+        inference = _TypeInference(
+            name for name in reader.schema.names if name not in column_types
+        )
+        for batch in reader:
+            inference.update(batch)
+        spool.seek(0)
+        reader = open_arrow_reader(
+            iter(lambda: spool.read(1024 * 1024), b""),
+            dict(inference.types(), **column_types),
+        )
+        with pq.ParquetWriter(filename, reader.schema) as writer:
+            for batch in reader:
+                writer.write_batch(batch)
+    return filename
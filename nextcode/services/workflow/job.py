@@ -9,8 +9,6 @@ import configparser
 import json
 import datetime
 import os
-
-import botocore.session
 import dateutil
 import time
 import logging
@@ -20,6 +18,7 @@ from . import RUNNING_STATUSES, FINISHED_STATUSES, FAILED_STATUSES
 from .exceptions import JobError
 from ...exceptions import ServerError
 from ...session import ServiceSession
+from ...wait import WaitStrategy, default_strategy
 
 log = logging.getLogger(__name__)
 
@@ -108,7 +107,12 @@ class WorkflowJob:
         _ = self.session.put(self.links["self"])
         self.refresh()
 
-    def wait(self, max_seconds: Optional[int] = None, poll_period: float = 0.5):
+    def wait(
+        self,
+        max_seconds: Optional[int] = None,
+        poll_period: float = 0.5,
+        strategy: Optional[WaitStrategy] = None,
+    ):
         """
         Wait for a running job to complete.
 
@@ -119,20 +123,28 @@ class WorkflowJob:
 
         :param max_seconds: raise an exception if the job runs longer than this
         :param poll_period: Number of seconds to wait between polling (max 10 seconds)
+        :param strategy: How to wait between status checks, see :mod:`nextcode.wait`.
+                         By default the status is polled with a linear back-off.
         :returns: WorkflowJob
         :raises: :exc:`JobError`
         """
         if not self.running:
             return self
         log.info("Waiting for job %s to complete...", self.job_id)
+        strategy = strategy or default_strategy(poll_period)
+        strategy.start()
         start_time = time.time()
         duration = 0.0
-        period = poll_period
         is_running = self.running
         while is_running:
-            time.sleep(period)
+            timeout = max_seconds - duration if max_seconds else None
+            resp = strategy.pause(self.session, self.links, self.status, timeout)
             duration = time.time() - start_time
-            is_running = self.running
+            if resp:
+                self.job = resp
+                is_running = self.status in RUNNING_STATUSES
+            else:
+                is_running = self.running
 
             # cancel the wait if the executor pod is in trouble after 30 seconds of waiting to start.
             # it most likely means that the nextflow script has a syntax error or something.
@@ -169,8 +181,6 @@ class WorkflowJob:
                 raise JobError(
                     f"Job {self.job_id} has exceeded wait time {max_seconds}s and we will not wait any longer. It is currently {self.status}."
                 )
-
-            period = min(period + 0.5, 10.0)
         if self.status == "DONE":
             log.info(
                 "Job %s completed in %.2f sec and returned %s rows",
@@ -9,24 +9,29 @@ import json
 import time
 import logging
 import platform
+import threading
+import weakref
 import requests
 import requests.utils
 from os import environ
-from typing import Dict
+from typing import Dict, Optional, Tuple
 from hashlib import sha1
 from requests import codes
-from requests.adapters import HTTPAdapter
+from requests.adapters import DEFAULT_POOLSIZE, HTTPAdapter
 from requests.packages.urllib3.util.retry import Retry  # pylint: disable=E0401
 
 from . import __version__
-from .exceptions import ServerError, ServiceNotFound
-from .utils import check_resp_error, get_access_token
+from . import instrumentation
+from .exceptions import ServerError, ServiceNotFound, InvalidToken
+from .utils import check_resp_error, get_access_token, decode_token
 from .config import Config, load_cache, save_cache
 
 log = logging.getLogger(__name__)
 
 config = Config()
 
+TOKEN_REFRESH_MARGIN = 60
+
 
 def initialize_first(func):
     def inner(self, *args, **kwargs):
@@ -36,30 +41,230 @@ def initialize_first(func):
     return inner
 
 
+def create_adapter(pool_maxsize: int = DEFAULT_POOLSIZE) -> HTTPAdapter:
+    """
+    Create a transport adapter which retries idempotent methods up to 5 times
+
+    :param pool_maxsize: Maximum number of connections kept open to each host
+    """
+    if environ.get("NEXTCODE_DISABLE_RETRY"):
+        return HTTPAdapter(pool_maxsize=pool_maxsize)
+    retries = 5
+    backoff_factor = 0.5
+    status_forcelist = (500, 502, 503, 504)
+    retry = Retry(
+        total=retries,
+        read=retries,
+        connect=retries,
+        backoff_factor=backoff_factor,
+        status_forcelist=status_forcelist,
+    )
+    return HTTPAdapter(max_retries=retry, pool_maxsize=pool_maxsize)
+
+
+class TokenManager:
+    """
+    Thread-safe holder of the access token for an api key.
+
+    The token is refreshed in the background shortly before it expires, based on its
+    `exp` claim, so requests rarely have to wait for a refresh or fail with a 401.
+    Concurrent refreshes are deduplicated and one manager is shared by all sessions
+    using the same api key, see `for_api_key`.
+
+    :param api_key: The api key to fetch access tokens with
+    :param margin: Number of seconds before expiry to refresh the token
+    """
+
+    _managers: Dict[str, "TokenManager"] = {}
+    _managers_lock = threading.Lock()
+
+    def __init__(self, api_key: str, margin: float = TOKEN_REFRESH_MARGIN):
+        self.api_key = api_key
+        self.margin = margin
+        self.token: Optional[str] = None
+        self.refresh_at: Optional[float] = None
+        self._lock = threading.Lock()
+        self._timer: Optional[threading.Timer] = None
+
+    def __repr__(self):
+        return f"<TokenManager {'authenticated' if self.token else 'unauthenticated'}>"
+
+    @classmethod
+    def for_api_key(cls, api_key: str) -> "TokenManager":
+        """
+        Get the token manager shared by all sessions using an api key
+        """
+        with cls._managers_lock:
+            if api_key not in cls._managers:
+                cls._managers[api_key] = cls(api_key)
+            return cls._managers[api_key]
+
+    @classmethod
+    def reset(cls) -> None:
+        """
+        Forget all shared token managers and stop their background refreshes
+        """
+        with cls._managers_lock:
+            for manager in cls._managers.values():
+                manager.close()
+            cls._managers.clear()
+
+    def get_token(self, stale: Optional[str] = None) -> str:
+        """
+        Get a valid access token, fetching a new one if there is none yet, if it is
+        about to expire or if the current one is `stale`.
+
+        Concurrent callers which find the same stale token only fetch a new token once.
+        """
+        token = self.token
+        if token and token != stale and not self._expiring():
+            return token
+        with self._lock:
+            if self.token is None or self.token == stale or self._expiring():
+                self._refresh()
+            return self.token
+
+    def offer(self, token: str) -> None:
+        """
+        Use a previously stored token if there is no token yet and it is still valid
+        """
+        expires_at = self._claims(token).get("exp")
+        if not expires_at or expires_at - self.margin < time.time():
+            return
+        with self._lock:
+            if self.token is None:
+                self.token = token
+                self._schedule(expires_at - time.time())
+
+    def close(self) -> None:
+        """
+        Stop refreshing the token in the background
+        """
+        if self._timer:
+            self._timer.cancel()
+            self._timer = None
+
+    def _expiring(self) -> bool:
+        return self.refresh_at is not None and time.time() >= self.refresh_at
+
+    @staticmethod
+    def _claims(token: str) -> Dict:
+        try:
+            return decode_token(token)
+        except InvalidToken:
+            return {}
+
+    def _refresh(self) -> None:
+        log.debug("Refreshing access token")
+        self.token = get_access_token(self.api_key)
+        claims = self._claims(self.token)
+        lifetime = None
+        if claims.get("exp") and claims.get("iat"):
+            # use the lifetime of the token rather than the absolute expiry time
+            # so that clock differences with the auth server do not matter
+            lifetime = claims["exp"] - claims["iat"]
+        self._schedule(lifetime)
+
+    def _schedule(self, lifetime: Optional[float]) -> None:
+        self.close()
+        if not lifetime or lifetime <= 0:
+            self.refresh_at = None
+            return
+        delay = lifetime - min(self.margin, lifetime / 4)
+        self.refresh_at = time.time() + delay
+        self._timer = threading.Timer(delay, self._refresh_in_background)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def _refresh_in_background(self) -> None:
+        with self._lock:
+            if not self._expiring():
+                return
+            try:
+                self._refresh()
+            except Exception as ex:
+                # the next caller will try again
+                log.warning("Could not refresh access token in the background: %s", ex)
+
+
+class Transport:
+    """
+    Connection pool and access token shared by all the service sessions of a client.
+
+    The adapter keeps one pool of connections per host so services on the same
+    server reuse connections and the access token is only fetched once.
+
+    :param api_key: The api key to fetch the access token with
+    """
+
+    def __init__(self, api_key: Optional[str]):
+        self.api_key = api_key
+        self.pool_maxsize = DEFAULT_POOLSIZE
+        self.adapter = create_adapter(pool_maxsize=self.pool_maxsize)
+        self.tokens = TokenManager.for_api_key(api_key) if api_key else None
+        self._sessions: "weakref.WeakSet[requests.Session]" = weakref.WeakSet()
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return f"<Transport {'authenticated' if self.token else 'unauthenticated'}>"
+
+    @property
+    def token(self) -> Optional[str]:
+        return self.tokens.token if self.tokens else None
+
+    def mount(self, session: requests.Session) -> None:
+        """
+        Send the requests of a session through the shared connection pool
+        """
+        with self._lock:
+            self._sessions.add(session)
+            session.mount("http://", self.adapter)
+            session.mount("https://", self.adapter)
+
+    def ensure_pool_size(self, size: int) -> None:
+        """
+        Grow the shared connection pool so it keeps `size` connections open to each host.
+
+        The sessions using the transport are moved over to the larger pool.
+        """
+        with self._lock:
+            if self.pool_maxsize >= size:
+                return
+            self.pool_maxsize = size
+            self.adapter = create_adapter(pool_maxsize=size)
+            for session in list(self._sessions):
+                session.mount("http://", self.adapter)
+                session.mount("https://", self.adapter)
+
+    def get_token(self, stale: Optional[str] = None) -> str:
+        """
+        Get the shared access token, see `TokenManager.get_token`
+        """
+        if not self.tokens:
+            raise InvalidToken("No api key to fetch an access token with")
+        return self.tokens.get_token(stale=stale)
+
+
 class ServiceSession(requests.Session):
     """
     A wrapped requests session object with base_url and exported endpoints
     from nextcode service api's
     """
 
-    def __init__(self, url_base, api_key, *args, **kwargs):
+    def __init__(
+        self, url_base, api_key, *args, transport: Optional[Transport] = None, **kwargs
+    ):
         super(ServiceSession, self).__init__(*args, **kwargs)
+        # share the connection pool of the client if there is one, otherwise
         # retry idempotent methods up to 5 times
-        if not environ.get("NEXTCODE_DISABLE_RETRY"):
-            retries = 5
-            backoff_factor = 0.5
-            status_forcelist = (500, 502, 503, 504)
-            retry = Retry(
-                total=retries,
-                read=retries,
-                connect=retries,
-                backoff_factor=backoff_factor,
-                status_forcelist=status_forcelist,
-            )
-            adapter = HTTPAdapter(max_retries=retry)
+        if transport:
+            transport.mount(self)
+        elif not environ.get("NEXTCODE_DISABLE_RETRY"):
+            adapter = create_adapter()
             self.mount("http://", adapter)
             self.mount("https://", adapter)
 
+        self.transport = transport
         self.initialized = False
         self._root_info = {}
         self._endpoints = {}
@@ -93,14 +298,34 @@ class ServiceSession(requests.Session):
 
 
     def _initialize(self) -> None:
+        token, root_info = self._fetch_state(stale=self.token)
+        self.token = token
+        self.headers["Authorization"] = "Bearer {}".format(self.token)
+        self._root_info = root_info
+        self._endpoints = self._root_info.get("endpoints")
+        # persist the endpoints to disk to save on a roundtrip every call
+        self.initialized = True
+        self._save()
+
+    def _fetch_state(self, stale: Optional[str] = None) -> Tuple[Optional[str], Dict]:
+        """
+        Fetch an access token and the root info of the service without touching the
+        session itself.
+
+        :param stale: A token which should not be used
+        :returns: The access token and the root info
+        :raises: ServiceNotFound
+        """
+        token = self.token
         if environ.get('NEXTCODE_ACCESS_TOKEN'):
-            self.token = environ.get('NEXTCODE_ACCESS_TOKEN')
+            token = environ.get('NEXTCODE_ACCESS_TOKEN')
+        elif self._shares_token():
+            token = self.transport.get_token(stale=stale)
         elif self.api_key:
-            self.token = get_access_token(self.api_key)
-        self.headers["Authorization"] = "Bearer {}".format(self.token)
+            token = get_access_token(self.api_key)
+        headers = dict(self.headers, Authorization="Bearer {}".format(token))
         try:
-            self.fetch_root_info()
-            self._endpoints = self._root_info.get("endpoints")
+            root_info = self._get_root_info(headers)
         except ServerError as ex:
             if ex.response and ex.response.get("status") == codes.not_found:
                 status = ex.response.get("status")
@@ -108,47 +333,101 @@ class ServiceSession(requests.Session):
                     f"Service does not exist on server ({status}): {self.url_base}"
                 )
             raise
-        # persist the endpoints to disk to save on a roundtrip every call
-        self.initialized = True
-        self._save()
+        return token, root_info
+
+    def _revalidate(self) -> None:
+        # runs in the background while the session is in use, so only the cache is updated
+        token, root_info = self._fetch_state()
+        self._save_state(token, root_info)
+
+    def _token_cache_name(self) -> str:
+        return "token-" + sha1((self.api_key or "").encode()).hexdigest()
 
     def _save(self) -> None:
+        self._save_state(self.token, self._root_info)
+
+    def _save_state(self, token: Optional[str], root_info: Dict) -> None:
         contents = {
-            "token": self.token,
-            "root_info": self._root_info,
+            "token": token,
+            "root_info": root_info,
             "api_key": self.api_key,
         }
         save_cache(self.cache_name, contents)
+        # the token is cached separately for as long as it is valid
+        if token and self.api_key:
+            try:
+                expires_at = decode_token(token).get("exp")
+            except InvalidToken:
+                expires_at = None
+            if expires_at:
+                ttl = expires_at - time.time() - TOKEN_REFRESH_MARGIN
+                if ttl > 0:
+                    save_cache(self._token_cache_name(), {"token": token}, ttl)
 
     def _load(self) -> bool:
-        contents = load_cache(self.cache_name)
+        contents = load_cache(self.cache_name, revalidate=self._revalidate)
         if not contents:
             return False
         self.token = contents["token"]
+        if self.api_key:
+            token_contents = load_cache(self._token_cache_name())
+            if token_contents:
+                self.token = token_contents["token"]
         self._root_info = contents["root_info"]
         self._endpoints = self._root_info.get("endpoints")
         if self.token:
             self.headers["Authorization"] = "Bearer {}".format(self.token)
+            if self._shares_token():
+                self.transport.tokens.offer(self.token)
         # if the service does not have our user available make sure to refresh
         if not self._root_info.get("current_user"):
             return False
         return True
 
+    def _shares_token(self) -> bool:
+        return bool(
+            self.api_key
+            and self.transport
+            and self.transport.api_key == self.api_key
+            and not environ.get("NEXTCODE_ACCESS_TOKEN")
+        )
+
+    def _update_token(self) -> bool:
+        # pick up a token which has been refreshed ahead of its expiry
+        if not self._shares_token():
+            return False
+        token = self.transport.get_token()
+        if token == self.token:
+            return False
+        self.token = token
+        self.headers["Authorization"] = "Bearer {}".format(self.token)
+        return True
+
     @initialize_first
     def _do_request(self, method, retry=True, *args, **kwargs):
+        # a request which is not retried has been sent again after refreshing the token
+        token_refreshed = self._update_token() or not retry
         # method: GET
-        old_content_type = self.headers["Content-Type"]
-        
         if method == "get":
-            # ! Temporary hack: Remove the application/json content-type header for GET's
-            del self.headers["Content-Type"]
-
+            # ! Temporary hack: Remove the application/json content-type header for GET's.
+            # A header set to None on the request is dropped when merged with the session
+            # headers, so the shared session headers are left untouched for other threads.
+            headers = dict(kwargs.get("headers") or {})
+            headers.setdefault("Content-Type", None)
+            kwargs["headers"] = headers
+
+        st = time.time()
         try:
-            st = time.time()
             response = getattr(super(ServiceSession, self), method)(*args, **kwargs)
-            diff = time.time() - st
-        finally:
-            self.headers["Content-Type"] = old_content_type
+        except Exception as ex:
+            if instrumentation.has_listeners():
+                self._emit_event(
+                    method, args[0], kwargs, None, time.time() - st, token_refreshed, ex
+                )
+            raise
+        diff = time.time() - st
+        if instrumentation.has_listeners():
+            self._emit_event(method, args[0], kwargs, response, diff, token_refreshed)
 
         # Manage response from the server
         log.info(
@@ -169,6 +448,22 @@ class ServiceSession(requests.Session):
         check_resp_error(response)
         return response
 
+    def _emit_event(
+        self, method, url, kwargs, response, duration, token_refreshed, error=None
+    ) -> None:
+        event = instrumentation.request_event(
+            method,
+            url,
+            self._endpoints,
+            self.url_base,
+            response=response,
+            duration=duration,
+            stream=bool(kwargs.get("stream")),
+            token_refreshed=token_refreshed,
+            error=error,
+        )
+        instrumentation.emit(event)
+
     def get(self, *args, **kw):
         return self._do_request("get", True, *args, **kw)
 
@@ -182,16 +477,21 @@ class ServiceSession(requests.Session):
         return self._do_request("delete", True, *args, **kw)
 
     def fetch_root_info(self) -> Dict:
+        ret = self._get_root_info(self.headers)
+        self._root_info = ret
+        return ret
+
+    def _get_root_info(self, headers: Dict) -> Dict:
         log.debug(
             "fetch_root_info(): url_base: {0}, headers: {1}".format(
-                self.url_base, self.headers
+                self.url_base, headers
             )
         )
         try:
             r = requests.get(
                 self.url_base,
                 timeout=3.0,
-                headers=self.headers,
+                headers=headers,
                 verify=self.verify
             )
         except requests.exceptions.ConnectionError as ex:
@@ -209,9 +509,7 @@ class ServiceSession(requests.Session):
             raise ServerError(
                 "Unexpected response: %s" % r.text, url=self.url_base
             ) from None
-        ret = r.json()
-        self._root_info = ret
-        return ret
+        return r.json()
 
     @initialize_first
     def url_from_endpoint(self, endpoint: str) -> str:
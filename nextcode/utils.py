@@ -11,7 +11,10 @@ import requests
 from requests import codes
 import binascii
 import os
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, Future
 from importlib.util import find_spec
+from typing import Callable, Iterable, Iterator, Deque
 
 from .exceptions import ServerError, InvalidToken
 
@@ -56,7 +59,9 @@ def check_resp_error(resp):
         else:
             log.info("Server error in call to %s", resp.url)
 
-        error = ServerError(desc, url=resp.url, response=response_json)
+        error = ServerError(
+            desc, url=resp.url, response=response_json, status_code=resp.status_code
+        )
         raise error from None
 
 
@@ -137,6 +142,33 @@ def jupyter_available() -> bool:
     return False
 
 
+def map_ordered(func: Callable, items: Iterable, max_workers: int = 1) -> Iterator:
+    """
+    Call `func` for each item and yield the results in input order.
+
+    With more than one worker the calls run on a bounded thread pool and each result
+    is yielded as soon as all preceding results are available. At most `max_workers * 2`
+    results are in flight or waiting to be consumed. Outstanding calls are cancelled
+    if the consumer stops iterating or a call raises.
+    """
+    if max_workers <= 1:
+        for item in items:
+            yield func(item)
+        return
+    pending: Deque[Future] = deque()
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        try:
+            for item in items:
+                pending.append(executor.submit(func, item))
+                if len(pending) >= max_workers * 2:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+        finally:
+            for future in pending:
+                future.cancel()
+
+
 def strtobool(s):
     if isinstance(s, bool):
         return s
@@ -0,0 +1,237 @@
+"""
+wait
+~~~~~~~~~~
+Strategies for waiting on serverside objects, such as queries and workflow jobs,
+to change status.
+
+`Query.wait` and `WorkflowJob.wait` call `pause` on a strategy between status checks.
+A strategy either just waits before the caller refreshes the object or fetches the
+object itself and returns the fresh server response.
+
+By default the status is polled with a linear back-off. Long-polling, where the server
+holds the status request until the status changes or the wait time runs out, is opt-in
+with `LongPollStrategy` since it relies on the server accepting the `wait` parameter on
+the object's `self` link.
+"""
+
+import abc
+import logging
+import time
+from typing import Dict, Optional
+
+from requests.exceptions import ConnectionError, ReadTimeout
+
+from .session import ServiceSession
+
+log = logging.getLogger(__name__)
+
+LONG_POLL_SECONDS = 10
+EVENT_STREAM_SECONDS = 30
+EVENT_STREAM_MAX_FAILURES = 3
+MAX_POLL_PERIOD = 10.0
+
+
+class WaitStrategy(abc.ABC):
+    """
+    Base class for waiting between status checks of a running serverside object.
+    """
+
+    def start(self) -> None:
+        """
+        Called when a new wait begins
+        """
+
+    @abc.abstractmethod
+    def pause(
+        self,
+        session: ServiceSession,
+        links: Dict,
+        status: Optional[str],
+        timeout: Optional[float] = None,
+    ) -> Optional[Dict]:
+        """
+        Block until it is time to check the status of the object again.
+
+        :param session: Session of the service the object belongs to
+        :param links: Links of the object, `self` must point to the object itself
+        :param status: The current status of the object
+        :param timeout: Maximum number of seconds to block
+        :returns: The server response for the object if it was fetched, otherwise None
+        """
+
+
+class PollingStrategy(WaitStrategy):
+    """
+    Sleep between status checks, increasing the period by half a second every time.
+
+    :param poll_period: Number of seconds to wait before the first check
+    :param max_period: Maximum number of seconds between checks
+    """
+
+    def __init__(self, poll_period: float = 0.5, max_period: float = MAX_POLL_PERIOD):
+        self.poll_period = poll_period
+        self.max_period = max_period
+        self.period = poll_period
+
+    def start(self) -> None:
+        self.period = self.poll_period
+
+    def pause(self, session, links, status, timeout=None):
+        period = self.period
+        if timeout is not None:
+            period = max(min(period, timeout), 0.0)
+        time.sleep(period)
+        self.period = min(self.period + 0.5, self.max_period)
+        return None
+
+
+class LongPollStrategy(WaitStrategy):
+    """
+    Ask the server to hold the status request until the status changes.
+
+    The `wait` parameter is sent with the request for the object. A reply that comes
+    back in less than half the wait time without a status change was not held by the
+    server, and the fallback strategy pauses before the next check. If the very first
+    reply is not held the server is assumed not to support long-polling and only the
+    fallback strategy is used from then on.
+
+    Only use this strategy with servers which are known to accept the `wait` parameter.
+
+    :param seconds: Maximum number of seconds the server should hold each request
+    :param fallback: Strategy to pause with when a request is not held
+    """
+
+    def __init__(
+        self,
+        seconds: int = LONG_POLL_SECONDS,
+        fallback: Optional[WaitStrategy] = None,
+    ):
+        self.seconds = seconds
+        self.fallback = fallback or PollingStrategy()
+        self.supported: Optional[bool] = None
+        self._status: Optional[str] = None
+
+    def start(self) -> None:
+        self.fallback.start()
+        self._status = None
+
+    def pause(self, session, links, status, timeout=None):
+        if self.supported is False:
+            return self.fallback.pause(session, links, status, timeout)
+        seconds = self.seconds
+        if timeout is not None:
+            seconds = max(int(min(seconds, timeout)), 1)
+        previous_status = self._status or status
+        start_time = time.time()
+        resp = session.get(
+            links["self"], params={"wait": seconds}, timeout=seconds + 30
+        ).json()
+        diff = time.time() - start_time
+        self._status = resp.get("status")
+        if self._status != previous_status:
+            self.fallback.start()
+            return resp
+        if diff >= seconds / 2:
+            self.supported = True
+            return resp
+        if self.supported is None:
+            log.info(
+                "Server returned after %.3f sec without a status change, falling back to polling",
+                diff,
+            )
+            self.supported = False
+        remaining = None if timeout is None else max(timeout - diff, 0.0)
+        self.fallback.pause(session, links, status, remaining)
+        return resp
+
+
+class EventStreamStrategy(WaitStrategy):
+    """
+    Wait for the server to push a status event over a server-sent events stream.
+
+    The object must expose the stream under `link` in its links and the server must
+    respond with `text/event-stream`, otherwise the fallback strategy is used. The
+    fallback strategy also pauses when the stream cannot be reached or closes without
+    an event, and after `max_failures` connection errors in a row the stream is not
+    used again.
+
+    :param link: Name of the link to the event stream of the object
+    :param seconds: Maximum number of seconds to wait for an event before checking the status
+    :param fallback: Strategy to use if the object has no event stream
+    :param max_failures: Number of connection errors in a row before giving up on the stream
+    """
+
+    def __init__(
+        self,
+        link: str = "status_events",
+        seconds: int = EVENT_STREAM_SECONDS,
+        fallback: Optional[WaitStrategy] = None,
+        max_failures: int = EVENT_STREAM_MAX_FAILURES,
+    ):
+        self.link = link
+        self.seconds = seconds
+        self.fallback = fallback or PollingStrategy()
+        self.max_failures = max_failures
+        self.supported: Optional[bool] = None
+        self.failures = 0
+
+    def start(self) -> None:
+        self.fallback.start()
+
+    def pause(self, session, links, status, timeout=None):
+        url = links.get(self.link)
+        if not url or self.supported is False:
+            return self.fallback.pause(session, links, status, timeout)
+        seconds = self.seconds if timeout is None else min(self.seconds, timeout)
+        start_time = time.time()
+        try:
+            resp = session.get(
+                url,
+                stream=True,
+                headers={"Accept": "text/event-stream"},
+                timeout=(3.0, max(seconds, 0.1)),
+            )
+        except (ConnectionError, ReadTimeout) as ex:
+            self._connection_failed(url, ex)
+            return self._fall_back(session, links, status, timeout, start_time)
+        with resp:
+            if "text/event-stream" not in resp.headers.get("Content-Type", ""):
+                log.info("%s is not an event stream, falling back", url)
+                self.supported = False
+                return self.fallback.pause(session, links, status, timeout)
+            self.supported = True
+            try:
+                for line in resp.iter_lines():
+                    # any event means that the object has changed
+                    if line.startswith(b"data:"):
+                        self.failures = 0
+                        return None
+            except ReadTimeout:
+                # the server kept the stream open for the whole wait time
+                self.failures = 0
+                return None
+            except ConnectionError as ex:
+                self._connection_failed(url, ex)
+                return self._fall_back(session, links, status, timeout, start_time)
+        # the stream closed without an event, so wait before checking the status again
+        return self._fall_back(session, links, status, timeout, start_time)
+
+    def _connection_failed(self, url: str, ex: Exception) -> None:
+        self.failures += 1
+        log.info("Event stream %s failed (%s): %s", url, self.failures, ex)
+        if self.failures >= self.max_failures:
+            log.info("Giving up on event stream %s, falling back", url)
+            self.supported = False
+
+    def _fall_back(self, session, links, status, timeout, start_time):
+        remaining = None
+        if timeout is not None:
+            remaining = max(timeout - (time.time() - start_time), 0.0)
+        return self.fallback.pause(session, links, status, remaining)
+
+
+def default_strategy(poll_period: float = 0.5) -> WaitStrategy:
+    """
+    Regular polling with a linear back-off
+    """
+    return PollingStrategy(poll_period)
@@ -0,0 +1,137 @@
+import asyncio
+import json
+import threading
+from copy import deepcopy
+import responses
+from unittest.mock import patch
+
+from nextcode import Client
+from nextcode.aio import ThreadPoolService, AsyncProxy, AsyncIterator
+from nextcode.exceptions import ServerError
+from tests import BaseTestCase, REFRESH_TOKEN, AUTH_URL, AUTH_RESP
+from tests.test_query import ROOT_URL, ROOT_RESP, QUERIES_URL, QUERY_RESPONSE
+
+
+class AioTest(BaseTestCase):
+    def get_service(self, **kw):
+        responses.add(responses.POST, AUTH_URL, json=AUTH_RESP)
+        responses.add(responses.GET, ROOT_URL, json=ROOT_RESP)
+        client = Client(api_key=REFRESH_TOKEN)
+        return client.async_service("query", project="testproject", **kw)
+
+    @responses.activate
+    def test_concurrent_execute(self):
+        responses.add(responses.POST, QUERIES_URL, json=QUERY_RESPONSE)
+        svc = self.get_service(max_concurrency=4)
+        self.assertIsInstance(svc, ThreadPoolService)
+
+        async def run():
+            async with svc:
+                return await asyncio.gather(
+                    *(svc.execute(f"gor #dbsnp# | top {i}") for i in range(20))
+                )
+
+        queries = asyncio.run(run())
+        self.assertEqual(20, len(queries))
+        self.assertIsInstance(queries[0], AsyncProxy)
+        self.assertEqual("DONE", queries[0].status)
+        # the token and endpoints are only fetched once for all the requests
+        urls = [c.request.url for c in responses.calls]
+        self.assertEqual(1, urls.count(AUTH_URL))
+        self.assertEqual(1, urls.count(ROOT_URL))
+        self.assertEqual(20, urls.count(QUERIES_URL))
+
+    @responses.activate
+    def test_errors(self):
+        responses.add(responses.POST, QUERIES_URL, status=404)
+        svc = self.get_service()
+
+        async def run():
+            async with svc:
+                await svc.execute("gor #dbsnp#;")
+
+        with self.assertRaises(ServerError):
+            asyncio.run(run())
+
+    @responses.activate
+    def test_iter_batches(self):
+        responses.add(
+            responses.GET, QUERY_RESPONSE["links"]["self"], json=QUERY_RESPONSE
+        )
+
+        def result_callback(request):
+            payload = json.loads(request.body)
+            offset, limit = payload["offset"], payload["limit"]
+            data = [[i] for i in range(offset, offset + limit)]
+            return 200, {}, json.dumps({"header": ["num"], "data": data})
+
+        responses.add_callback(
+            responses.GET, QUERY_RESPONSE["links"]["result"], callback=result_callback
+        )
+        svc = self.get_service()
+
+        async def run():
+            async with svc:
+                query = await svc.get_query(QUERY_RESPONSE["query_id"])
+                query.wrapped.line_count = 5
+                batches = query.iter_batches(batch_size=2)
+                self.assertIsInstance(batches, AsyncIterator)
+                return [b async for b in batches]
+
+        with patch("nextcode.services.query.query.RESULTS_PAGE_SIZE", 3):
+            batches = asyncio.run(run())
+        self.assertEqual([[[0], [1]], [[2], [3]], [[4]]], batches)
+
+    @responses.activate
+    def test_attributes(self):
+        running = deepcopy(QUERY_RESPONSE)
+        running["status"] = "RUNNING"
+        threads = []
+
+        def query_callback(request):
+            # the query is running when it is first fetched
+            threads.append(threading.current_thread())
+            ret = running if len(threads) == 1 else QUERY_RESPONSE
+            return 200, {}, json.dumps(ret)
+
+        responses.add_callback(
+            responses.GET, QUERY_RESPONSE["links"]["self"], callback=query_callback
+        )
+        svc = self.get_service()
+
+        async def run():
+            async with svc:
+                query = await svc.get_query(QUERY_RESPONSE["query_id"])
+                # plain attributes are read directly
+                self.assertEqual("RUNNING", query.status)
+                # properties which refresh the query are evaluated on the worker pool
+                self.assertFalse(await query.running)
+                self.assertEqual("DONE", query.status)
+                # attributes the query does not have are looked up by refreshing it
+                with self.assertRaises(AttributeError):
+                    await query.missing
+                with self.assertRaises(AttributeError):
+                    query._missing
+                return threading.current_thread()
+
+        loop_thread = asyncio.run(run())
+        self.assertEqual(3, len(threads))
+        self.assertNotIn(loop_thread, threads)
+
+    @responses.activate
+    def test_shared_pool(self):
+        responses.add(responses.POST, AUTH_URL, json=AUTH_RESP)
+        responses.add(responses.GET, ROOT_URL, json=ROOT_RESP)
+        client = Client(api_key=REFRESH_TOKEN)
+        svc = client.service("query", project="testproject")
+        async_svc = client.async_service("query", project="testproject", max_concurrency=50)
+        adapter = client.transport.adapter
+        self.assertEqual(50, client.transport.pool_maxsize)
+        self.assertIs(adapter, svc.session.get_adapter(ROOT_URL))
+        self.assertIs(adapter, async_svc.wrapped.session.get_adapter(ROOT_URL))
+        async_svc.close()
+        # a smaller pool does not shrink the shared one
+        async_svc = client.async_service("query", project="testproject", max_concurrency=4)
+        self.assertEqual(50, client.transport.pool_maxsize)
+        self.assertIs(adapter, async_svc.wrapped.session.get_adapter(ROOT_URL))
+        async_svc.close()
@@ -1,10 +1,15 @@
-from unittest import TestCase
+from unittest import TestCase, skipUnless
+import json
 import os
+import threading
+import time
 import responses
 from pathlib import Path
 from unittest.mock import patch, MagicMock
 import tempfile
 import shutil
+import subprocess
+import sys
 
 from nextcode import config, Client
 from nextcode.session import ServiceSession
@@ -19,6 +24,12 @@ from tests import BaseTestCase, REFRESH_TOKEN, ACCESS_TOKEN, AUTH_URL, AUTH_RESP
 
 cfg = config.Config()
 
+# maximum cumulative time in milliseconds that `import nextcode` may take, only
+# checked when set since wall-clock timings vary too much between machines
+IMPORT_BUDGET_MS = int(os.environ.get("NEXTCODE_IMPORT_BUDGET_MS") or 0)
+# optional dependencies which must only be imported when a feature needs them
+HEAVY_MODULES = ("pandas", "plotly", "boto3", "botocore", "IPython", "ipywidgets")
+
 
 class BasicTest(BaseTestCase):
     def test_decode_token(self):
@@ -65,3 +76,83 @@ class BasicTest(BaseTestCase):
         config.load_cache("name")
         config.save_cache("name", {})
         os.environ["NEXTCODE_DISABLE_CACHE"] = ""
+
+    def test_cache_entries(self):
+        config.save_cache("name", {"a": 1}, ttl=100)
+        cache_file = config.root_config_folder.joinpath("cache", "name.cache")
+        self.assertTrue(cache_file.exists())
+        self.assertEqual([], list(cache_file.parent.glob("*.tmp")))
+        self.assertEqual({"a": 1}, config.load_cache("name"))
+
+        # entries are served from memory until they expire
+        with patch("nextcode.config._read_cache_file") as read_cache_file:
+            self.assertEqual({"a": 1}, config.load_cache("name"))
+            read_cache_file.assert_not_called()
+
+        # files written by older versions expire with the default ttl
+        with cache_file.open("w") as f:
+            json.dump({"b": 2}, f)
+        config.clear_cache()
+        self.assertIsNone(config.load_cache("name"))
+        # the lock file is kept since other processes might be holding it
+        self.assertFalse(cache_file.exists())
+        self.assertTrue(cache_file.parent.joinpath(".lock").exists())
+        self.assertEqual([], list(cache_file.parent.glob("name.cache*")))
+        with cache_file.open("w") as f:
+            json.dump({"b": 2}, f)
+        self.assertEqual({"b": 2}, config.load_cache("name"))
+
+        # expired entries are removed once they are too old to be revalidated
+        config.save_cache("name", {"a": 1}, ttl=-config.STALE_SECONDS - 1)
+        self.assertIsNone(config.load_cache("name"))
+        self.assertFalse(cache_file.exists())
+
+    def test_cache_revalidate(self):
+        config.save_cache("name", {"a": 1}, ttl=-1)
+        self.assertIsNone(config.load_cache("name"))
+
+        revalidated = threading.Event()
+        release = threading.Event()
+        calls = []
+
+        def revalidate():
+            calls.append(1)
+            release.wait(5)
+            config.save_cache("name", {"a": 2})
+            revalidated.set()
+
+        # stale contents are returned while a single revalidation runs
+        self.assertEqual({"a": 1}, config.load_cache("name", revalidate))
+        self.assertEqual({"a": 1}, config.load_cache("name", revalidate))
+        release.set()
+        self.assertTrue(revalidated.wait(5))
+        self.assertEqual({"a": 2}, config.load_cache("name", revalidate))
+        time.sleep(0.1)
+        self.assertEqual(1, len(calls))
+
+    def test_lazy_imports(self):
+        code = "import sys, nextcode; print(','.join(m for m in %r if m in sys.modules))"
+        proc = subprocess.run(
+            [sys.executable, "-c", code % (HEAVY_MODULES,)],
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        self.assertEqual(proc.stdout.strip(), "")
+
+    @skipUnless(IMPORT_BUDGET_MS, "set NEXTCODE_IMPORT_BUDGET_MS to check the import time")
+    def test_import_time(self):
+        proc = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", "import nextcode"],
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        # lines are formatted as 'import time: self [us] | cumulative | imported package'
+        timings = {}
+        for line in proc.stderr.splitlines():
+            parts = line.split("|")
+            if line.startswith("import time:") and len(parts) == 3:
+                timings[parts[2].strip()] = parts[1].strip()
+        self.assertIn("nextcode", timings)
+        self.assertLess(int(timings["nextcode"]) / 1000, IMPORT_BUDGET_MS)
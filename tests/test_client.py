@@ -1,5 +1,8 @@
 from unittest import TestCase
+from concurrent.futures import ThreadPoolExecutor
 import os
+import time
+import jwt
 import responses
 from pathlib import Path
 from unittest.mock import patch, MagicMock
@@ -8,7 +11,7 @@ import shutil
 
 from nextcode import config, Client
 from nextcode.client import get_api_key
-from nextcode.session import ServiceSession
+from nextcode.session import ServiceSession, TokenManager
 from nextcode.exceptions import (
     InvalidToken,
     InvalidProfile,
@@ -117,6 +120,31 @@ class ClientTest(BaseTestCase):
         ret = Client.available_services()
         self.assertTrue(isinstance(ret, list))
 
+    def test_service_registry(self):
+        plugin = MagicMock()
+        plugin.name = "myservice"
+        plugin.value = "mypackage.service:Service"
+        plugin.load.return_value = MagicMock(spec=["Service"])
+        entry_points = MagicMock()
+        entry_points.select.return_value = [plugin]
+        with patch("nextcode.client._plugin_services", None), patch(
+            "nextcode.client.importlib.metadata.entry_points",
+            return_value=entry_points,
+        ), patch("pkgutil.iter_modules") as iter_modules:
+            self.assertIn("myservice", Client.available_services())
+            self.assertIn("query", Client.available_services())
+            entry_points.select.assert_called_once_with(group="nextcode.services")
+
+            client = Client(api_key=REFRESH_TOKEN)
+            svc = client.service("myservice", project="test")
+            self.assertEqual(svc, plugin.load.return_value.Service.return_value)
+            plugin.load.return_value.Service.assert_called_once_with(
+                client=client, project="test"
+            )
+            with self.assertRaises(ServiceNotFound):
+                client.service("notfound")
+            iter_modules.assert_not_called()
+
     def test_check_resp_error(self):
         resp = MagicMock()
         resp.status_code = 500
@@ -164,6 +192,28 @@ class ClientTest(BaseTestCase):
                 session = ServiceSession(url_base=url_base, api_key=REFRESH_TOKEN)
                 session._initialize()
 
+    @responses.activate
+    def test_revalidate(self):
+        url_base = "https://test.wuxinextcode/api/query"
+        root_info = {"endpoints": {"one": "endpoint"}, "current_user": {"name": "a"}}
+        responses.add(responses.POST, AUTH_URL, json=AUTH_RESP)
+        responses.add(responses.GET, url_base, json=root_info)
+        with patch("nextcode.session.load_cache", return_value=None) as load_cache:
+            session = ServiceSession(url_base=url_base, api_key=REFRESH_TOKEN)
+        self.assertEqual(session._revalidate, load_cache.call_args[1]["revalidate"])
+        session.token = "old"
+        session.headers["Authorization"] = "Bearer old"
+
+        # the cache is refreshed in the background without touching the session in use
+        session._revalidate()
+        self.assertEqual("old", session.token)
+        self.assertEqual("Bearer old", session.headers["Authorization"])
+        self.assertEqual({}, session._root_info)
+        self.assertFalse(session.initialized)
+        cached = config.load_cache(session.cache_name)
+        self.assertEqual(root_info, cached["root_info"])
+        self.assertEqual(ACCESS_TOKEN, cached["token"])
+
     @responses.activate
     def test_url_from_endpoint(self):
         url_base = "https://test.wuxinextcode/api/query"
@@ -187,3 +237,51 @@ class ClientTest(BaseTestCase):
         responses.add(responses.GET, url_base, json={"endpoints": {"one": "endpoint"}})
         session.get(url_base)
         self.assertEqual(session.initialized, True)
+
+    def test_token_manager(self):
+        now = time.time()
+        tokens = [
+            jwt.encode({"iat": now + i, "exp": now + i + 300}, "secret" * 6)
+            for i in range(3)
+        ]
+        calls = []
+
+        def mock_get_access_token(api_key):
+            calls.append(api_key)
+            time.sleep(0.05)
+            return tokens[len(calls) - 1]
+
+        manager = TokenManager.for_api_key(REFRESH_TOKEN)
+        self.assertIs(manager, TokenManager.for_api_key(REFRESH_TOKEN))
+        with patch("nextcode.session.get_access_token", mock_get_access_token):
+            # concurrent callers share a single refresh
+            with ThreadPoolExecutor(8) as executor:
+                ret = list(executor.map(lambda _: manager.get_token(), range(8)))
+            self.assertEqual([tokens[0]] * 8, ret)
+            self.assertEqual(1, len(calls))
+            # the refresh is scheduled ahead of expiry
+            self.assertAlmostEqual(time.time() + 240, manager.refresh_at, delta=5)
+            self.assertIsNotNone(manager._timer)
+
+            # a stale token is only replaced once
+            self.assertEqual(tokens[1], manager.get_token(stale=tokens[0]))
+            self.assertEqual(tokens[1], manager.get_token(stale=tokens[0]))
+            self.assertEqual(2, len(calls))
+
+            # tokens about to expire are refreshed before use
+            manager.refresh_at = time.time() - 1
+            self.assertEqual(tokens[2], manager.get_token())
+            self.assertEqual(3, len(calls))
+
+            manager._refresh_in_background()
+            self.assertEqual(3, len(calls))
+        TokenManager.reset()
+        self.assertIsNone(manager._timer)
+
+        # a stored token is reused while it is valid
+        manager = TokenManager.for_api_key(REFRESH_TOKEN)
+        manager.offer(jwt.encode({"exp": now - 10}, "secret" * 6))
+        self.assertIsNone(manager.token)
+        manager.offer(tokens[0])
+        self.assertEqual(tokens[0], manager.get_token())
+        manager.close()
@@ -0,0 +1,147 @@
+import io
+import responses
+from requests.exceptions import ConnectionError
+
+from nextcode import Client, instrumentation
+from nextcode.exceptions import ServerError
+from nextcode.instrumentation import (
+    Exporter,
+    HistogramCollector,
+    PrometheusExporter,
+    RequestEvent,
+    endpoint_name,
+)
+from tests import BaseTestCase, REFRESH_TOKEN, AUTH_URL, AUTH_RESP
+from tests.test_query import ROOT_URL, ROOT_RESP, QUERIES_URL, QUERY_RESPONSE
+
+
+class InstrumentationTest(BaseTestCase):
+    def setUp(self):
+        super(InstrumentationTest, self).setUp()
+        self.events = []
+        self.collector = HistogramCollector()
+        instrumentation.add_listener(self.events.append)
+        instrumentation.add_listener(self.collector)
+
+    def tearDown(self):
+        instrumentation.remove_listener(self.events.append)
+        instrumentation.remove_listener(self.collector)
+        super(InstrumentationTest, self).tearDown()
+
+    def get_service(self):
+        responses.add(responses.POST, AUTH_URL, json=AUTH_RESP)
+        responses.add(responses.GET, ROOT_URL, json=ROOT_RESP)
+        client = Client(api_key=REFRESH_TOKEN)
+        return client.service("query", project="testproject")
+
+    def test_endpoint_name(self):
+        endpoints = {
+            "queries": "https://server/api/query/query/",
+            "project": "https://server/api/query/projects/{project_name}",
+            "root": "https://server/api/query",
+        }
+        self.assertEqual("queries", endpoint_name("https://server/api/query/query", endpoints))
+        self.assertEqual(
+            "queries/{id}/result",
+            endpoint_name("https://server/api/query/query/123/result?limit=1", endpoints),
+        )
+        self.assertEqual(
+            "project/users",
+            endpoint_name("https://server/api/query/projects/test/users", endpoints),
+        )
+        self.assertEqual("root/other", endpoint_name("https://server/api/query/other", endpoints))
+        self.assertEqual("api/other/{id}", endpoint_name("https://server/api/other/7", endpoints))
+        self.assertEqual("api/other/{id}", endpoint_name("https://server/api/other/7", None))
+
+    @responses.activate
+    def test_request_events(self):
+        svc = self.get_service()
+        responses.add(responses.POST, QUERIES_URL, json=QUERY_RESPONSE)
+        responses.add(responses.GET, QUERY_RESPONSE["links"]["self"], status=404)
+        svc.execute("gor #dbsnp#")
+        with self.assertRaises(ServerError):
+            svc.session.get(QUERY_RESPONSE["links"]["self"])
+        responses.add(
+            responses.GET, QUERIES_URL + "1", body=ConnectionError("connection refused")
+        )
+        with self.assertRaises(ConnectionError):
+            svc.session.get(QUERIES_URL + "1")
+
+        self.assertEqual(3, len(self.events))
+        event = self.events[0]
+        self.assertIsInstance(event, RequestEvent)
+        self.assertEqual("POST", event.method)
+        self.assertEqual("queries", event.endpoint)
+        self.assertEqual(ROOT_URL, event.service)
+        self.assertEqual(200, event.status)
+        self.assertGreater(event.bytes_sent, 0)
+        self.assertGreater(event.bytes_received, 0)
+        self.assertGreaterEqual(event.duration, 0.0)
+        self.assertEqual(0, event.retries)
+        self.assertFalse(event.token_refreshed)
+        self.assertEqual(404, self.events[1].status)
+        self.assertEqual("ConnectionError", self.events[2].error)
+        self.assertIsNone(self.events[2].status)
+
+        summary = self.collector.summary()
+        self.assertEqual(2, len(summary))
+        stats = {(row["method"], row["endpoint"]): row for row in summary}
+        self.assertEqual(1, stats[("POST", "queries")]["count"])
+        self.assertEqual(
+            {"404": 1, "ConnectionError": 1}, stats[("GET", "queries/{id}")]["statuses"]
+        )
+        self.assertEqual(2, stats[("GET", "queries/{id}")]["errors"])
+
+    @responses.activate
+    def test_token_refresh_event(self):
+        svc = self.get_service()
+        responses.add(responses.GET, QUERIES_URL, status=401)
+        with self.assertRaises(ServerError):
+            svc.session.get(QUERIES_URL)
+        # the second attempt is sent after refreshing the token
+        self.assertEqual(2, len(self.events))
+        self.assertFalse(self.events[0].token_refreshed)
+        self.assertTrue(self.events[1].token_refreshed)
+
+    def test_histogram(self):
+        collector = HistogramCollector(buckets=(0.1, 1.0))
+        for duration in (0.05, 0.5, 0.5, 2.0):
+            collector(RequestEvent("GET", "url", "queries", "svc", 200, duration=duration))
+        collector(RequestEvent("POST", "url", "queries", "svc", 200, duration=0.01))
+        histograms = collector.histograms()
+        self.assertEqual(["GET", "POST"], [h.method for h in histograms])
+        histogram = histograms[0]
+        self.assertEqual([1, 2, 1], histogram.bucket_counts)
+        self.assertEqual(4, histogram.count)
+        self.assertAlmostEqual(3.05, histogram.total_time)
+        self.assertAlmostEqual(0.55, histogram.quantile(0.5))
+        self.assertEqual(2.0, histogram.quantile(1.0))
+
+        # exporters must implement export
+        with self.assertRaises(TypeError):
+            Exporter()
+
+        stream = io.StringIO()
+        collector.export(PrometheusExporter(stream))
+        text = stream.getvalue()
+        self.assertIn(
+            'nextcode_request_duration_seconds_bucket{method="GET",endpoint="queries",le="1.0"} 3',
+            text,
+        )
+        self.assertIn(
+            'nextcode_request_duration_seconds_count{method="GET",endpoint="queries"} 4',
+            text,
+        )
+        collector.reset()
+        self.assertEqual([], collector.summary())
+
+    def test_failing_listener(self):
+        def fail(event):
+            raise RuntimeError("failed")
+
+        instrumentation.add_listener(fail)
+        try:
+            instrumentation.emit(RequestEvent("GET", "url", "queries", "svc", 200))
+        finally:
+            instrumentation.remove_listener(fail)
+        self.assertEqual(1, len(self.events))
@@ -12,6 +12,7 @@ from nextcode.services.query.exceptions import QueryError
 from nextcode.services.phenotype.exceptions import PhenotypeError
 from tests import BaseTestCase, REFRESH_TOKEN, AUTH_RESP, AUTH_URL, cfg
 from nextcode import config
+from nextcode.session import TokenManager
 
 WORKFLOW_URL = "https://test.wuxinextcode.com/workflow"
 PIPELINES_URL = WORKFLOW_URL + '/pipelines'
@@ -151,6 +152,7 @@ class TestNextcode(unittest.TestCase):
         config.root_config_folder = Path(self.temp_dir)
         self.config = config.Config()
         config._init_config()
+        TokenManager.reset()
         # Remove env variables because you cannot trust
         # other tests to clean up after themselves
         env.pop('GOR_API_KEY', None)
@@ -235,6 +237,26 @@ class TestNextcode(unittest.TestCase):
         workflow_status = nc.workflow.status()
         assert_equal(workflow_status, {'root': None})
 
+    @responses.activate
+    def test_shared_transport(self):
+        nc = Nextcode(api_key=REFRESH_TOKEN)
+        # services are only created when they are used
+        assert_not_in('query', nc.__dict__)
+        responses.post(AUTH_URL, json=AUTH_RESP)
+        responses.get(QUERY_URL, json=QUERY_ROOT_RSP)
+        responses.get(WORKFLOW_URL, json=WORKFLOW_ROOT_RESP)
+        nc.query.session._initialize()
+        nc.workflow.session._initialize()
+        assert_is(nc.query, nc.query)
+        assert_equal(
+            1, len([c for c in responses.calls if c.request.url == AUTH_URL])
+        )
+        assert_equal(nc.query.session.token, nc.workflow.session.token)
+        assert_is(
+            nc.query.session.get_adapter(QUERY_URL),
+            nc.workflow.session.get_adapter(WORKFLOW_URL),
+        )
+
     @responses.activate
     def test_phenoteke(self):
         # To be added later... perhaps
@@ -52,7 +52,7 @@ class PackageLocalTest(BaseTestCase):
         svc.app_info = {"scratch_bucket": "testbucket"}
         with patch("os.walk") as mockwalk, patch(
             "nextcode.packagelocal.ZipFile"
-        ), patch("nextcode.packagelocal.boto3"), patch("nextcode.packagelocal.sleep"):
+        ), patch("boto3.resource"), patch("boto3.client"), patch("nextcode.packagelocal.sleep"):
             mockwalk.return_value = [
                 ("/.foo", ("bar",), ("baz",)),
                 ("/foo", ("bar",), ("baz",)),
@@ -0,0 +1,111 @@
+import json
+import responses
+from unittest.mock import patch
+
+from nextcode import Client
+from nextcode.exceptions import ServerError
+from tests import BaseTestCase, REFRESH_TOKEN, AUTH_RESP, AUTH_URL
+
+PHENOTEKE_URL = "https://test.wuxinextcode.com/phenoteke/api/v1"
+MAPPING_URL = PHENOTEKE_URL + "/cids_to_ipns_mapping"
+
+ROOT_RESP = {
+    "endpoints": {"root": PHENOTEKE_URL, "health": PHENOTEKE_URL + "/health"},
+    "service_name": "phenoteke",
+}
+
+
+def mapping_callback(request):
+    payload = json.loads(request.body)
+    data = [{"cid": cid, "ipn": "IPN" + cid} for cid in payload["cids"] if cid != "unknown"]
+    return 200, {}, json.dumps({"data": data})
+
+
+class PhenotekeTest(BaseTestCase):
+    def get_service(self, **kw):
+        responses.add(responses.POST, AUTH_URL, json=AUTH_RESP)
+        responses.add(responses.GET, PHENOTEKE_URL, json=ROOT_RESP)
+        client = Client(api_key=REFRESH_TOKEN)
+        svc = client.service("phenoteke", **kw)
+        svc.session._initialize()
+        responses.calls.reset()
+        return svc
+
+    @responses.activate
+    def test_map_cids_to_ipns(self):
+        svc = self.get_service(mapping_batch_size=10, mapping_workers=4)
+        responses.add_callback(
+            responses.POST,
+            MAPPING_URL,
+            callback=mapping_callback,
+            content_type="application/json",
+        )
+        cids = [str(i) for i in range(95)] + ["unknown"]
+        result = svc.map_cids_to_ipns("site", "study", cids, subcategory_id="sub")
+        self.assertEqual([{"cid": c, "ipn": "IPN" + c} for c in cids[:-1]], result)
+        self.assertEqual(10, len(responses.calls))
+        payload = json.loads(responses.calls[0].request.body)
+        self.assertEqual(
+            {"site_id": "site", "study_id": "study", "subcategory_id": "sub"},
+            {k: v for k, v in payload.items() if k != "cids"},
+        )
+
+        # cids which have been mapped before are not requested again
+        responses.calls.reset()
+        result = svc.map_cids_to_ipns("site", "study", ["5", "100", "1"], subcategory_id="sub")
+        self.assertEqual(["IPN5", "IPN100", "IPN1"], [r["ipn"] for r in result])
+        self.assertEqual(1, len(responses.calls))
+        self.assertEqual(["100"], json.loads(responses.calls[0].request.body)["cids"])
+
+        # the mapping depends on the study
+        responses.calls.reset()
+        svc.map_cids_to_ipns("site", "other", ["5"], subcategory_id="sub")
+        self.assertEqual(1, len(responses.calls))
+
+        svc.clear_mapping_cache()
+        responses.calls.reset()
+        svc.map_cids_to_ipns("site", "study", ["5"], subcategory_id="sub")
+        self.assertEqual(1, len(responses.calls))
+
+    @responses.activate
+    def test_map_cids_to_ipns_retry(self):
+        svc = self.get_service(mapping_retries=1)
+        responses.add(responses.POST, MAPPING_URL, status=502)
+        responses.add_callback(
+            responses.POST,
+            MAPPING_URL,
+            callback=mapping_callback,
+            content_type="application/json",
+        )
+        with patch("nextcode.services.phenoteke.service.time.sleep") as sleep:
+            result = svc.map_cids_to_ipns("site", "study", ["1", "2"])
+        self.assertEqual(["IPN1", "IPN2"], [r["ipn"] for r in result])
+        sleep.assert_called_once_with(1)
+
+        responses.replace(responses.POST, MAPPING_URL, status=502)
+        with patch("nextcode.services.phenoteke.service.time.sleep"):
+            with self.assertRaises(ServerError):
+                svc.map_cids_to_ipns("site", "study", ["3"])
+
+        # client errors are not retried
+        responses.replace(responses.POST, MAPPING_URL, status=403)
+        responses.calls.reset()
+        with patch("nextcode.services.phenoteke.service.time.sleep") as sleep:
+            with self.assertRaises(ServerError) as ctx:
+                svc.map_cids_to_ipns("site", "study", ["4"])
+        self.assertEqual(403, ctx.exception.status_code)
+        self.assertEqual(1, len(responses.calls))
+        sleep.assert_not_called()
+
+    @responses.activate
+    def test_map_duplicate_cids(self):
+        svc = self.get_service()
+        responses.add_callback(
+            responses.POST,
+            MAPPING_URL,
+            callback=mapping_callback,
+            content_type="application/json",
+        )
+        result = svc.map_cids_to_ipns("site", "study", ["2", "1", "2"])
+        self.assertEqual(["IPN2", "IPN1"], [r["ipn"] for r in result])
+        self.assertEqual(["2", "1"], json.loads(responses.calls[0].request.body)["cids"])
@@ -1,10 +1,13 @@
 import datetime
+import json
+import re
 import responses
+from urllib.parse import parse_qs
 from copy import deepcopy
 from unittest import mock
 from unittest import skipUnless
 
-from nextcode import Client
+from nextcode import Client, config
 from nextcode.exceptions import ServerError
 from nextcode.services.phenotype.exceptions import PhenotypeError
 from tests import BaseTestCase, REFRESH_TOKEN, AUTH_RESP, AUTH_URL
@@ -15,6 +18,12 @@ try:
 except ModuleNotFoundError:
     PANDAS_INSTALLED = False
 
+try:
+    import pyarrow
+    PYARROW_INSTALLED = True
+except ModuleNotFoundError:
+    PYARROW_INSTALLED = False
+
 dt = datetime.datetime.utcnow().isoformat()
 
 PHENOTYPE_URL = "https://test.wuxinextcode.com/api/phenotype-catalog"
@@ -186,6 +195,38 @@ class PhenotypeTest(BaseTestCase):
             _ = self.svc.get_phenotype("not_exists")
         self.assertIn("Phenotype not found", repr(ctx.exception))
 
+    @responses.activate
+    def test_get_phenotypes_paginated(self):
+        all_phenotypes = [dict(PHENOTYPE_RESP, name=f"pheno{i}") for i in range(250)]
+
+        def callback(request):
+            params = parse_qs(request.body)
+            offset, limit = int(params["offset"][0]), int(params["limit"][0])
+            self.assertLessEqual(limit, 100)
+            return 200, {}, json.dumps({"phenotypes": all_phenotypes[offset:offset + limit]})
+
+        responses.add_callback(
+            responses.GET,
+            PHENOTYPE_URL + f"/projects/{PROJECT}/phenotypes",
+            callback=callback,
+            content_type="application/json",
+        )
+        phenotypes = self.svc.get_phenotypes(limit=1000)
+        self.assertEqual(
+            [p["name"] for p in all_phenotypes], [p.data["name"] for p in phenotypes]
+        )
+
+        phenotypes = self.svc.get_phenotypes(limit=150)
+        self.assertEqual(150, len(phenotypes))
+        self.assertEqual("pheno149", phenotypes[-1].data["name"])
+
+        responses.calls.reset()
+        self.svc.page_size = 50
+        self.svc.page_workers = 1
+        phenotypes = self.svc.get_phenotypes(limit=1000)
+        self.assertEqual(250, len(phenotypes))
+        self.assertEqual(6, len(responses.calls))
+
     @responses.activate
     def test_create_phenotype(self):
         result_type = "SET"
@@ -267,6 +308,46 @@ class PhenotypeTest(BaseTestCase):
         with self.assertRaises(TypeError):
             _ = phenotype.upload("invalid")
 
+    @responses.activate
+    @skipUnless(PANDAS_INSTALLED, "pandas library is not installed")
+    def test_upload_chunked(self):
+        ret = {"phenotype": dict(PHENOTYPE_RESP, result_type="QT")}
+        responses.add(
+            responses.POST, PHENOTYPE_URL + f"/projects/{PROJECT}/phenotypes", json=ret
+        )
+        phenotype = self.svc.create_phenotype(PHENOTYPE_NAME, "QT")
+
+        bodies = []
+
+        def callback(request):
+            bodies.append(json.loads(b"".join(request.body)))
+            return 200, {}, json.dumps({"a": "b"})
+
+        responses.add_callback(
+            responses.POST,
+            PHENOTYPE_URL + f"/projects/{PROJECT}/phenotypes/{PHENOTYPE_NAME}/upload",
+            callback=callback,
+        )
+        df = pandas.DataFrame(
+            {"pn": [f"PN{i}" for i in range(25)], "value": [i / 2 for i in range(25)]}
+        )
+        df.loc[3, "value"] = float("nan")
+        progress = []
+        result = phenotype.upload(
+            df, chunk_size=10, callback=lambda sent, total: progress.append((sent, total))
+        )
+        self.assertEqual({"a": "b"}, result)
+        expected = [[f"PN{i}", None if i == 3 else i / 2] for i in range(25)]
+        self.assertEqual({"data": expected}, bodies[-1])
+        self.assertEqual([(10, 25), (20, 25), (25, 25)], progress)
+
+        phenotype.upload([["a"], ["b"], ["c"]], chunk_size=2)
+        self.assertEqual({"data": [["a"], ["b"], ["c"]]}, bodies[-1])
+        phenotype.upload([], chunk_size=2)
+        self.assertEqual({"data": []}, bodies[-1])
+        with self.assertRaises(TypeError):
+            _ = phenotype.upload("invalid", chunk_size=2)
+
     @responses.activate
     @skipUnless(PANDAS_INSTALLED, "pandas library is not installed")
     def test_phenotype_get_data(self):
@@ -357,6 +438,244 @@ class PhenotypeTest(BaseTestCase):
         df = matrix.get_data()
         self.assertIn("blu", df.to_string())
 
+    @responses.activate
+    def test_playlist_phenotypes(self):
+        from nextcode.services.phenotype.playlist import Playlist
+
+        playlist_url = PROJECTS_URL + f"/{PROJECT}/playlists/{PLAYLIST_ID}"
+        members = {}
+
+        def add_callback(request):
+            name = json.loads(request.body)["name"]
+            members[name] = {"name": name}
+            return 200, {}, json.dumps({})
+
+        def delete_callback(request):
+            if not members.pop(request.url.rsplit("/", 1)[-1], None):
+                return 404, {}, json.dumps({"code": 404})
+            return 200, {}, json.dumps({})
+
+        def get_callback(request):
+            data = {
+                "name": "playlist",
+                "project_key": PROJECT,
+                "phenotypes": sorted(members.values(), key=lambda p: p["name"]),
+                "links": {"self": playlist_url},
+            }
+            return 200, {}, json.dumps({"playlist": data})
+
+        responses.add_callback(responses.POST, playlist_url + "/phenotypes", callback=add_callback)
+        responses.add_callback(
+            responses.DELETE,
+            re.compile(playlist_url + "/phenotypes/.+"),
+            callback=delete_callback,
+        )
+        responses.add_callback(responses.GET, playlist_url, callback=get_callback)
+
+        playlist = Playlist(self.svc.session, {"name": "playlist", "links": {"self": playlist_url}})
+        names = [f"pheno{i:02d}" for i in range(20)]
+        responses.calls.reset()
+        playlist.add_phenotypes(names + names[:2])
+        self.assertEqual(names, playlist.list_phenotypes())
+        # one request per phenotype and a single refresh
+        self.assertEqual(21, len(responses.calls))
+
+        responses.calls.reset()
+        playlist.delete_phenotypes(names[:10])
+        self.assertEqual(names[10:], playlist.list_phenotypes())
+        self.assertEqual(11, len(responses.calls))
+
+        # the playlist is refreshed even if a phenotype could not be deleted
+        responses.calls.reset()
+        with self.assertRaises(ServerError):
+            playlist.delete_phenotypes(["missing"])
+        self.assertEqual(responses.GET, responses.calls[-1].request.method)
+
+    @responses.activate
+    @skipUnless(PANDAS_INSTALLED, "pandas library is not installed")
+    def test_phenotype_matrix_groups(self):
+        names = [f"pheno{i}" for i in range(10)]
+        # each phenotype has a value for every other pn, shifted by its index
+        data = {name: {f"PN{j:02d}": i * j for j in range(i, 20, 2)} for i, name in enumerate(names)}
+        requests = []
+
+        def matrix_callback(request):
+            phenotypes = json.loads(request.body)["phenotypes"]
+            requests.append([p["name"] for p in phenotypes])
+            columns = [p["label"] or p["name"] for p in phenotypes]
+            pns = sorted({pn for p in phenotypes for pn in data[p["name"]]})
+            lines = ["\t".join(["pn"] + columns)]
+            for pn in pns:
+                values = [data[p["name"]].get(pn, p["missing_value"] or "") for p in phenotypes]
+                lines.append("\t".join([pn] + [str(v) for v in values]))
+            return 200, {}, "\n".join(lines)
+
+        responses.add_callback(
+            responses.POST,
+            PHENOTYPE_URL + f"/projects/{PROJECT}/get_phenotype_matrix",
+            callback=matrix_callback,
+        )
+        matrix = self.svc.get_phenotype_matrix()
+        matrix.add_phenotypes(names, missing_value="-1")
+        matrix.add_phenotype("pheno3", missing_value="-1", label="third")
+        expected = matrix.get_data()
+        self.assertEqual(1, len(requests))
+        self.assertEqual(1, len(matrix.timings))
+
+        requests.clear()
+        df = matrix.get_data(group_size=3, max_workers=2)
+        self.assertEqual(
+            sorted([names[0:3], names[3:6], names[6:9], names[9:]]), sorted(requests)
+        )
+        pandas.testing.assert_frame_equal(expected, df, check_dtype=False)
+        self.assertEqual(4, len(matrix.timings))
+        self.assertEqual(names[0:3], matrix.timings[0]["phenotypes"])
+        self.assertGreaterEqual(matrix.timings[0]["seconds"], 0.0)
+
+    @responses.activate
+    @skipUnless(PANDAS_INSTALLED, "pandas is not installed")
+    def test_phenotype_matrix_compact(self):
+        tsv = "\n".join(
+            [
+                "pn\tset\tqt\tcat\tunknown\tlabeled",
+                "PN1\t1\t1.5\tred\t1\ty",
+                "PN2\t\t2.5\tblue\t\tn",
+                "PN3\t1\t\t\t0\ty",
+            ]
+        )
+        responses.add(
+            responses.POST,
+            PHENOTYPE_URL + f"/projects/{PROJECT}/get_phenotype_matrix",
+            body=tsv,
+        )
+        responses.add(
+            responses.GET,
+            PROJECTS_URL + f"/{PROJECT}/phenotypes",
+            json={"phenotypes": [dict(PHENOTYPE_RESP, name="unknown", result_type="SET")]},
+        )
+        matrix = self.svc.get_phenotype_matrix()
+        matrix.add_phenotypes(
+            ["set", "qt", "cat"],
+            result_types={"set": "SET", "qt": "QT", "cat": "CATEGORY"},
+        )
+        matrix.add_phenotype("unknown")
+        matrix.add_phenotype("other", label="labeled", result_type="SET")
+
+        df = matrix.get_data()
+        self.assertEqual("float64", str(df["qt"].dtype))
+        self.assertEqual(1, len(responses.calls))
+        self.assertNotIn("result_type", json.loads(responses.calls[0].request.body)["phenotypes"][0])
+
+        responses.calls.reset()
+        df = matrix.get_data(compact=True)
+        # the result type of the unknown phenotype is looked up in the catalog
+        self.assertEqual(2, len(responses.calls))
+        self.assertEqual("uint8", str(df["set"].dtype))
+        self.assertEqual([1, 0, 1], list(df["set"]))
+        self.assertEqual("float32", str(df["qt"].dtype))
+        self.assertEqual("category", str(df["cat"].dtype))
+        self.assertEqual(["blue", "red"], list(df["cat"].cat.categories))
+        self.assertEqual("uint8", str(df["unknown"].dtype))
+        # values which do not fit the result type are left as they are
+        self.assertEqual(["y", "n", "y"], list(df["labeled"]))
+
+    @responses.activate
+    @skipUnless(PANDAS_INSTALLED and PYARROW_INSTALLED, "pandas or pyarrow is not installed")
+    def test_phenotype_store(self):
+        store = self.svc.enable_store()
+        data = {
+            "pheno_a": {"PN1": 1.5, "PN2": 2.5},
+            "pheno_b": {"PN2": 1, "PN3": 2},
+        }
+        updated = {"pheno_a": "2020-01-01", "pheno_b": "2020-01-01"}
+        fetched = []
+        requests_made = []
+
+        def list_callback(request):
+            names = parse_qs(request.body)["names"][0].split(",")
+            phenotypes = [
+                dict(PHENOTYPE_RESP, name=name, updated_at=updated[name])
+                for name in names
+                if name in updated
+            ]
+            return 200, {}, json.dumps({"phenotypes": phenotypes})
+
+        def matrix_callback(request):
+            content = json.loads(request.body)
+            names = [p["name"] for p in content["phenotypes"]]
+            fetched.extend(names)
+            requests_made.append(names)
+            pns = sorted({pn for name in names for pn in data[name]})
+            lines = ["\t".join(["pn"] + names)]
+            for pn in pns:
+                lines.append("\t".join([pn] + [str(data[n].get(pn, "")) for n in names]))
+            return 200, {}, "\n".join(lines)
+
+        responses.add_callback(
+            responses.GET, PROJECTS_URL + f"/{PROJECT}/phenotypes", callback=list_callback
+        )
+        responses.add_callback(
+            responses.POST,
+            PHENOTYPE_URL + f"/projects/{PROJECT}/get_phenotype_matrix",
+            callback=matrix_callback,
+        )
+
+        def get_data():
+            matrix = self.svc.get_phenotype_matrix()
+            matrix.add_phenotype("pheno_a")
+            matrix.add_phenotype("pheno_b", missing_value="-9", label="B")
+            return matrix.get_data()
+
+        df = get_data()
+        self.assertEqual(["pn", "pheno_a", "B"], list(df.columns))
+        self.assertEqual(["PN1", "PN2", "PN3"], list(df["pn"]))
+        self.assertEqual([1.5, 2.5], list(df["pheno_a"][:2]))
+        self.assertTrue(pandas.isna(df["pheno_a"][2]))
+        self.assertEqual([-9, 1, 2], list(df["B"]))
+        # the stale phenotypes are fetched in a single request
+        self.assertEqual([["pheno_a", "pheno_b"]], requests_made)
+        self.assertEqual(store.folder, config.root_config_folder.joinpath("phenotypes"))
+
+        # the phenotypes are read from the store until they are updated on the server
+        fetched.clear()
+        pandas.testing.assert_frame_equal(df, get_data())
+        self.assertEqual([], fetched)
+        self.assertEqual(2, store.stats["hits"])
+
+        updated["pheno_a"] = "2020-02-01"
+        data["pheno_a"]["PN4"] = 4.5
+        df = get_data()
+        self.assertEqual(["pheno_a"], fetched)
+        self.assertEqual(["PN1", "PN2", "PN3", "PN4"], list(df["pn"]))
+        self.assertEqual([-9, 1, 2, -9], list(df["B"]))
+
+        # stale phenotypes are fetched in groups, but stored one column at a time
+        updated["pheno_a"] = updated["pheno_b"] = "2020-03-01"
+        fetched.clear()
+        requests_made.clear()
+        matrix = self.svc.get_phenotype_matrix()
+        matrix.add_phenotypes(["pheno_a", "pheno_b"])
+        df = matrix.get_data(group_size=1)
+        self.assertEqual([["pheno_a"], ["pheno_b"]], requests_made)
+        self.assertEqual(["PN1", "PN2", "PN3", "PN4"], list(df["pn"]))
+        requests_made.clear()
+        matrix = self.svc.get_phenotype_matrix()
+        matrix.add_phenotype("pheno_b")
+        df = matrix.get_data()
+        self.assertEqual([], requests_made)
+        self.assertEqual(["PN2", "PN3"], list(df["pn"]))
+
+        # matrices with a base are fetched from the server
+        fetched.clear()
+        matrix = self.svc.get_phenotype_matrix(base="pheno_b")
+        matrix.add_phenotypes(["pheno_a", "pheno_b"])
+        matrix.get_data()
+        self.assertEqual(["pheno_a", "pheno_b"], fetched)
+
+        self.svc.disable_store()
+        self.assertIsNone(self.svc.get_phenotype_matrix().store)
+        store.clear()
+
     @responses.activate
     def test_create_analysis_catalog(self):
         playlist = PLAYLIST_ID
@@ -5,14 +5,17 @@ import responses
 from pathlib import Path
 from copy import deepcopy
 from unittest import skipUnless
-from requests.exceptions import RetryError
+from requests.exceptions import RetryError, ConnectionError as RequestsConnectionError
 from urllib3.exceptions import MaxRetryError
 from unittest.mock import patch, MagicMock, PropertyMock
 
+from nextcode import config
 from nextcode.exceptions import InvalidToken, InvalidProfile, ServerError
 from nextcode.utils import decode_token, jupyter_available
 from nextcode.client import Client
-from nextcode.services.query.query import _log_download_progress
+from nextcode.services.query.query import Query, _log_download_progress
+from nextcode.wait import PollingStrategy, LongPollStrategy, EventStreamStrategy
+from nextcode.services.query.cache import ResultCache, normalize_query
 
 from tests import BaseTestCase, REFRESH_TOKEN, ACCESS_TOKEN, AUTH_URL, AUTH_RESP
 from nextcode.services.query.exceptions import (
@@ -25,6 +28,11 @@ try:
     PANDAS_INSTALLED = True
 except ModuleNotFoundError:
     PANDAS_INSTALLED = False
+try:
+    import pyarrow.parquet as pq
+    PYARROW_INSTALLED = True
+except ModuleNotFoundError:
+    PYARROW_INSTALLED = False
 
 ROOT_URL = "https://test.wuxinextcode.com/api/query"
 WAKEUP_URL = ROOT_URL + "/wakeup/"
@@ -349,6 +357,93 @@ class QueryTest(BaseTestCase):
         with self.assertRaises(MissingRelations):
             self.svc.execute("gor #dbsnp#;", name="file")
 
+    @responses.activate
+    def test_execute_many(self):
+        payloads = []
+        polls = {}
+
+        def query_response(query_id, status):
+            ret = deepcopy(QUERY_RESPONSE)
+            ret["query_id"] = query_id
+            ret["status"] = status
+            ret["links"]["self"] = f"{QUERIES_URL}{query_id}"
+            return ret
+
+        def submit_callback(request):
+            payload = json.loads(request.body)
+            payloads.append(payload)
+            query_id = len(payloads)
+            # the first query finishes right away, the others after being polled
+            status = "DONE" if query_id == 1 else "RUNNING"
+            return 200, {}, json.dumps(query_response(query_id, status))
+
+        def status(query_id):
+            if polls.get(query_id, 0) < query_id:
+                return "RUNNING"
+            return "FAILED" if query_id == 2 else "DONE"
+
+        def list_callback(request):
+            # each poll of the query list moves the submitted queries along
+            ret = []
+            for query_id in range(2, len(payloads) + 1):
+                polls[query_id] = polls.get(query_id, 0) + 1
+                ret.append(query_response(query_id, status(query_id)))
+            return 200, {}, json.dumps({"queries": ret})
+
+        def query_callback(request):
+            query_id = int(request.url.rsplit("/", 1)[-1])
+            return 200, {}, json.dumps(query_response(query_id, status(query_id)))
+
+        responses.add_callback(responses.POST, QUERIES_URL, callback=submit_callback)
+        responses.add_callback(responses.GET, QUERIES_URL, callback=list_callback)
+        for query_id in range(2, 5):
+            responses.add_callback(
+                responses.GET, f"{QUERIES_URL}{query_id}", callback=query_callback
+            )
+        queries = [f"gor #dbsnp# | top {i}" for i in range(3)]
+        queries.append(
+            {"query": "gor [other]", "relations": [{"name": "[other]", "data": "x"}]}
+        )
+        with patch("nextcode.services.query.service.time.sleep") as sleep:
+            results = list(self.svc.execute_many(queries, max_in_flight=2, shared="a"))
+
+        self.assertEqual([1, 2, 3, 4], [q.query_id for q in results])
+        self.assertEqual(["DONE", "FAILED", "DONE", "DONE"], [q.status for q in results])
+        self.assertEqual(4, len(payloads))
+        # running queries are polled through the query list, and each finished query
+        # is fetched once
+        gets = [c.request.url for c in responses.calls if c.request.method == "GET"]
+        self.assertEqual(
+            [f"{QUERIES_URL}{query_id}" for query_id in (2, 3, 4)],
+            sorted(url for url in gets if url != QUERIES_URL),
+        )
+        self.assertEqual(sleep.call_count, gets.count(QUERIES_URL))
+        # the shared relation is only uploaded once
+        relations = [p["relations"] for p in payloads]
+        self.assertEqual("#a", relations[0][0]["data"])
+        self.assertTrue(all(r[0]["data"] is None for r in relations[1:]))
+        self.assertEqual(1, len({r[0]["fingerprint"] for r in relations}))
+        self.assertEqual("#x", relations[3][1]["data"])
+
+        # relations the server no longer has are uploaded again
+        def forgetful_callback(request):
+            payload = json.loads(request.body)
+            payloads.append(payload)
+            if any(r["data"] is None for r in payload["relations"]):
+                error = {"virtual_relations": [{"name": "[shared]"}]}
+                return 409, {}, json.dumps({"code": 409, "error": error})
+            return 200, {}, json.dumps(query_response(len(payloads), "DONE"))
+
+        payloads.clear()
+        responses.remove(responses.POST, QUERIES_URL)
+        responses.add_callback(
+            responses.POST, QUERIES_URL, callback=forgetful_callback
+        )
+        queries = ["gor [shared]", "gor [shared] | top 1"]
+        results = list(self.svc.execute_many(queries, max_in_flight=1, shared="a"))
+        self.assertEqual(2, len(results))
+        self.assertEqual(["#a", None, "#a"], [p["relations"][0]["data"] for p in payloads])
+
     @responses.activate
     def test_server_error(self):
         responses.add(responses.POST, QUERIES_URL, status=404)
@@ -385,6 +480,39 @@ class QueryTest(BaseTestCase):
         with self.assertRaises(RetryError):
             query = self.svc.get_query(888)
 
+    @responses.activate
+    def test_refresh_queries(self):
+        running = []
+        for query_id in (1, 2):
+            payload = deepcopy(QUERY_RESPONSE)
+            payload["query_id"] = query_id
+            payload["status"] = "RUNNING"
+            payload["links"]["self"] = f"{QUERIES_URL}{query_id}"
+            del payload["stats"]
+            running.append(payload)
+        responses.add(responses.GET, QUERIES_URL, json={"queries": running})
+
+        # listing running queries does not refresh each of them
+        queries = self.svc.get_queries(partial=True)
+        self.assertEqual(1, len(responses.calls))
+        self.assertTrue(all(q.running for q in queries))
+        self.assertFalse(hasattr(queries[0], "line_count"))
+        self.assertEqual(1, len(responses.calls))
+
+        # one query finished and the other one dropped out of the list
+        done = deepcopy(running[0])
+        done["status"] = "DONE"
+        responses.replace(responses.GET, QUERIES_URL, json={"queries": [done]})
+        failed = deepcopy(running[1])
+        failed["status"] = "FAILED"
+        responses.add(responses.GET, running[1]["links"]["self"], json=failed)
+        self.svc.refresh_queries(queries)
+        self.assertEqual(["DONE", "FAILED"], [q.status for q in queries])
+        self.assertEqual(3, len(responses.calls))
+        payload = json.loads(responses.calls[1].request.body)
+        self.assertEqual(QUERY_RESPONSE["project_name"], payload["project"])
+        self.assertEqual(QUERY_RESPONSE["user_name"], payload["user_name"])
+
     @responses.activate
     def test_get_results(self):
         responses.add(responses.GET, QUERIES_URL, json={"queries": [QUERY_RESPONSE]})
@@ -415,6 +543,63 @@ class QueryTest(BaseTestCase):
             query.get_results()
         self.assertIn("is PENDING", str(ctx.exception))
 
+    @responses.activate
+    def test_get_results_paged(self):
+        responses.add(
+            responses.GET, QUERY_RESPONSE["links"]["self"], json=QUERY_RESPONSE
+        )
+        query = self.svc.get_query(QUERY_RESPONSE["query_id"])
+        query.line_count = 5
+
+        def result_callback(request):
+            payload = json.loads(request.body)
+            offset, limit = payload["offset"], payload["limit"]
+            rows = "".join(f"{i}\n" for i in range(offset, offset + limit))
+            header = "" if payload["skipheader"] else "col\n"
+            return 200, {}, header + rows
+
+        responses.add_callback(
+            responses.GET, QUERY_RESPONSE["links"]["result"], callback=result_callback
+        )
+        progress = []
+
+        def callback(received, total):
+            progress.append((received, total))
+
+        with patch("nextcode.services.query.query.RESULTS_PAGE_SIZE", 2):
+            sequential = query.get_results(is_json=False)
+            parallel = query.get_results(
+                is_json=False, max_workers=3, callback=callback
+            )
+        self.assertEqual("col\n0\n1\n2\n3\n4\n", sequential)
+        self.assertEqual(sequential, parallel)
+        self.assertEqual([(2, 5), (4, 5), (5, 5)], progress)
+
+    @responses.activate
+    def test_iter_batches(self):
+        responses.add(
+            responses.GET, QUERY_RESPONSE["links"]["self"], json=QUERY_RESPONSE
+        )
+        query = self.svc.get_query(QUERY_RESPONSE["query_id"])
+        query.line_count = 7
+
+        def result_callback(request):
+            payload = json.loads(request.body)
+            offset, limit = payload["offset"], payload["limit"]
+            data = [[i, str(i)] for i in range(offset, offset + limit)]
+            return 200, {}, json.dumps({"header": ["num", "txt"], "data": data})
+
+        responses.add_callback(
+            responses.GET, QUERY_RESPONSE["links"]["result"], callback=result_callback
+        )
+        with patch("nextcode.services.query.query.RESULTS_PAGE_SIZE", 3):
+            batches = list(query.iter_batches(batch_size=2, max_workers=2))
+            rows = list(query.iter_rows(limit=4))
+        self.assertEqual([2, 2, 2, 1], [len(b) for b in batches])
+        self.assertEqual([[i, str(i)] for i in range(7)], sum(batches, []))
+        self.assertEqual(["num", "txt"], query.result_header)
+        self.assertEqual([[i, str(i)] for i in range(4)], rows)
+
     @responses.activate
     def test_wait(self):
         responses.add(
@@ -435,14 +620,14 @@ class QueryTest(BaseTestCase):
             else:
                 return 0
 
-        with patch("nextcode.services.query.query.time.sleep"), patch(
+        with patch("nextcode.wait.time.sleep"), patch(
             "nextcode.services.query.query.time.time", mock_time
         ), patch(
             "nextcode.services.query.query.Query.running", new_callable=PropertyMock
         ) as mock_running:
             with self.assertRaises(QueryError):
                 mock_running.return_value = True
-                query.wait(max_seconds=1)
+                query.wait(max_seconds=1, strategy=PollingStrategy())
 
         time_count = 0
 
@@ -459,21 +644,132 @@ class QueryTest(BaseTestCase):
                 return False
             return True
 
-        with patch("nextcode.services.query.query.time.sleep"), patch(
+        with patch("nextcode.wait.time.sleep"), patch(
             "nextcode.services.query.query.time.time", mock_time
         ), patch(
             "nextcode.services.query.query.Query.running", new_callable=mock_running
         ):
             with self.assertRaises(QueryError):
-                query.wait(max_seconds=1)
+                query.wait(max_seconds=1, strategy=PollingStrategy())
 
         time_count = 0
         setattr(query, "status", "PENDING")
-        with patch("nextcode.services.query.query.time.sleep"), patch(
+        with patch("nextcode.wait.time.sleep"), patch(
             "nextcode.services.query.query.time.time", mock_time
         ):
             query.wait(max_seconds=1)
 
+    @responses.activate
+    def test_wait_strategies(self):
+        running = deepcopy(QUERY_RESPONSE)
+        running["status"] = "RUNNING"
+        url = QUERY_RESPONSE["links"]["self"]
+        statuses = []
+        done_after = 3
+
+        def status_callback(request):
+            # the query finishes after it has been asked for its status done_after times
+            statuses.append(request.params.get("wait"))
+            ret = QUERY_RESPONSE if len(statuses) > done_after else running
+            return 200, {}, json.dumps(ret)
+
+        responses.add_callback(responses.GET, url, callback=status_callback)
+
+        # polling is the default
+        query = Query(self.svc, running)
+        with patch("nextcode.wait.time.sleep") as sleep:
+            query.wait()
+        self.assertEqual("DONE", query.status)
+        self.assertEqual([None] * 4, statuses)
+        self.assertEqual(2, sleep.call_count)
+
+        # the server answers right away so we fall back to polling
+        statuses.clear()
+        query = Query(self.svc, running)
+        strategy = LongPollStrategy(seconds=5)
+        with patch("nextcode.wait.time.sleep") as sleep:
+            query.wait(strategy=strategy)
+        self.assertEqual("DONE", query.status)
+        self.assertFalse(strategy.supported)
+        self.assertEqual([None, None, "5", None], statuses)
+        self.assertEqual(2, sleep.call_count)
+
+        # the server holds the first request but answers the second one right away
+        # without a status change, so we back off before asking again
+        statuses.clear()
+        done_after = 4
+        query = Query(self.svc, running)
+        strategy = LongPollStrategy(seconds=5)
+        with patch("nextcode.wait.time") as mock_time:
+            mock_time.time.side_effect = [0, 5, 5, 5.2, 6, 6.1]
+            query.wait(strategy=strategy)
+        self.assertEqual("DONE", query.status)
+        self.assertTrue(strategy.supported)
+        self.assertEqual([None, None, "5", "5", "5"], statuses)
+        mock_time.sleep.assert_called_once()
+
+        # no event stream is available so we fall back to the next strategy
+        statuses.clear()
+        done_after = 3
+        query = Query(self.svc, running)
+        query.raw["links"]["status_events"] = url + "/events"
+        responses.add(responses.GET, url + "/events", json={})
+        strategy = EventStreamStrategy(fallback=PollingStrategy())
+        with patch("nextcode.wait.time.sleep") as sleep:
+            query.wait(strategy=strategy)
+        self.assertFalse(strategy.supported)
+        self.assertEqual("DONE", query.status)
+        self.assertEqual([None] * 4, statuses)
+        self.assertEqual(2, sleep.call_count)
+
+        # the event stream cannot be reached, so we poll and give up on it after
+        # repeated failures
+        statuses.clear()
+        done_after = 4
+        query = Query(self.svc, running)
+        query.raw["links"]["status_events"] = url + "/broken"
+        responses.add(responses.GET, url + "/broken", body=RequestsConnectionError("down"))
+        strategy = EventStreamStrategy(fallback=PollingStrategy(), max_failures=2)
+        with patch("nextcode.wait.time.sleep") as sleep:
+            query.wait(strategy=strategy)
+        self.assertFalse(strategy.supported)
+        self.assertEqual("DONE", query.status)
+        self.assertEqual(3, sleep.call_count)
+        broken = [c for c in responses.calls if c.request.url == url + "/broken"]
+        self.assertEqual(2, len(broken))
+
+        # the event stream closes without an event, so we wait before checking again
+        statuses.clear()
+        done_after = 3
+        query = Query(self.svc, running)
+        query.raw["links"]["status_events"] = url + "/empty"
+        responses.add(
+            responses.GET, url + "/empty", body="", content_type="text/event-stream"
+        )
+        strategy = EventStreamStrategy(fallback=PollingStrategy())
+        with patch("nextcode.wait.time.sleep") as sleep:
+            query.wait(strategy=strategy)
+        self.assertTrue(strategy.supported)
+        self.assertEqual("DONE", query.status)
+        self.assertEqual(2, sleep.call_count)
+
+        # an event arrives so the status is checked right away
+        statuses.clear()
+        query = Query(self.svc, running)
+        query.raw["links"]["status_events"] = url + "/stream"
+        responses.add(
+            responses.GET,
+            url + "/stream",
+            body='data: {"status": "DONE"}\n\n',
+            content_type="text/event-stream",
+        )
+        strategy = EventStreamStrategy(fallback=PollingStrategy())
+        with patch("nextcode.wait.time.sleep") as sleep:
+            query.wait(strategy=strategy)
+        self.assertTrue(strategy.supported)
+        self.assertEqual("DONE", query.status)
+        sleep.assert_not_called()
+
     @responses.activate
     def test_cancel(self):
         responses.add(
@@ -505,13 +801,183 @@ class QueryTest(BaseTestCase):
                 query.dataframe()
             self.assertIn("Pandas library is not installed", str(ctx.exception))
 
-        def mock_get_results(**kw):
-            return []
-
-        setattr(query, "get_results", mock_get_results)
+        query.line_count = 0
         df = query.dataframe()
         self.assertEqual([], df.index.to_list())
 
+    @responses.activate
+    @skipUnless(PANDAS_INSTALLED, "pandas library is not installed")
+    def test_dataframe_tsv_pages(self):
+        responses.add(
+            responses.GET, QUERY_RESPONSE["links"]["self"], json=QUERY_RESPONSE
+        )
+        query = self.svc.get_query(QUERY_RESPONSE["query_id"])
+        query.line_count = 3
+
+        def result_callback(request):
+            payload = json.loads(request.body)
+            offset, limit = payload["offset"], payload["limit"]
+            rows = "".join(f"chr1\t{i}\n" for i in range(offset, offset + limit))
+            header = "" if payload["skipheader"] else "Chrom\tPos\n"
+            return 200, {}, header + rows
+
+        responses.add_callback(
+            responses.GET, QUERY_RESPONSE["links"]["result"], callback=result_callback
+        )
+        with patch("nextcode.services.query.query.RESULTS_PAGE_SIZE", 2):
+            df = query.dataframe(dtype={"Chrom": "category"})
+        self.assertEqual(["Chrom", "Pos"], df.columns.to_list())
+        self.assertEqual([0, 1, 2], df["Pos"].to_list())
+        self.assertEqual("category", str(df["Chrom"].dtype))
+
+    @responses.activate
+    @skipUnless(PYARROW_INSTALLED, "pyarrow library is not installed")
+    def test_arrow(self):
+        responses.add(
+            responses.GET, QUERY_RESPONSE["links"]["self"], json=QUERY_RESPONSE
+        )
+        query = self.svc.get_query(QUERY_RESPONSE["query_id"])
+        query.line_count = 2
+        responses.add(
+            responses.GET,
+            QUERY_RESPONSE["links"]["result"],
+            body="Chrom\tPos\nchr1\t1\nchr1\t2\n",
+        )
+        table = query.to_arrow()
+        self.assertEqual(["Chrom", "Pos"], table.column_names)
+        self.assertEqual(2, table.num_rows)
+        with tempfile.TemporaryDirectory() as tmp:
+            filename = query.to_parquet(os.path.join(tmp, "out.parquet"))
+            self.assertEqual(table, pq.read_table(filename))
+
+        query.line_count = 0
+        self.assertEqual(0, query.to_arrow().num_rows)
+
+        responses.replace(
+            responses.GET, QUERY_RESPONSE["links"]["result"], body="Chrom\tPos\n"
+        )
+        query.line_count = 2
+        table = query.to_arrow()
+        self.assertEqual(["Chrom", "Pos"], table.column_names)
+        self.assertEqual(0, table.num_rows)
+
+    @responses.activate
+    @skipUnless(PYARROW_INSTALLED, "pyarrow library is not installed")
+    def test_arrow_type_change(self):
+        import pyarrow as pa
+
+        responses.add(
+            responses.GET, QUERY_RESPONSE["links"]["self"], json=QUERY_RESPONSE
+        )
+        query = self.svc.get_query(QUERY_RESPONSE["query_id"])
+        # the Ref column only turns non-numeric well after the first block of the stream
+        rows = [f"chr1\t{i}\t{i % 10}\t{i / 2}" for i in range(100000)]
+        rows.append("chr1\t100000\tA\t")
+        tsv = "\n".join(["Chrom\tPos\tRef\tScore"] + rows) + "\n"
+        query.line_count = len(rows)
+        responses.add(responses.GET, QUERY_RESPONSE["links"]["result"], body=tsv)
+
+        table = query.to_arrow()
+        self.assertEqual(len(rows), table.num_rows)
+        self.assertEqual(
+            [pa.string(), pa.int64(), pa.string(), pa.float64()],
+            [field.type for field in table.schema],
+        )
+        self.assertEqual("A", table["Ref"][-1].as_py())
+        self.assertIsNone(table["Score"][-1].as_py())
+
+        table = query.to_arrow(column_types={"Pos": pa.int32()})
+        self.assertEqual(pa.int32(), table.schema.field("Pos").type)
+
+        with tempfile.TemporaryDirectory() as tmp:
+            filename = query.to_parquet(os.path.join(tmp, "out.parquet"))
+            self.assertEqual(query.to_arrow(), pq.read_table(filename))
+            self.assertEqual([filename], [str(p) for p in Path(tmp).iterdir()])
+
+    @responses.activate
+    @skipUnless(PANDAS_INSTALLED, "pandas library is not installed")
+    def test_result_cache(self):
+        cache = self.svc.enable_cache()
+        tsv = "Chrom\tPos\nchr1\t1\nchr1\t2\n"
+        ret = deepcopy(QUERY_RESPONSE)
+        ret["line_count"] = 2
+        responses.add(responses.POST, QUERIES_URL, json=ret)
+
+        def result_callback(request):
+            if request.headers["Accept"] == "application/json+compact":
+                return 200, {}, json.dumps({"header": ["Chrom", "Pos"], "data": [["chr1", 1]]})
+            return 200, {}, tsv
+
+        responses.add_callback(
+            responses.GET, QUERY_RESPONSE["links"]["result"], callback=result_callback
+        )
+
+        query = self.svc.execute("gor #dbsnp#;")
+        self.assertIsNotNone(query.cache_key)
+        self.assertEqual(tsv, query.get_results(is_json=False))
+        self.assertEqual({"hits": 0, "misses": 1}, {k: cache.stats[k] for k in ("hits", "misses")})
+
+        query = self.svc.execute("  gor #dbsnp#\n")
+        self.assertEqual(1, cache.hits)
+        self.assertEqual("DONE", query.status)
+        responses.calls.reset()
+        df = query.dataframe()
+        self.assertEqual([1, 2], df["Pos"].to_list())
+        self.assertEqual("Chrom\tPos\nchr1\t1\n", query.get_results(is_json=False, limit=1))
+        filename = os.path.join(self.temp_dir, "out.tsv")
+        query.download_results(filename)
+        with open(filename) as f:
+            self.assertEqual(tsv, f.read())
+        self.assertEqual(0, len(responses.calls))
+
+        # json results are not cached so the query is run again to get fresh result links
+        self.assertEqual([["chr1", 1]], query.get_results()["data"])
+        self.assertEqual(
+            ["POST", "GET"], [call.request.method for call in responses.calls]
+        )
+        responses.calls.reset()
+        self.assertEqual([["chr1", 1]], query.get_results()["data"])
+        self.assertEqual([[["chr1", 1]]], list(query.iter_batches()))
+        self.assertEqual([["chr1", 1]], list(query.iter_rows()))
+        self.assertEqual(["Chrom", "Pos"], query.result_header)
+        self.assertEqual(0, len(responses.calls))
+
+        # the same project on another server has its own results
+        self.assertNotEqual(
+            cache.make_key("https://a/api/query", "p", "gor x", [], "1"),
+            cache.make_key("https://b/api/query", "p", "gor x", [], "1"),
+        )
+
+        # different virtual relations and persisted queries go to the server
+        self.svc.execute("gor #dbsnp#;", name="data")
+        self.svc.execute("gor #dbsnp#;", persist="user_data/out.tsv")
+        self.assertEqual(2, len(responses.calls))
+
+        # clearing the config cache leaves the cached results alone
+        config.clear_cache()
+        self.assertEqual(config.root_config_folder.joinpath("results"), cache.folder)
+        self.assertTrue(cache.size() > 0)
+
+        self.svc.disable_cache()
+        self.assertIsNone(self.svc.execute("gor #dbsnp#;").cache_key)
+
+    def test_result_cache_eviction(self):
+        cache = ResultCache(max_bytes=200, ttl=60)
+        self.assertEqual("gor x\n| top 1", normalize_query(" gor x\n\n   | top 1;\n"))
+        for key in ("a", "b", "c"):
+            cache.put(key, {"query_id": key})
+            with cache.writer(key, "tsv") as f:
+                f.write(os.urandom(50))
+        self.assertLessEqual(cache.size(), 200)
+        self.assertIsNone(cache.get("a"))
+        self.assertEqual({"query_id": "c"}, cache.get("c"))
+
+        cache.ttl = -1
+        self.assertIsNone(cache.get("c"))
+        self.assertIsNone(cache.open("c", "tsv"))
+        cache.clear()
+        self.assertEqual(0, cache.size())
+
     @responses.activate
     def test_wakeup(self):
         responses.add(responses.POST, WAKEUP_URL, json={"success": True})
@@ -543,3 +1009,86 @@ class QueryTest(BaseTestCase):
         filename = "/tmp/out.tsv"
         responses.add(responses.GET, QUERY_RESPONSE["links"]["streamresults"], json={})
         _ = query.download_results(filename)
+
+    @responses.activate
+    def test_download_results_resumable(self):
+        responses.add(
+            responses.GET, QUERY_RESPONSE["links"]["self"], json=QUERY_RESPONSE
+        )
+        query = self.svc.get_query(QUERY_RESPONSE["query_id"])
+        query.line_count = 5
+        expected = "col\n" + "".join(f"row{i}\n" for i in range(5))
+        requests_made = []
+        fail = {"drop": True, "error": False}
+
+        def result_callback(request):
+            payload = json.loads(request.body)
+            offset, limit = payload["offset"], payload["limit"]
+            requests_made.append((offset, limit))
+            if fail["error"]:
+                raise ConnectionError("connection dropped")
+            header = "" if payload["skipheader"] else "col\n"
+            body = header + "".join(f"row{i}\n" for i in range(offset, offset + limit))
+            if fail["drop"] and offset == 0:
+                # connection drops in the middle of the second row of the range
+                fail["drop"] = False
+                body = body[: len("col\nrow0\nro")]
+            return 200, {}, body
+
+        responses.add_callback(
+            responses.GET, QUERY_RESPONSE["links"]["result"], callback=result_callback
+        )
+        filename = os.path.join(self.temp_dir, "out.tsv")
+        with patch("nextcode.services.query.query.RESULTS_PAGE_SIZE", 3):
+            query.download_results(filename, max_workers=2)
+            with open(filename) as f:
+                self.assertEqual(expected, f.read())
+            self.assertIn((1, 2), requests_made)
+            self.assertFalse(os.path.exists(filename + ".progress"))
+
+            # progress survives a failed download and the next call resumes from it
+            fail["drop"] = True
+            fail["error"] = True
+            with self.assertRaises(Exception):
+                query.download_results(filename, resumable=True)
+            with open(filename + ".progress") as f:
+                self.assertEqual(5, json.load(f)["line_count"])
+            fail["error"] = False
+            requests_made.clear()
+            query.download_results(filename, resumable=True)
+            with open(filename) as f:
+                self.assertEqual(expected, f.read())
+
+            # the header is written for empty results
+            query.line_count = 0
+            fail["drop"] = False
+            query.download_results(filename, resumable=True)
+            with open(filename) as f:
+                self.assertEqual("col\n", f.read())
+            self.assertEqual([], [p for p in os.listdir(self.temp_dir) if ".part" in p])
+
+    @responses.activate
+    def test_download_results_progress(self):
+        responses.add(
+            responses.GET, QUERY_RESPONSE["links"]["self"], json=QUERY_RESPONSE
+        )
+        query = self.svc.get_query(QUERY_RESPONSE["query_id"])
+        query.line_count = 5
+        body = "col\n" + "".join(f"row{i}\n" for i in range(5))
+        responses.add(responses.GET, QUERY_RESPONSE["links"]["result"], body=body)
+        filename = os.path.join(self.temp_dir, "out.tsv")
+        saved_rows = []
+
+        def callback(num_lines):
+            # progress is saved while the range is being written, not only once it ends
+            if os.path.exists(filename + ".progress"):
+                with open(filename + ".progress") as f:
+                    saved_rows.append(json.load(f)["ranges"]["0"]["rows"])
+
+        with patch("nextcode.services.query.query.DOWNLOAD_CHUNK_SIZE", 5), patch(
+            "nextcode.services.query.query.DOWNLOAD_PROGRESS_BYTES", 1
+        ):
+            query.download_results(filename, callback=callback, resumable=True)
+        with open(filename) as f:
+            self.assertEqual(body, f.read())
+        self.assertTrue(any(0 < rows < 5 for rows in saved_rows), saved_rows)
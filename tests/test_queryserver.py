@@ -1,5 +1,7 @@
 import os
 import json
+import time
+import tempfile
 import responses
 from pathlib import Path
 from unittest import skipUnless
@@ -21,6 +23,11 @@ try:
     PANDAS_INSTALLED = True
 except ModuleNotFoundError:
     PANDAS_INSTALLED = False
+try:
+    import pyarrow.parquet as pq
+    PYARROW_INSTALLED = True
+except ModuleNotFoundError:
+    PYARROW_INSTALLED = False
 
 ROOT_URL = "https://test.wuxinextcode.com/queryserver"
 QUERIES_URL = ROOT_URL + "/query/"
@@ -107,6 +114,36 @@ class QueryServerTest(BaseTestCase):
         self.assertEqual(59, result.num_bytes)
         self.assertEqual(ret, result_text)
 
+    @responses.activate
+    def test_iter_line_batches(self):
+        ret = '#> ALIVE\nChrom\tpos\n\nchr1\t1\n#> PROGRESS 50\nchr1\t2\nchr1\t3'
+        responses.add(responses.POST, QUERIES_URL, body=ret)
+        result = self.svc.execute("gor x")
+        lines = sum(result.iter_line_batches(), [])
+        self.assertEqual(['Chrom\tpos', 'chr1\t1', 'chr1\t2', 'chr1\t3'], lines)
+        self.assertEqual(3, result.num_lines)
+        self.assertEqual(len(''.join(lines)), result.num_bytes)
+
+        result = self.svc.execute("gor x")
+        self.assertEqual(['Chrom\tpos', 'chr1\t1'], list(result.iter_lines(limit=1)))
+        self.assertFalse(result.open)
+
+        ret = 'Chrom\tpos\nchr1\t1\n#> EXCEPTION {"errorType":"GorException", "gorMessage":"Failed"}\n'
+        responses.upsert(responses.POST, QUERIES_URL, body=ret)
+        result = self.svc.execute("gor x")
+        with self.assertRaisesRegex(ServerError, "Failed"):
+            list(result.iter_line_batches())
+
+    @responses.activate
+    def test_adaptive_chunks(self):
+        ret = 'Chrom\tpos\n' + ''.join(f'chr1\t{i}\n' for i in range(100000))
+        responses.add(responses.POST, QUERIES_URL, body=ret)
+        result = self.svc.execute("gor x")
+        sizes = [len(c) for c in result.iter_chunks_unzip()]
+        self.assertEqual(len(ret), sum(sizes))
+        self.assertEqual(result.ITER_CHUNK_SIZE, sizes[0])
+        self.assertGreater(max(sizes), result.ITER_CHUNK_SIZE)
+
     @responses.activate
     @skipUnless(PANDAS_INSTALLED, "pandas library is not installed")
     def test_dataframe(self):
@@ -123,6 +160,22 @@ class QueryServerTest(BaseTestCase):
                 result.dataframe()
             self.assertIn("Pandas library is not installed", str(ctx.exception))
 
+    @responses.activate
+    @skipUnless(PYARROW_INSTALLED, "pyarrow library is not installed")
+    def test_arrow(self):
+        ret = '#> ALIVE\nChrom\tpos\nchr1\t1\nchr1\t2\n'
+        responses.add(responses.POST, QUERIES_URL, body=ret)
+        table = self.svc.execute("gor x").to_arrow()
+        self.assertEqual(['Chrom', 'pos'], table.column_names)
+        self.assertEqual([1, 2], table.column('pos').to_pylist())
+
+        with tempfile.TemporaryDirectory() as tmp:
+            filename = self.svc.execute("gor x").to_parquet(os.path.join(tmp, 'out.parquet'), limit=1)
+            self.assertEqual([{'Chrom': 'chr1', 'pos': 1}], pq.read_table(filename).to_pylist())
+
+        responses.upsert(responses.POST, QUERIES_URL, body='')
+        self.assertEqual(0, self.svc.execute("gor x").to_arrow().num_rows)
+
     @responses.activate
     def test_server_error(self):
         ret = '#> EXCEPTION {"errorType":"GorException", "gorMessage":"Error"}'
@@ -178,5 +231,44 @@ class QueryServerTest(BaseTestCase):
         with self.assertRaises(MissingRelations):
             self.svc.execute("gor [some:relation]", name="file")
 
+    @responses.activate
+    @skipUnless(PANDAS_INSTALLED, "pandas library is not installed")
+    def test_large_result(self):
+        num_rows = 10000
+        body = 'Chrom\tPos\n' + ''.join(f'chr1\t{i}\n' for i in range(num_rows))
+        responses.add(responses.POST, QUERIES_URL, body=body)
+        text = self.svc.execute("gor x").lines()
+        df = self.svc.execute("gor x").dataframe()
+        self.assertEqual(num_rows + 1, text.count('\n') + 1)
+        self.assertEqual(num_rows, len(df.index))
+        self.assertEqual(num_rows - 1, df["Pos"].iloc[-1])
+
+    @responses.activate
+    @skipUnless(PANDAS_INSTALLED, "pandas library is not installed")
+    @skipUnless(
+        os.environ.get("NEXTCODE_BENCHMARK_ROWS"),
+        "set NEXTCODE_BENCHMARK_ROWS, e.g. to 5000000, to benchmark result scaling",
+    )
+    def test_result_scaling(self):
+        max_rows = int(os.environ["NEXTCODE_BENCHMARK_ROWS"])
+        timings = {}
+        num_rows = 10000
+        while num_rows <= max_rows:
+            body = 'Chrom\tPos\n' + ''.join(f'chr1\t{i}\n' for i in range(num_rows))
+            responses.upsert(responses.POST, QUERIES_URL, body=body)
+            st = time.time()
+            text = self.svc.execute("gor x").lines()
+            df = self.svc.execute("gor x").dataframe()
+            timings[num_rows] = time.time() - st
+            self.assertEqual(num_rows + 1, text.count('\n') + 1)
+            self.assertEqual(num_rows, len(df.index))
+            num_rows *= 10
+
+        # linear scaling takes ~10x longer for 10x more rows, quadratic ~100x
+        smallest = min(timings)
+        for num_rows, timing in timings.items():
+            factor = num_rows / smallest
+            self.assertLess(timing, max(timings[smallest], 0.01) * factor * 4)
+
     def test_log_download_progress(self):
         _log_download_progress(1000, 2, 3, 4, 5, 6)
@@ -1,4 +1,6 @@
-from nextcode.utils import host_from_url
+import time
+
+from nextcode.utils import host_from_url, map_ordered
 from tests import BaseTestCase
 
 
@@ -35,3 +37,19 @@ class UtilsTest(BaseTestCase):
         url = "http://localhost:8080"
         ret = host_from_url(url)
         self.assertEqual(ret, url + "/")
+
+    def test_map_ordered(self):
+        def slow_square(i):
+            time.sleep(0.01 * (5 - i))
+            return i * i
+
+        items = range(5)
+        expected = [i * i for i in items]
+        self.assertEqual(expected, list(map_ordered(slow_square, items)))
+        self.assertEqual(expected, list(map_ordered(slow_square, items, max_workers=3)))
+
+        def fail(i):
+            raise ValueError(i)
+
+        with self.assertRaises(ValueError):
+            list(map_ordered(fail, items, max_workers=2))